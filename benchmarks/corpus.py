@@ -0,0 +1,121 @@
+"""
+Generates synthetic Python corpora for the docstring benchmarks.
+"""
+
+import os
+import random
+
+_STATEMENTS = [
+    "total = sum([{args}])",
+    "values = [{arg} * i for i in range(10)]",
+    "if {arg} is None:\n    raise ValueError('{arg} is required')",
+    "for item in range(len(str({arg}))):\n    total += item",
+    "result = {{'{arg}': {arg}}}",
+    "while {arg} and total < 100:\n    total += 1",
+    "try:\n    value = int({arg})\nexcept (TypeError, ValueError):\n    value = 0",
+]
+
+
+def generate_corpus(
+    root: str,
+    *,
+    n_files: int,
+    n_functions: int,
+    documented: float = 0.25,
+    nesting: float = 0.2,
+    seed: int = 0,
+) -> int:
+    """
+    Writes `n_files` Python modules of `n_functions` functions each below `root`,
+    spread over a few sub-packages. Some functions are methods of classes or are
+    nested in other functions, and some already have docstrings.
+
+    Args:
+        root (str): The directory to write the corpus to.
+        n_files (int): The number of modules.
+        n_functions (int): The number of functions per module, nested ones included.
+        documented (float, optional): Fraction of functions that get a docstring.
+        nesting (float, optional): Fraction of functions nested in a class or function.
+        seed (int, optional): Seeds the generator so corpora are reproducible.
+
+    Returns:
+        int: The number of functions without a docstring.
+    """
+    rng = random.Random(seed)
+    undocumented = 0
+    for i in range(n_files):
+        directory = os.path.join(root, f"package_{i % 4}")
+        os.makedirs(directory, exist_ok=True)
+        lines: list[str] = []
+        j = 0
+        while j < n_functions:
+            nested = j + 1 < n_functions and rng.random() < nesting
+            n_docs = 0
+            if nested and rng.random() < 0.5:
+                lines.append(f"class Model{j}:")
+                for k in range(2):
+                    n_docs += _function(
+                        lines, rng, f"method_{j}_{k}", 1, documented, method=True
+                    )
+            elif nested:
+                n_docs += _function(lines, rng, f"outer_{j}", 0, documented, inner=True)
+            else:
+                n_docs += _function(lines, rng, f"function_{j}", 0, documented)
+            j += 2 if nested else 1
+            undocumented += (2 if nested else 1) - n_docs
+            lines.append("")
+
+        with open(os.path.join(directory, f"module_{i}.py"), "w") as f:
+            f.write("\n".join(lines))
+
+    return undocumented
+
+
+def _function(
+    lines: list[str],
+    rng: random.Random,
+    name: str,
+    depth: int,
+    documented: float,
+    *,
+    method: bool = False,
+    inner: bool = False,
+) -> int:
+    """
+    Appends a function with a random signature and body to `lines`.
+
+    Args:
+        lines (list[str]): The lines of the module being generated.
+        rng (random.Random): The random number generator.
+        name (str): The function name.
+        depth (int): The indentation level of the `def`.
+        documented (float): Probability of adding a docstring.
+        method (bool, optional): Generate a method taking `self`.
+        inner (bool, optional): Nest another function inside this one.
+
+    Returns:
+        int: The number of generated functions that have a docstring.
+    """
+    indent = "    " * depth
+    args = [f"arg{k}" for k in range(rng.randint(1, 4))]
+    if method:
+        args.insert(0, "self")
+    lines.append(f"{indent}def {name}({', '.join(args)}):")
+
+    n_docs = 0
+    if rng.random() < documented:
+        lines.append(f'{indent}    """Existing docstring of {name}."""')
+        n_docs += 1
+
+    lines.append(f"{indent}    total = 0")
+    for _ in range(rng.randint(1, 6)):
+        statement = rng.choice(_STATEMENTS).format(
+            arg=rng.choice(args[1:] if method else args),
+            args=", ".join(f"len(str({a}))" for a in args),
+        )
+        lines.extend(f"{indent}    {line}" for line in statement.splitlines())
+    if inner:
+        n_docs += _function(lines, rng, f"inner_{name}", depth + 1, documented)
+    lines.append(f"{indent}    return total")
+    lines.append("")
+    return n_docs
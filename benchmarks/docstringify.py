@@ -0,0 +1,283 @@
+"""
+End-to-end throughput benchmark of `docstringify` against a local fake API.
+
+Run from the repository root, e.g.
+
+    python -m benchmarks.docstringify --files 200 --latency 0.05 --save base.json
+    python -m benchmarks.docstringify --files 200 --latency 0.05 --baseline base.json
+
+The second run fails if any metric regressed by more than `--threshold`.
+"""
+
+import contextlib
+import io
+import json
+import os
+import resource
+import statistics
+import sys
+import tempfile
+import time
+
+import click
+from rich import print
+from rich.table import Table
+
+from benchmarks.corpus import generate_corpus
+from benchmarks.fake_openai import FakeOpenAIServer
+from devtools import config
+from devtools.docstringer import DocStringWriter
+from devtools.lang_processor.python import PythonProcessor
+from devtools.llm.client_interface import IClient
+from devtools.llm.openai_client import OpenAIClient
+from devtools.llm.rate_limited_client import RateLimitedClient
+from devtools.metrics import collector
+from devtools.pipeline import DocStringPipeline
+
+# Metrics compared against a baseline and whether larger values are better.
+METRICS = {
+    "files_per_s": True,
+    "functions_per_s": True,
+    "p50_ms": False,
+    "p99_ms": False,
+    "peak_rss_mb": False,
+    "prompt_tokens_per_function": False,
+}
+
+
+class TimingClient(IClient):
+    def __init__(self, client: IClient):
+        """
+        Records the latency of every request made through `client`, retries included.
+
+        Args:
+            client (IClient): The client to wrap.
+        """
+        self.client = client
+        self.latencies: list[float] = []
+
+    def send_prompt(self, prompt: str, **kwargs) -> str:
+        """
+        Sends a prompt through the wrapped client and records its latency.
+
+        Args:
+            prompt (str): The prompt message to be sent.
+            **kwargs: Passed through to the wrapped client.
+
+        Returns:
+            str: String with the response to the prompt.
+        """
+        start = time.perf_counter()
+        try:
+            return self.client.send_prompt(prompt, **kwargs)
+        finally:
+            self.latencies.append(time.perf_counter() - start)
+
+    async def send_prompt_async(self, prompt: str, **kwargs) -> str:
+        """
+        Async counterpart of `send_prompt`.
+
+        Args:
+            prompt (str): The prompt message to be sent.
+            **kwargs: Passed through to the wrapped client.
+
+        Returns:
+            str: String with the response to the prompt.
+        """
+        start = time.perf_counter()
+        try:
+            return await self.client.send_prompt_async(prompt, **kwargs)
+        finally:
+            self.latencies.append(time.perf_counter() - start)
+
+
+def run_benchmark(
+    *,
+    files: int = 50,
+    functions: int = 20,
+    latency: float = 0.02,
+    latency_sigma: float = 0.5,
+    error_rate: float = 0.0,
+    requests_per_minute: int | None = None,
+    concurrency: int = config.MAX_CONCURRENCY,
+    batch_tokens: int = 0,
+    prompt_body_lines: int = config.PROMPT_BODY_LINES,
+    jobs: int = 1,
+    seed: int = 0,
+) -> dict:
+    """
+    Docstringifies a synthetic corpus against a fake API and measures the run.
+
+    Args:
+        files (int, optional): The number of modules in the corpus.
+        functions (int, optional): The number of functions per module.
+        latency (float, optional): Median latency of the fake API in seconds.
+        latency_sigma (float, optional): Spread of the log-normal latency.
+        error_rate (float, optional): Fraction of requests failing with a 500.
+        requests_per_minute (int, optional): Request quota of the fake API.
+        concurrency (int, optional): Maximum number of requests in flight.
+        batch_tokens (int, optional): Token budget of multi-function requests.
+        prompt_body_lines (int, optional): Compaction threshold of function bodies.
+        jobs (int, optional): Worker processes; above 1 runs the pipeline.
+        seed (int, optional): Seeds the corpus and the fake API.
+
+    Returns:
+        dict: The benchmark parameters and measured metrics.
+    """
+    params = {k: v for k, v in locals().items()}
+    with tempfile.TemporaryDirectory() as root, FakeOpenAIServer(
+        latency=latency,
+        latency_sigma=latency_sigma,
+        error_rate=error_rate,
+        requests_per_minute=requests_per_minute,
+        seed=seed,
+    ) as server:
+        n_undocumented = generate_corpus(
+            root, n_files=files, n_functions=functions, seed=seed
+        )
+        client = TimingClient(
+            RateLimitedClient(
+                OpenAIClient(
+                    auth={"api_key": "benchmark"},
+                    config={"base_url": server.url, "max_retries": 0},
+                ),
+                max_concurrency=concurrency,
+                base_delay=0.01,
+            )
+        )
+        writer = DocStringWriter(
+            client,
+            PythonProcessor(prompt_body_lines=prompt_body_lines),
+            max_concurrency=concurrency,
+            batch_token_budget=batch_tokens,
+        )
+
+        collector.reset()
+        start = time.perf_counter()
+        with contextlib.redirect_stdout(io.StringIO()):
+            if jobs > 1:
+                _, n_insertions = DocStringPipeline(writer, jobs=jobs).run(root)
+            else:
+                _, n_insertions = writer.docstringify(root)
+        seconds = time.perf_counter() - start
+
+    latencies = sorted(client.latencies) or [0.0]
+    counters = collector.summary()["counters"]
+    return {
+        **params,
+        "seconds": seconds,
+        "insertions": n_insertions,
+        "expected_insertions": n_undocumented,
+        "requests": len(server.requests),
+        "files_per_s": files / seconds,
+        "functions_per_s": n_insertions / seconds,
+        "p50_ms": 1000 * statistics.median(latencies),
+        "p99_ms": 1000 * latencies[min(len(latencies) - 1, int(0.99 * len(latencies)))],
+        "peak_rss_mb": peak_rss_mb(),
+        "prompt_tokens_per_function": counters.get("prompt_tokens", 0)
+        / max(n_insertions, 1),
+    }
+
+
+def peak_rss_mb() -> float:
+    """
+    Returns the peak resident set size of this process and its finished children.
+
+    Returns:
+        float: The peak RSS in MiB.
+    """
+    # ru_maxrss is in KiB on Linux but in bytes on macOS.
+    unit = 1 if sys.platform == "darwin" else 1024
+    peak = max(
+        resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+        resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss,
+    )
+    return peak * unit / 2**20
+
+
+def compare(results: dict, baseline: dict, threshold: float) -> list[tuple]:
+    """
+    Compares the metrics of a run against a baseline run.
+
+    Args:
+        results (dict): The metrics of the current run.
+        baseline (dict): The metrics of the baseline run.
+        threshold (float): Relative change that counts as a regression, e.g. 0.1.
+
+    Returns:
+        list[tuple]: Per metric, the name, baseline value, current value, relative
+            change and whether it regressed beyond the threshold.
+    """
+    rows = []
+    for metric, higher_is_better in METRICS.items():
+        if metric not in baseline or metric not in results:
+            continue
+        before, after = baseline[metric], results[metric]
+        change = (after - before) / before if before else 0.0
+        worse = -change if higher_is_better else change
+        rows.append((metric, before, after, change, worse > threshold))
+    return rows
+
+
+@click.command()
+@click.option("--files", type=int, default=50, show_default=True)
+@click.option("--functions", type=int, default=20, show_default=True)
+@click.option("--latency", type=float, default=0.02, show_default=True)
+@click.option("--latency-sigma", type=float, default=0.5, show_default=True)
+@click.option("--error-rate", type=float, default=0.0, show_default=True)
+@click.option("--requests-per-minute", type=int)
+@click.option("--concurrency", type=int, default=config.MAX_CONCURRENCY)
+@click.option("--batch-tokens", type=int, default=0, show_default=True)
+@click.option(
+    "--prompt-body-lines",
+    type=int,
+    default=config.PROMPT_BODY_LINES,
+    show_default=True,
+)
+@click.option("--jobs", "-j", type=int, default=1, show_default=True)
+@click.option("--seed", type=int, default=0, show_default=True)
+@click.option("--save", help="Write the results to this JSON file.")
+@click.option("--baseline", help="Compare against the results in this JSON file.")
+@click.option(
+    "--threshold",
+    type=float,
+    default=0.1,
+    show_default=True,
+    help="Relative change of a metric that fails the comparison.",
+)
+def main(save: str | None, baseline: str | None, threshold: float, **kwargs) -> None:
+    """
+    Benchmark docstringify end to end against a local fake API.
+    """
+    results = run_benchmark(**kwargs)
+    print(
+        f"{results['files']} files, {results['insertions']} docstrings "
+        f"in {results['seconds']:.2f}s"
+    )
+
+    table = Table("metric", "value")
+    for metric in METRICS:
+        table.add_row(metric, f"{results[metric]:.2f}")
+    regressed = []
+    if baseline:
+        with open(baseline, "r") as f:
+            rows = compare(results, json.load(f), threshold)
+        table = Table("metric", "baseline", "current", "change")
+        for metric, before, after, change, worse in rows:
+            style = "red" if worse else ""
+            table.add_row(
+                metric, f"{before:.2f}", f"{after:.2f}", f"{change:+.1%}", style=style
+            )
+        regressed = [row[0] for row in rows if row[4]]
+    print(table)
+
+    if save:
+        os.makedirs(os.path.dirname(os.path.abspath(save)), exist_ok=True)
+        with open(save, "w") as f:
+            json.dump(results, f, indent=2)
+    if regressed:
+        raise click.ClickException(f"Regressed: {', '.join(regressed)}")
+
+
+if __name__ == "__main__":
+    main()
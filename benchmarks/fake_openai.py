@@ -0,0 +1,326 @@
+import json
+import math
+import random
+import threading
+import time
+from email.message import Message
+from email.parser import BytesParser
+from email.policy import default
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, cast
+
+
+class FakeOpenAIServer:
+    def __init__(
+        self,
+        *,
+        response: str = '"""Generated docstring."""',
+        latency: float = 0.0,
+        latency_sigma: float = 0.0,
+        error_rate: float = 0.0,
+        requests_per_minute: int | None = None,
+        seed: int | None = None,
+    ):
+        """
+        A local stand-in for the OpenAI chat completions endpoint and the files and
+        batches endpoints of the Batch API.
+
+        Use it as a context manager and point a client at `url`. Failures queued in
+        `failures` are returned, in order, before requests succeed again. Batches
+        complete as soon as they are created; set `batch_status` to keep new ones
+        pending.
+
+        Args:
+            response (str, optional): The completion content of successful requests.
+            latency (float, optional): Median seconds a request takes.
+            latency_sigma (float, optional): Spread of the log-normal latency
+                distribution; 0 makes every request take exactly `latency`.
+            error_rate (float, optional): Probability of a random 500 response.
+            requests_per_minute (int, optional): Quota per one-minute window; requests
+                beyond it get a 429 with retry-after and `x-ratelimit-*` headers.
+            seed (int, optional): Seeds latencies and errors for reproducible runs.
+        """
+        self.response = response
+        self.latency = latency
+        self.latency_sigma = latency_sigma
+        self.error_rate = error_rate
+        self.requests_per_minute = requests_per_minute
+        self._random = random.Random(seed)
+        self._window = (0.0, 0)
+        self.failures: list[tuple[int, dict[str, str]]] = []
+        self.headers: dict[str, str] = {}
+        self.requests: list[dict] = []
+        self.connections = 0
+        self.files: dict[str, bytes] = {}
+        self.batches: dict[str, dict] = {}
+        self.batch_status = "completed"
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer(("127.0.0.1", 0), self._handler())
+        self._thread = threading.Thread(
+            target=self._server.serve_forever, args=(0.05,), daemon=True
+        )
+
+    @property
+    def url(self) -> str:
+        """
+        str: The base URL to configure clients with.
+        """
+        return f"http://127.0.0.1:{self._server.server_address[1]}/v1"
+
+    def __enter__(self) -> "FakeOpenAIServer":
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self._server.shutdown()
+        self._server.server_close()
+
+    def fail(self, status: int, n: int = 1, **headers: str) -> None:
+        """
+        Queues `n` failed responses.
+
+        Args:
+            status (int): The HTTP status of the failures.
+            n (int, optional): How many requests should fail.
+            **headers (str): Response headers, with underscores for dashes.
+        """
+        headers = {k.replace("_", "-"): v for k, v in headers.items()}
+        self.failures.extend([(status, headers)] * n)
+
+    def handle(self, body: dict) -> tuple[int, dict[str, str], dict]:
+        """
+        Produces the response to a chat completion request.
+
+        Args:
+            body (dict): The JSON request body.
+
+        Returns:
+            tuple[int, dict[str, str], dict]: The status, headers and JSON body.
+        """
+        with self._lock:
+            self.requests.append(body)
+            failure = self.failures.pop(0) if self.failures else None
+            if failure is None:
+                failure = self._throttle()
+            if failure is None and self._random.random() < self.error_rate:
+                failure = (500, {})
+            delay = self.latency * math.exp(self._random.gauss(0, self.latency_sigma))
+
+        time.sleep(delay)
+        if failure is not None:
+            status, headers = failure
+            error = {"message": f"fake failure {status}", "type": "fake", "code": None}
+            return status, headers, {"error": error}
+
+        return 200, self.headers, completion(body, self.response)
+
+    def upload(self, content: bytes, purpose: str) -> dict:
+        """
+        Stores an uploaded file.
+
+        Args:
+            content (bytes): The content of the file.
+            purpose (str): The purpose of the upload.
+
+        Returns:
+            dict: The file object.
+        """
+        with self._lock:
+            file_id = f"file-{len(self.files)}"
+            self.files[file_id] = content
+        return {
+            "id": file_id,
+            "object": "file",
+            "bytes": len(content),
+            "created_at": 0,
+            "filename": "batch.jsonl",
+            "purpose": purpose,
+            "status": "processed",
+        }
+
+    def create_batch(self, body: dict) -> dict:
+        """
+        Creates a batch and, unless `batch_status` says otherwise, completes it
+        right away by answering every request of its input file.
+
+        Args:
+            body (dict): The JSON request body.
+
+        Returns:
+            dict: The batch object.
+        """
+        lines = self.files[body["input_file_id"]].decode().splitlines()
+        output = []
+        for line in filter(None, lines):
+            request = json.loads(line)
+            status, _, payload = self.handle(request["body"])
+            response = {"status_code": status, "request_id": "req", "body": payload}
+            output.append({"custom_id": request["custom_id"], "response": response})
+        content = "".join(json.dumps(record) + "\n" for record in output).encode()
+        output_file_id = self.upload(content, "batch_output")["id"]
+
+        with self._lock:
+            batch_id = f"batch-{len(self.batches)}"
+            self.batches[batch_id] = {
+                "id": batch_id,
+                "object": "batch",
+                "endpoint": body["endpoint"],
+                "input_file_id": body["input_file_id"],
+                "completion_window": body["completion_window"],
+                "created_at": 0,
+                "metadata": body.get("metadata"),
+                "status": self.batch_status,
+                "output_file_id": output_file_id,
+                "request_counts": {
+                    "total": len(output),
+                    "completed": sum(
+                        r["response"]["status_code"] == 200 for r in output
+                    ),
+                    "failed": sum(r["response"]["status_code"] != 200 for r in output),
+                },
+            }
+        return self.batches[batch_id]
+
+    def _throttle(self) -> tuple[int, dict[str, str]] | None:
+        """
+        Counts a request against the per-minute quota. Must hold `_lock`.
+
+        Returns:
+            tuple[int, dict[str, str]] | None: A 429 failure if the quota is
+                exhausted, otherwise None.
+        """
+        if self.requests_per_minute is None:
+            return None
+
+        now = time.monotonic()
+        start, count = self._window
+        if now - start >= 60:
+            start, count = now, 0
+        self._window = (start, count + 1)
+        remaining = self.requests_per_minute - count - 1
+        reset = max(60 - (now - start), 0.001)
+        self.headers = {
+            "x-ratelimit-limit-requests": str(self.requests_per_minute),
+            "x-ratelimit-remaining-requests": str(max(remaining, 0)),
+            "x-ratelimit-reset-requests": f"{reset:.3f}s",
+        }
+        if remaining >= 0:
+            return None
+        return 429, {**self.headers, "retry-after": f"{math.ceil(reset)}"}
+
+    def _handler(self) -> type[BaseHTTPRequestHandler]:
+        """
+        Builds the request handler class bound to this server.
+
+        Returns:
+            type[BaseHTTPRequestHandler]: The handler class.
+        """
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            # Keep connections alive like the real API does.
+            protocol_version = "HTTP/1.1"
+
+            def setup(self) -> None:
+                super().setup()
+                with fake._lock:
+                    fake.connections += 1
+
+            def do_POST(self) -> None:
+                length = int(self.headers.get("content-length", 0))
+                data = self.rfile.read(length)
+                if self.path.endswith("/files"):
+                    content, purpose = multipart_file(self.headers, data)
+                    self.respond(200, {}, fake.upload(content, purpose))
+                elif self.path.endswith("/batches"):
+                    self.respond(200, {}, fake.create_batch(json.loads(data)))
+                else:
+                    self.respond(*fake.handle(json.loads(data or b"{}")))
+
+            def do_GET(self) -> None:
+                parts = self.path.split("/")
+                if parts[-2] == "batches" and parts[-1] in fake.batches:
+                    self.respond(200, {}, fake.batches[parts[-1]])
+                elif parts[-1] == "content" and parts[-2] in fake.files:
+                    self.respond(200, {}, fake.files[parts[-2]])
+                else:
+                    self.respond(404, {}, {"error": {"message": "not found"}})
+
+            def respond(
+                self, status: int, headers: dict[str, str], payload: dict | bytes
+            ) -> None:
+                if isinstance(payload, bytes):
+                    data, content_type = payload, "application/octet-stream"
+                else:
+                    data, content_type = (
+                        json.dumps(payload).encode(),
+                        "application/json",
+                    )
+                self.send_response(status)
+                self.send_header("content-type", content_type)
+                self.send_header("content-length", str(len(data)))
+                for name, value in headers.items():
+                    self.send_header(name, value)
+                self.end_headers()
+                self.wfile.write(data)
+
+            def log_message(self, format: str, *args: Any) -> None:
+                pass
+
+        return Handler
+
+
+def multipart_file(headers: Message, data: bytes) -> tuple[bytes, str]:
+    """
+    Extracts the uploaded file and its purpose from a multipart form.
+
+    Args:
+        headers (Message): The request headers.
+        data (bytes): The request body.
+
+    Returns:
+        tuple[bytes, str]: The content of the file and the `purpose` field.
+    """
+    form = BytesParser(policy=default).parsebytes(
+        f"content-type: {headers['content-type']}\r\n\r\n".encode() + data
+    )
+    content, purpose = b"", ""
+    for part in form.iter_parts():
+        if part.get_filename() is not None:
+            content = cast(bytes, part.get_payload(decode=True))
+        elif part.get_param("name", header="content-disposition") == "purpose":
+            purpose = part.get_content().strip()
+    return content, purpose
+
+
+def completion(body: dict, content: str) -> dict:
+    """
+    Builds a chat completion response body.
+
+    Args:
+        body (dict): The JSON request body.
+        content (str): The assistant message.
+
+    Returns:
+        dict: The response body.
+    """
+    prompt_tokens = sum(len(m["content"]) // 4 for m in body.get("messages", []))
+    completion_tokens = len(content) // 4
+    return {
+        "id": "chatcmpl-fake",
+        "object": "chat.completion",
+        "created": 0,
+        "model": body.get("model", "fake"),
+        "choices": [
+            {
+                "index": 0,
+                "message": {"role": "assistant", "content": content},
+                "finish_reason": "stop",
+            }
+        ],
+        "usage": {
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": completion_tokens,
+            "total_tokens": prompt_tokens + completion_tokens,
+        },
+    }
@@ -0,0 +1,126 @@
+import json
+
+from devtools import config
+from devtools.lang_processor.function_declaration import FunctionDeclaration
+
+# Rough number of characters per token for source code; avoids a tokenizer
+# dependency while staying on the conservative side for budgeting.
+CHARS_PER_TOKEN = 3
+
+
+def estimate_tokens(text: str) -> int:
+    """
+    Estimates the number of tokens a piece of text costs in a prompt.
+
+    Args:
+        text (str): The text to estimate.
+
+    Returns:
+        int: The estimated token count.
+    """
+    return len(text) // CHARS_PER_TOKEN + 1
+
+
+def estimate_max_tokens(function: FunctionDeclaration) -> int:
+    """
+    Sizes the output budget of a docstring from the shape of the function: every
+    parameter and raised exception adds a line to the docstring, every branch a
+    little explanation.
+
+    Args:
+        function (FunctionDeclaration): The function to document.
+
+    Returns:
+        int: The `max_tokens` to request, at most `config.DOCSTRING_MAX_TOKENS`.
+    """
+    tokens = (
+        config.DOCSTRING_BASE_TOKENS
+        + config.DOCSTRING_TOKENS_PER_PARAM * function.n_params
+        + config.DOCSTRING_TOKENS_PER_BRANCH * (function.complexity - 1)
+        + config.DOCSTRING_TOKENS_PER_RAISE * function.n_raises
+    )
+    return min(tokens, config.DOCSTRING_MAX_TOKENS)
+
+
+def pack_batches(functions: list[str], token_budget: int) -> list[list[int]]:
+    """
+    Greedily packs functions, in order, into batches whose estimated prompt size
+    stays within the token budget. A function larger than the budget gets a batch
+    of its own.
+
+    Args:
+        functions (list[str]): The function texts to pack.
+        token_budget (int): The maximum estimated input tokens of one batch.
+
+    Returns:
+        list[list[int]]: The indices into `functions` of every batch.
+    """
+    batches: list[list[int]] = []
+    batch: list[int] = []
+    batch_tokens = 0
+    for i, function_text in enumerate(functions):
+        tokens = estimate_tokens(function_text)
+        if batch and batch_tokens + tokens > token_budget:
+            batches.append(batch)
+            batch, batch_tokens = [], 0
+        batch.append(i)
+        batch_tokens += tokens
+
+    if batch:
+        batches.append(batch)
+
+    return batches
+
+
+def build_batch_prompt(functions: list[str]) -> str:
+    """
+    Serializes several functions into one prompt, identified by their position.
+
+    Args:
+        functions (list[str]): The function texts of the batch.
+
+    Returns:
+        str: A JSON document listing the id and source of every function.
+    """
+    return json.dumps(
+        {
+            "functions": [
+                {"id": f"f{i}", "source": function_text}
+                for i, function_text in enumerate(functions)
+            ]
+        },
+        indent=1,
+    )
+
+
+def parse_batch_response(response: str, n_functions: int) -> list[str]:
+    """
+    Unpacks the per-function docstrings of a batched response.
+
+    Args:
+        response (str): The JSON object returned by the model.
+        n_functions (int): The number of functions in the batch.
+
+    Returns:
+        list[str]: The docstrings in batch order.
+
+    Raises:
+        ValueError: If the response is not a JSON object of strings covering every
+            function id.
+    """
+    try:
+        results = json.loads(response)
+    except json.JSONDecodeError as e:
+        raise ValueError(f"Batched response is not valid JSON: {e}") from e
+
+    if not isinstance(results, dict):
+        raise ValueError("Batched response is not a JSON object")
+
+    docstrings = []
+    for i in range(n_functions):
+        docstring = results.get(f"f{i}")
+        if not isinstance(docstring, str):
+            raise ValueError(f"Batched response has no docstring for `f{i}`")
+        docstrings.append(docstring)
+
+    return docstrings
@@ -0,0 +1,428 @@
+"""
+Offline bulk runs through the OpenAI Batch API.
+
+`BulkJob.submit` extracts the undocumented functions below a path, writes their
+requests to JSONL input files and uploads each file as a batch. Once the batches
+completed, `BulkJob.apply` downloads their results and inserts the docstrings.
+Both phases share a job file that records the batches and the content hash of
+every file, so files edited in between are left untouched.
+
+Every request is identified by the path of its file, the byte span of its
+function and a hash of the function's text, e.g. `pkg/mod.py:120-480:1f2e3d4c...`.
+"""
+
+import hashlib
+import json
+import os
+from typing import TYPE_CHECKING, Iterator
+
+from rich import print
+
+from devtools import config
+from devtools.file_input import FileTooLargeError, Source, read_source
+from devtools.incremental import ChangeSet, select_changed
+from devtools.lang_processor.function_declaration import FunctionDeclaration
+from devtools.metrics import collector
+
+if TYPE_CHECKING:
+    from devtools.docstringer import DocStringWriter
+    from devtools.llm.openai_client import OpenAIClient
+
+JOB_VERSION = 1
+
+
+def custom_id(relative_path: str, function: FunctionDeclaration) -> str:
+    """
+    Identifies the request of a function, stable as long as its file is unchanged.
+
+    Args:
+        relative_path (str): The path of the function's file, relative to the root
+            of the job.
+        function (FunctionDeclaration): The function.
+
+    Returns:
+        str: The custom id of the function's request.
+    """
+    view = memoryview(function.source)[function.start_byte : function.end_byte]
+    digest = hashlib.blake2b(view, digest_size=8).hexdigest()
+    return f"{relative_path}:{function.start_byte}-{function.end_byte}:{digest}"
+
+
+class BulkJob:
+    """
+    A bulk docstring run split into a `submit` and an `apply` phase, possibly in
+    different processes, sharing the job file at `path`.
+    """
+
+    def __init__(
+        self, writer: "DocStringWriter", client: "OpenAIClient", path: str
+    ) -> None:
+        """
+        Loads the job file if it exists.
+
+        Args:
+            writer (DocStringWriter): Selects and parses the files and writes the
+                results; its client is not used.
+            client (OpenAIClient): Uploads the batches and downloads their results.
+            path (str): The location of the job file. The batch input files are
+                written next to it.
+
+        Raises:
+            ValueError: If the job file was written by an incompatible version.
+        """
+        self.writer = writer
+        self.client = client
+        self.path = path
+        self.state: dict = {}
+        if os.path.exists(path):
+            with open(path) as f:
+                self.state = json.load(f)
+            if self.state.get("version") != JOB_VERSION:
+                raise ValueError(f"{path} is not a version {JOB_VERSION} job file")
+
+    def submit(
+        self,
+        file_or_path: str,
+        *,
+        changes: ChangeSet | None = None,
+        verbosity: int = 0,
+    ) -> list[str]:
+        """
+        Writes the requests of every undocumented function below a path to batch
+        input files and submits them. Copies of a function, see
+        `FunctionDeclaration.fingerprint`, share one request.
+
+        Args:
+            file_or_path (str): A path to a directory or file.
+            changes (ChangeSet, optional): Restricts the run to changed files and
+                lines.
+            verbosity (int, optional): The verbosity level of the output.
+
+        Returns:
+            list[str]: The ids of the submitted batches.
+
+        Raises:
+            RuntimeError: If the job was already submitted.
+        """
+        if self.state.get("batches"):
+            raise RuntimeError(f"{self.path} was already submitted")
+
+        path = os.path.abspath(file_or_path)
+        root = path if os.path.isdir(path) else os.path.dirname(path)
+        self.state = {
+            "version": JOB_VERSION,
+            "root": root,
+            "files": {},
+            "copies": {},
+            "batches": [],
+        }
+        inputs = self._write_inputs(path, root, changes, verbosity)
+        self._save()
+        for input_path, n_requests in inputs:
+            with open(input_path, "rb") as f:
+                batch_id = self.client.submit_batch(
+                    f, metadata={"job": os.path.basename(self.path)}
+                )
+            self.state["batches"].append(
+                {"id": batch_id, "input": input_path, "requests": n_requests}
+            )
+            # Saved after every batch, so a failed upload loses none of the others.
+            self._save()
+            if verbosity > 0:
+                print(
+                    f"Submitted batch {batch_id} of {n_requests} requests.",
+                    file=self.writer.status,
+                )
+
+        return [batch["id"] for batch in self.state["batches"]]
+
+    def status(self) -> list[dict]:
+        """
+        Fetches the progress of the job's batches.
+
+        Returns:
+            list[dict]: The `id`, `status` and `completed`, `failed` and `total`
+                request counts of every batch.
+        """
+        statuses = []
+        for entry in self.state.get("batches", []):
+            batch = self.client.retrieve_batch(entry["id"])
+            counts = batch.request_counts
+            statuses.append(
+                {
+                    "id": batch.id,
+                    "status": batch.status,
+                    "completed": counts.completed if counts else 0,
+                    "failed": counts.failed if counts else 0,
+                    "total": counts.total if counts else entry["requests"],
+                }
+            )
+        return statuses
+
+    def apply(self, *, verbosity: int = 0) -> int:
+        """
+        Downloads the results of the job's batches and inserts them. Files changed
+        since the job was submitted are skipped; functions whose request failed
+        are left undocumented and picked up by the next job submitted for them.
+
+        Args:
+            verbosity (int, optional): The verbosity level of the output.
+
+        Returns:
+            int: The number of docstrings inserted.
+
+        Raises:
+            RuntimeError: If the job was not submitted or a batch has not completed.
+        """
+        if "batches" not in self.state:
+            raise RuntimeError(f"{self.path} was not submitted")
+
+        results = self._download_results()
+        copies = self.state["copies"]
+        n_insertions = 0
+        with self.writer.write_behind():
+            for relative, entry in self.state["files"].items():
+                file_path = os.path.join(self.state["root"], relative)
+                source = self._unchanged_source(file_path, entry["sha256"])
+                if source is None:
+                    collector.count("files_stale")
+                    print(
+                        f"[yellow]Skipped {file_path}: changed since the job was "
+                        "submitted.[/yellow]",
+                        file=self.writer.status,
+                    )
+                    continue
+
+                processor = self.writer.processor_for(file_path)
+                tree = processor.parse(source)
+                requested = set(entry["ids"])
+                functions, docstrings = [], []
+                for function in processor.extract_function_declarations(
+                    tree.root_node, source
+                ):
+                    request_id = custom_id(relative, function)
+                    if request_id not in requested or function.has_docstring:
+                        continue
+                    docstring = results.get(copies.get(request_id, request_id))
+                    if docstring:
+                        functions.append(function)
+                        docstrings.append(docstring)
+
+                updated_code, n = processor.insert_docstrings(
+                    source, functions, docstrings, tree=tree
+                )
+                n_insertions += self.writer.write_result(
+                    file_path, updated_code, n, verbosity=verbosity, original=source
+                )
+
+        return n_insertions
+
+    def _write_inputs(
+        self,
+        path: str,
+        root: str,
+        changes: ChangeSet | None,
+        verbosity: int,
+    ) -> list[tuple[str, int]]:
+        """
+        Streams the requests of the run to batch input files, starting a new file
+        whenever one would exceed `config.BULK_MAX_REQUESTS` or
+        `config.BULK_MAX_BYTES`. Records every file in the job state.
+
+        Args:
+            path (str): The absolute path to a directory or file.
+            root (str): The directory file paths are recorded relative to.
+            changes (ChangeSet | None): Restricts the run to changed files and lines.
+            verbosity (int): The verbosity level of the output.
+
+        Returns:
+            list[tuple[str, int]]: The path and number of requests of every input
+                file.
+        """
+        inputs: list[tuple[str, int]] = []
+        output = None
+        n_requests = n_bytes = 0
+        owners: dict[str, str] = {}
+        try:
+            for line in self._requests(path, root, changes, verbosity, owners):
+                if output is None or (
+                    n_requests >= config.BULK_MAX_REQUESTS
+                    or n_bytes + len(line) > config.BULK_MAX_BYTES
+                ):
+                    if output is not None:
+                        output.close()
+                        inputs[-1] = (inputs[-1][0], n_requests)
+                    input_path = f"{self.path}.{len(inputs)}.jsonl"
+                    output = open(input_path, "wb")
+                    inputs.append((input_path, 0))
+                    n_requests = n_bytes = 0
+                output.write(line)
+                n_requests += 1
+                n_bytes += len(line)
+        finally:
+            if output is not None:
+                output.close()
+                inputs[-1] = (inputs[-1][0], n_requests)
+
+        collector.count("bulk_requests", sum(n for _, n in inputs))
+        return inputs
+
+    def _requests(
+        self,
+        path: str,
+        root: str,
+        changes: ChangeSet | None,
+        verbosity: int,
+        owners: dict[str, str],
+    ) -> Iterator[bytes]:
+        """
+        Extracts the undocumented functions of the run and builds their requests.
+
+        Args:
+            path (str): The absolute path to a directory or file.
+            root (str): The directory file paths are recorded relative to.
+            changes (ChangeSet | None): Restricts the run to changed files and lines.
+            verbosity (int): The verbosity level of the output.
+            owners (dict[str, str]): Maps the fingerprint of every requested
+                function to its custom id; filled while iterating.
+
+        Yields:
+            bytes: The request of a function as one JSON line.
+        """
+        for file_path in self.writer.iter_files(
+            path, [0], changes=changes, verbosity=verbosity
+        ):
+            processor = self.writer.processor_for(file_path)
+            try:
+                source = read_source(
+                    file_path,
+                    max_bytes=self.writer.max_file_bytes,
+                    mmap_bytes=self.writer.mmap_file_bytes,
+                )
+            except FileTooLargeError as e:
+                self.writer.record_oversize(file_path, e, verbosity=verbosity)
+                continue
+            functions = select_changed(
+                processor.extract_function_declarations(
+                    processor.to_ast(source), source
+                ),
+                changes.line_ranges(file_path) if changes else None,
+            )
+            undocumented = [f for f in functions if not f.has_docstring]
+            self.writer.record_skipped(
+                file_path, len(functions) - len(undocumented), verbosity=verbosity
+            )
+            if not undocumented:
+                continue
+
+            relative = os.path.relpath(file_path, root)
+            texts, max_tokens = self.writer.prompt_inputs(undocumented)
+            ids = [custom_id(relative, f) for f in undocumented]
+            self.state["files"][relative] = {"sha256": _sha256(source), "ids": ids}
+            for i, function in enumerate(undocumented):
+                fingerprint = function.fingerprint if self.writer.deduplicate else None
+                if fingerprint is not None and fingerprint in owners:
+                    self.state["copies"][ids[i]] = owners[fingerprint]
+                    self.writer.deduplicated_calls += 1
+                    collector.count("deduplicated_calls")
+                    continue
+                if fingerprint is not None:
+                    owners[fingerprint] = ids[i]
+
+                options: dict[str, str | int] = {}
+                if (
+                    system_prompt := self.writer.system_prompt_for(processor)
+                ) is not None:
+                    options["system_prompt"] = system_prompt
+                if max_tokens is not None:
+                    options["max_tokens"] = max_tokens[i]
+                request = self.client.batch_request(ids[i], texts[i], **options)
+                yield json.dumps(request).encode("utf8") + b"\n"
+
+    def _download_results(self) -> dict[str, str]:
+        """
+        Downloads the docstrings of the job's completed batches.
+
+        Returns:
+            dict[str, str]: The docstring of every successful request by custom id.
+
+        Raises:
+            RuntimeError: If a batch has not completed.
+        """
+        batches = [self.client.retrieve_batch(b["id"]) for b in self.state["batches"]]
+        for batch in batches:
+            if batch.status != "completed":
+                raise RuntimeError(f"Batch {batch.id} is {batch.status}, not completed")
+
+        results: dict[str, str] = {}
+        n_answered = 0
+        for batch in batches:
+            if batch.output_file_id is None:
+                continue
+            for line in self.client.download_file(batch.output_file_id).splitlines():
+                if not line.strip():
+                    continue
+                record = json.loads(line)
+                response = record.get("response") or {}
+                try:
+                    content = response["body"]["choices"][0]["message"]["content"]
+                except (KeyError, IndexError, TypeError):
+                    content = None
+                if response.get("status_code") != 200:
+                    continue
+                n_answered += 1
+                # An empty answer means the function needs no docstring.
+                if content:
+                    results[record["custom_id"]] = content
+
+        # Failed requests are listed in the error file or carry an error status.
+        n_failed = sum(b["requests"] for b in self.state["batches"]) - n_answered
+        collector.count("bulk_results", len(results))
+        collector.count("bulk_failed", n_failed)
+        if n_failed:
+            print(
+                f"[yellow]{n_failed} requests failed; their functions stay "
+                "undocumented. Submit a new job for the same path, with another "
+                "job file, to retry them.[/yellow]",
+                file=self.writer.status,
+            )
+        return results
+
+    def _unchanged_source(self, file_path: str, sha256: str) -> Source | None:
+        """
+        Reads a file if its content still matches the submitted one.
+
+        Args:
+            file_path (str): The path of the file.
+            sha256 (str): The hex digest of the file at submission.
+
+        Returns:
+            Source | None: The content, or None if the file changed or is gone.
+        """
+        try:
+            source = read_source(
+                file_path, max_bytes=0, mmap_bytes=self.writer.mmap_file_bytes
+            )
+        except FileNotFoundError:
+            return None
+        return source if _sha256(source) == sha256 else None
+
+    def _save(self) -> None:
+        """
+        Writes the job state to the job file.
+        """
+        with open(self.path, "w") as f:
+            json.dump(self.state, f, indent=1)
+
+
+def _sha256(source: Source) -> str:
+    """
+    Computes the SHA-256 of a file's content.
+
+    Args:
+        source (Source): The content.
+
+    Returns:
+        str: The hex digest.
+    """
+    return hashlib.sha256(source).hexdigest()
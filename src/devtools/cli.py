@@ -0,0 +1,731 @@
+"""
+The `devtools` command line interface.
+
+Keep this module cheap to import: heavy dependencies (openai, black, rich,
+tree-sitter grammars) are imported inside the commands that need them.
+"""
+
+import os
+from typing import TYPE_CHECKING, Callable, TextIO, cast
+
+import click
+
+from devtools import __version__, config
+
+if TYPE_CHECKING:
+    from devtools.bulk import BulkJob
+    from devtools.docstringer import DocStringWriter
+
+
+@click.group()
+@click.version_option(__version__, prog_name="devtools")
+def main() -> None:
+    """
+    Developer tools powered by LLMs.
+    """
+
+
+# Options configuring the LLM client and the `DocStringWriter`, see `_build_writer`.
+_WRITER_OPTIONS = [
+    click.option(
+        "--openai-api-key",
+        default=config.API_KEY,
+        show_default=False,
+        help="OpenAI API Key",
+    ),
+    click.option(
+        "--model",
+        help="Model that writes the docstrings; gpt-4 if omitted.",
+    ),
+    click.option(
+        "--base-url",
+        help="Endpoint of the OpenAI-compatible API; OPENAI_BASE_URL if omitted.",
+    ),
+    click.option(
+        "--timeout",
+        type=float,
+        help="Timeout of a request in seconds; the connection pool's if omitted.",
+    ),
+    click.option(
+        "--concurrency",
+        type=int,
+        default=config.MAX_CONCURRENCY,
+        show_default=True,
+        help="Maximum number of docstring requests in flight per file.",
+    ),
+    click.option(
+        "--batch-tokens",
+        type=int,
+        default=config.BATCH_TOKEN_BUDGET,
+        show_default=True,
+        help="Pack functions into multi-function requests of up to this many tokens.",
+    ),
+    click.option(
+        "--requests-per-minute",
+        type=float,
+        help="Request quota; learned from the API's rate-limit headers if omitted.",
+    ),
+    click.option(
+        "--tokens-per-minute",
+        type=float,
+        help="Token quota; learned from the API's rate-limit headers if omitted.",
+    ),
+    click.option(
+        "--max-retries",
+        type=int,
+        default=6,
+        show_default=True,
+        help="Retries of a throttled or transiently failing request.",
+    ),
+    click.option(
+        "--hedge-backend",
+        "hedge_backends",
+        multiple=True,
+        metavar="MODEL[@BASE_URL]",
+        help="Duplicate slow or failed requests to this model; repeatable.",
+    ),
+    click.option(
+        "--max-connections",
+        type=int,
+        default=config.HTTP_MAX_CONNECTIONS,
+        show_default=True,
+        help="Size of the HTTP connection pool shared by all requests.",
+    ),
+    click.option(
+        "--http2",
+        is_flag=True,
+        default=config.HTTP2,
+        help="Multiplex requests over HTTP/2 connections (requires `h2`).",
+    ),
+    click.option(
+        "--cache-dir",
+        default=config.CACHE_DIR,
+        show_default=True,
+        help="Directory of the persistent LLM response cache.",
+    ),
+    click.option(
+        "--no-cache",
+        "cache",
+        is_flag=True,
+        flag_value=False,
+        default=True,
+        help="Always query the model instead of reusing cached responses.",
+    ),
+    click.option(
+        "--prompt-body-lines",
+        type=int,
+        default=config.PROMPT_BODY_LINES,
+        show_default=True,
+        help="Compact function bodies longer than this many lines; 0 sends them in full.",
+    ),
+    click.option(
+        "--dynamic-max-tokens/--fixed-max-tokens",
+        default=config.DYNAMIC_MAX_TOKENS,
+        show_default=True,
+        help="Size each request's output budget from the function's shape.",
+    ),
+    click.option(
+        "--dedupe/--no-dedupe",
+        default=config.DEDUPLICATE,
+        show_default=True,
+        help="Request one docstring per distinct function and reuse it for its copies.",
+    ),
+    click.option(
+        "--max-file-bytes",
+        type=int,
+        default=config.MAX_FILE_BYTES,
+        show_default=True,
+        help="Size cap of source files; 0 disables it.",
+    ),
+    click.option(
+        "--oversize",
+        "oversize_policy",
+        type=click.Choice(["skip", "error"]),
+        default=config.OVERSIZE_POLICY,
+        show_default=True,
+        help="Skip files above the size cap or fail on them.",
+    ),
+    click.option(
+        "--mmap-file-bytes",
+        type=int,
+        default=config.MMAP_FILE_BYTES,
+        show_default=True,
+        help="Memory-map and parse in chunks files of at least this size.",
+    ),
+    click.option(
+        "--full-format",
+        is_flag=True,
+        help="Reformat whole files with black instead of only the inserted docstrings.",
+    ),
+    click.option(
+        "--include",
+        multiple=True,
+        help="Only consider files matching this .gitignore-style glob; repeatable.",
+    ),
+    click.option(
+        "--exclude",
+        multiple=True,
+        help="Skip files and directories matching this .gitignore-style glob; repeatable.",
+    ),
+    click.option(
+        "--no-ignore",
+        "use_ignore_files",
+        is_flag=True,
+        flag_value=False,
+        default=True,
+        help="Walk into paths listed in .gitignore and .devtoolsignore files too.",
+    ),
+]
+
+
+def _writer_options(command: Callable) -> Callable:
+    """
+    Adds the options of `_WRITER_OPTIONS` to a command.
+
+    Args:
+        command (Callable): The command function.
+
+    Returns:
+        Callable: The decorated command function.
+    """
+    for option in reversed(_WRITER_OPTIONS):
+        command = option(command)
+    return command
+
+
+@main.command()
+@click.argument("path", type=click.Path(exists=True))
+@_writer_options
+@click.option(
+    "--jobs",
+    "-j",
+    type=int,
+    default=1,
+    show_default=True,
+    help="Number of worker processes; values above 1 run the parallel pipeline.",
+)
+@click.option(
+    "--since",
+    help="Only consider functions changed since this git revision.",
+)
+@click.option(
+    "--manifest",
+    help="Only consider files changed since the run that wrote this manifest.",
+)
+@click.option(
+    "--diff",
+    "diff_path",
+    is_flag=False,
+    flag_value="-",
+    type=click.Path(dir_okay=False, allow_dash=True),
+    help="Leave files untouched and write unified diffs to stdout or this file.",
+)
+@click.option(
+    "--metrics-json",
+    type=click.Path(dir_okay=False),
+    help="Write per-stage timings and counters as JSON to this file.",
+)
+@click.option(
+    "--metrics-prom",
+    type=click.Path(dir_okay=False),
+    help="Write per-stage timings and counters as a Prometheus textfile.",
+)
+@click.option(
+    "--profile",
+    type=click.Path(dir_okay=False),
+    help="Profile the run with cProfile and write the stats to this file.",
+)
+@click.option(
+    "--budget-tokens",
+    type=click.IntRange(min=1),
+    help="Stop requesting docstrings once about this many tokens are spent.",
+)
+@click.option(
+    "--budget-requests",
+    type=click.IntRange(min=1),
+    help="Stop requesting docstrings after this many requests.",
+)
+@click.option(
+    "--budget-seconds",
+    type=click.FloatRange(min=0, min_open=True),
+    help="Stop the run after this many seconds.",
+)
+@click.option("--verbose", "-v", count=True, help="Report more details.")
+def docstringify(
+    path: str,
+    jobs: int,
+    since: str | None,
+    manifest: str | None,
+    diff_path: str | None,
+    metrics_json: str | None,
+    metrics_prom: str | None,
+    profile: str | None,
+    budget_tokens: int | None,
+    budget_requests: int | None,
+    budget_seconds: float | None,
+    verbose: int,
+    **writer_options,
+) -> None:
+    """
+    Generate missing docstrings for the code at PATH.
+
+    With a budget, the most valuable functions (public, top-level, long and often
+    referenced) are documented first and the run stops once the budget is spent.
+    """
+    if since and manifest:
+        raise click.UsageError("`--since` and `--manifest` are mutually exclusive.")
+    budgeted = (budget_tokens, budget_requests, budget_seconds) != (None,) * 3
+    if budgeted and jobs > 1:
+        raise click.UsageError("Budgets are not supported with `--jobs`.")
+    if budgeted and writer_options["batch_tokens"] > 0:
+        raise click.UsageError("Budgets are not supported with `--batch-tokens`.")
+
+    from devtools.incremental import ChangeSet, Manifest
+
+    diff_output = _open_diff(diff_path)
+    ds = _build_writer(diff_output=diff_output, **writer_options)
+
+    changes, run_manifest = None, None
+    if since:
+        repo_dir = path if os.path.isdir(path) else os.path.dirname(path)
+        changes = ChangeSet.from_git(since, cwd=repo_dir or ".")
+    elif manifest:
+        run_manifest = Manifest(manifest)
+        changes = run_manifest.changes(ds.iter_files(path, [0]))
+
+    profiler = None
+    if profile:
+        import cProfile
+
+        profiler = cProfile.Profile()
+        profiler.enable()
+
+    try:
+        if jobs > 1:
+            from devtools.pipeline import DocStringPipeline
+
+            pipeline = DocStringPipeline(ds, jobs=jobs)
+            pipeline.run(path, verbosity=verbose, changes=changes)
+        else:
+            budget = None
+            if budgeted:
+                from devtools.scheduler import Budget
+
+                budget = Budget(
+                    max_tokens=budget_tokens,
+                    max_requests=budget_requests,
+                    max_seconds=budget_seconds,
+                )
+            ds.docstringify(path, verbosity=verbose, changes=changes, budget=budget)
+    finally:
+        if diff_output is not None:
+            diff_output.close()
+
+    if profile and profiler is not None:
+        # Worker processes of `--jobs` are not included.
+        profiler.disable()
+        profiler.dump_stats(profile)
+
+    # A diff run leaves the files as they were, so they still need processing.
+    if run_manifest is not None and changes is not None and diff_output is None:
+        run_manifest.update(changes.paths())
+        run_manifest.save()
+
+    # Keep diffs streamed to stdout clean.
+    err = diff_output is not None
+    if ds.skipped_calls:
+        click.echo(
+            f"Skipped {ds.skipped_calls} model calls for documented functions.",
+            err=err,
+        )
+    if ds.deduplicated_calls:
+        click.echo(
+            f"Saved {ds.deduplicated_calls} model calls for copies of functions.",
+            err=err,
+        )
+
+    from devtools.metrics import collector
+
+    if metrics_json:
+        collector.write_json(metrics_json)
+    if metrics_prom:
+        collector.write_prometheus(metrics_prom)
+    if verbose:
+        for name, stage in collector.summary()["stages"].items():
+            click.echo(
+                f"{name:>12}: {stage['count']:6d} runs, {stage['total_s']:8.3f}s total,"
+                f" p50 {stage['p50_ms']:.1f}ms, p99 {stage['p99_ms']:.1f}ms",
+                err=err,
+            )
+
+
+@main.command()
+@click.argument("paths", nargs=-1, type=click.Path(exists=True))
+@_writer_options
+@click.option(
+    "--socket",
+    "socket_path",
+    default=config.DAEMON_SOCKET,
+    show_default=True,
+    help="Unix socket to serve requests on.",
+)
+@click.option(
+    "--interval",
+    type=float,
+    default=config.WATCH_INTERVAL,
+    show_default=True,
+    help="Seconds between two polls of the watched PATHS.",
+)
+@click.option("--verbose", "-v", count=True, help="Report more details.")
+def daemon(
+    paths: tuple[str, ...],
+    socket_path: str,
+    interval: float,
+    verbose: int,
+    **writer_options,
+) -> None:
+    """
+    Keep parsers and LLM clients resident: docstringify files under PATHS as they
+    are saved and serve `devtools client` requests.
+    """
+    from devtools.daemon import DocStringDaemon
+
+    server = DocStringDaemon(
+        _build_writer(**writer_options),
+        watch=paths,
+        socket_path=socket_path,
+        interval=interval,
+        verbosity=verbose,
+    )
+    try:
+        server.run()
+    except RuntimeError as e:
+        raise click.ClickException(str(e))
+
+
+@main.command()
+@click.argument("paths", nargs=-1, type=click.Path(exists=True))
+@click.option(
+    "--socket",
+    "socket_path",
+    default=config.DAEMON_SOCKET,
+    show_default=True,
+    help="Unix socket of the daemon.",
+)
+@click.option(
+    "--since",
+    help="Only consider functions changed since this git revision.",
+)
+@click.option("--stats", is_flag=True, help="Print the daemon's stage timings.")
+@click.option("--shutdown", is_flag=True, help="Stop the daemon.")
+def client(
+    paths: tuple[str, ...],
+    socket_path: str,
+    since: str | None,
+    stats: bool,
+    shutdown: bool,
+) -> None:
+    """
+    Docstringify PATHS through a running `devtools daemon`.
+    """
+    import json
+
+    from devtools.daemon import request
+
+    if shutdown:
+        message = {"command": "shutdown"}
+    elif stats:
+        message = {"command": "stats"}
+    elif paths:
+        message = {"command": "docstringify", "paths": paths, "since": since}
+    else:
+        message = {"command": "ping"}
+
+    try:
+        response = request(message, socket_path)
+    except (ConnectionError, RuntimeError) as e:
+        raise click.ClickException(str(e))
+    if not response.pop("ok"):
+        raise click.ClickException(response["error"])
+
+    if message["command"] != "docstringify":
+        click.echo(json.dumps(response, indent=2))
+        return
+    for file_path, error in response["errors"].items():
+        click.echo(f"Failed to docstringify {file_path}: {error}", err=True)
+    click.echo(
+        f"Generated {response['insertions']} docstrings in {response['files']} files."
+    )
+    if response["errors"]:
+        raise SystemExit(1)
+
+
+@main.group()
+def bulk() -> None:
+    """
+    Backfill docstrings offline through the OpenAI Batch API: `submit` the
+    requests, wait for the batches to complete, then `apply` the results.
+    """
+
+
+_JOB_OPTION = click.option(
+    "--job",
+    "job_path",
+    type=click.Path(dir_okay=False),
+    default="devtools-bulk.json",
+    show_default=True,
+    help="Job file shared by the bulk commands; input files are written next to it.",
+)
+
+
+@bulk.command("submit")
+@click.argument("path", type=click.Path(exists=True))
+@_writer_options
+@_JOB_OPTION
+@click.option(
+    "--since",
+    help="Only consider functions changed since this git revision.",
+)
+@click.option("--verbose", "-v", count=True, help="Report more details.")
+def bulk_submit(
+    path: str,
+    job_path: str,
+    since: str | None,
+    verbose: int,
+    **writer_options,
+) -> None:
+    """
+    Submit the missing docstrings of the code at PATH as batches.
+    """
+    from devtools.incremental import ChangeSet
+
+    job = _bulk_job(job_path, writer_options)
+    changes = None
+    if since:
+        repo_dir = path if os.path.isdir(path) else os.path.dirname(path)
+        changes = ChangeSet.from_git(since, cwd=repo_dir or ".")
+    try:
+        batch_ids = job.submit(path, changes=changes, verbosity=verbose)
+    except RuntimeError as e:
+        raise click.ClickException(str(e))
+    click.echo(
+        f"Submitted {len(batch_ids)} batches to {job_path}; run `devtools bulk apply`"
+        " once they completed."
+    )
+
+
+@bulk.command("status")
+@_writer_options
+@_JOB_OPTION
+def bulk_status(job_path: str, **writer_options) -> None:
+    """
+    Print the progress of the submitted batches.
+    """
+    for batch in _bulk_job(job_path, writer_options).status():
+        click.echo(
+            f"{batch['id']}: {batch['status']}, {batch['completed']} completed, "
+            f"{batch['failed']} failed of {batch['total']}"
+        )
+
+
+@bulk.command("apply")
+@_writer_options
+@_JOB_OPTION
+@click.option(
+    "--diff",
+    "diff_path",
+    is_flag=False,
+    flag_value="-",
+    type=click.Path(dir_okay=False, allow_dash=True),
+    help="Leave files untouched and write unified diffs to stdout or this file.",
+)
+@click.option("--verbose", "-v", count=True, help="Report more details.")
+def bulk_apply(
+    job_path: str, diff_path: str | None, verbose: int, **writer_options
+) -> None:
+    """
+    Insert the docstrings of completed batches into the unchanged files.
+    """
+    diff_output = _open_diff(diff_path)
+    try:
+        job = _bulk_job(job_path, writer_options, diff_output=diff_output)
+        n_insertions = job.apply(verbosity=verbose)
+    except RuntimeError as e:
+        raise click.ClickException(str(e))
+    finally:
+        if diff_output is not None:
+            diff_output.close()
+    click.echo(f"Generated {n_insertions} docstrings.", err=diff_output is not None)
+
+
+def _open_diff(diff_path: str | None) -> TextIO | None:
+    """
+    Opens the stream `--diff` writes to.
+
+    Args:
+        diff_path (str | None): The value of `--diff`; `-` means stdout.
+
+    Returns:
+        TextIO | None: The stream, or None without `--diff`.
+    """
+    if not diff_path:
+        return None
+    return cast(TextIO, click.open_file(diff_path, "w"))
+
+
+def _bulk_job(
+    job_path: str, writer_options: dict, *, diff_output: TextIO | None = None
+) -> "BulkJob":
+    """
+    Loads the bulk job at `job_path` with a writer and client configured by
+    `_WRITER_OPTIONS`.
+
+    Args:
+        job_path (str): The job file.
+        writer_options (dict): The values of `_WRITER_OPTIONS`.
+        diff_output (TextIO, optional): Stream to write unified diffs to instead of
+            updating files.
+
+    Returns:
+        BulkJob: The job.
+
+    Raises:
+        click.ClickException: If the job file cannot be used.
+    """
+    from devtools.bulk import BulkJob
+    from devtools.llm.openai_client import OpenAIClient
+
+    writer = _build_writer(
+        diff_output=diff_output, client_stack=False, **writer_options
+    )
+    try:
+        return BulkJob(writer, cast(OpenAIClient, writer.client), job_path)
+    except ValueError as e:
+        raise click.ClickException(str(e))
+
+
+def _build_writer(
+    *,
+    openai_api_key: str | None,
+    model: str | None,
+    base_url: str | None,
+    timeout: float | None,
+    concurrency: int,
+    batch_tokens: int,
+    requests_per_minute: float | None,
+    tokens_per_minute: float | None,
+    max_retries: int,
+    max_connections: int,
+    http2: bool,
+    cache_dir: str,
+    cache: bool,
+    prompt_body_lines: int,
+    dynamic_max_tokens: bool,
+    dedupe: bool,
+    max_file_bytes: int,
+    oversize_policy: str,
+    mmap_file_bytes: int,
+    full_format: bool,
+    include: tuple[str, ...],
+    exclude: tuple[str, ...],
+    use_ignore_files: bool,
+    hedge_backends: tuple[str, ...],
+    diff_output: TextIO | None = None,
+    client_stack: bool = True,
+) -> "DocStringWriter":
+    """
+    Builds the LLM client and `DocStringWriter` configured by `_WRITER_OPTIONS`.
+    Every argument but `diff_output` and `client_stack` is the value of the option
+    of the same name.
+
+    Args:
+        diff_output (TextIO, optional): Stream to write unified diffs to instead of
+            updating files.
+        client_stack (bool, optional): If False, the writer gets a bare
+            `OpenAIClient` of the model and endpoint, as the Batch API needs: no
+            hedging, rate limiting or response cache.
+
+    Returns:
+        DocStringWriter: The writer.
+
+    Raises:
+        click.UsageError: If the connection pool cannot be configured.
+    """
+    from devtools.docstringer import DocStringWriter
+    from devtools.lang_processor.registry import default_registry
+    from devtools.llm import registry
+    from devtools.llm.client_interface import IClient
+    from devtools.llm.openai_client import OpenAIClient
+    from devtools.llm.rate_limited_client import RateLimitedClient
+
+    try:
+        registry.configure_pool(max_connections=max_connections, http2=http2)
+    except RuntimeError as e:
+        raise click.UsageError(str(e))
+
+    backends = [_client_config(model, base_url, timeout)]
+    client: IClient
+    if not client_stack:
+        client = OpenAIClient(auth={"api_key": openai_api_key}, config=backends[0])
+    else:
+        for spec in hedge_backends:
+            hedge_model, _, hedge_base_url = spec.partition("@")
+            backends.append(
+                _client_config(hedge_model, hedge_base_url or None, timeout)
+            )
+        clients = [
+            RateLimitedClient(
+                OpenAIClient(
+                    auth={"api_key": openai_api_key},
+                    config={"max_retries": 0, **backend},
+                ),
+                requests_per_minute=requests_per_minute,
+                tokens_per_minute=tokens_per_minute,
+                max_concurrency=concurrency,
+                max_retries=max_retries,
+            )
+            for backend in backends
+        ]
+        client = clients[0]
+        if len(clients) > 1:
+            from devtools.llm.hedged_client import HedgedClient
+
+            client = HedgedClient(clients)
+        if cache:
+            from devtools.llm.cached_client import CachedClient
+
+            client = CachedClient(client, cache_dir=cache_dir)
+    return DocStringWriter(
+        client,
+        default_registry(full_format=full_format, prompt_body_lines=prompt_body_lines),
+        max_concurrency=concurrency,
+        batch_token_budget=batch_tokens,
+        dynamic_max_tokens=dynamic_max_tokens,
+        diff_output=diff_output,
+        include=include,
+        exclude=exclude,
+        ignore_files=config.IGNORE_FILES if use_ignore_files else (),
+        deduplicate=dedupe,
+        max_file_bytes=max_file_bytes,
+        mmap_file_bytes=mmap_file_bytes,
+        oversize_policy=oversize_policy,
+    )
+
+
+def _client_config(
+    model: str | None, base_url: str | None, timeout: float | None
+) -> dict:
+    """
+    Builds the `OpenAIClient` config of the given options, leaving out those that
+    were not set so the client's defaults apply.
+
+    Args:
+        model (str | None): The model.
+        base_url (str | None): The API endpoint.
+        timeout (float | None): The request timeout in seconds.
+
+    Returns:
+        dict: The config.
+    """
+    options = {"model": model, "base_url": base_url, "timeout": timeout}
+    return {key: value for key, value in options.items() if value is not None}
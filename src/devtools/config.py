@@ -4,6 +4,106 @@ API_KEY = os.getenv("OPENAI_API_KEY")
 
 DOCSTRING_STYLE_TYPE = "Google Style"
 
+# Maximum number of in-flight LLM requests while docstringifying a file.
+MAX_CONCURRENCY = int(os.getenv("DEVTOOLS_MAX_CONCURRENCY", "8"))
+
+# Shared HTTP connection pool used by every LLM client of the process.
+HTTP_MAX_CONNECTIONS = int(os.getenv("DEVTOOLS_HTTP_MAX_CONNECTIONS", "100"))
+HTTP_MAX_KEEPALIVE_CONNECTIONS = int(
+    os.getenv("DEVTOOLS_HTTP_MAX_KEEPALIVE_CONNECTIONS", "20")
+)
+HTTP_KEEPALIVE_EXPIRY = float(os.getenv("DEVTOOLS_HTTP_KEEPALIVE_EXPIRY", "30"))
+HTTP_TIMEOUT = float(os.getenv("DEVTOOLS_HTTP_TIMEOUT", "60"))
+HTTP2 = os.getenv("DEVTOOLS_HTTP2", "0") == "1"
+
+# Location and limits of the persistent LLM response cache.
+CACHE_DIR = os.getenv(
+    "DEVTOOLS_CACHE_DIR",
+    os.path.join(
+        os.getenv("XDG_CACHE_HOME", os.path.expanduser("~/.cache")), "devtools"
+    ),
+)
+CACHE_MAX_BYTES = int(os.getenv("DEVTOOLS_CACHE_MAX_BYTES", str(64 * 1024 * 1024)))
+CACHE_MAX_AGE = int(os.getenv("DEVTOOLS_CACHE_MAX_AGE", str(30 * 24 * 60 * 60)))
+
+# Line width inserted docstrings are wrapped to.
+LINE_WIDTH = 88
+
+# Input token budget of a multi-function request; 0 sends one request per function.
+BATCH_TOKEN_BUDGET = int(os.getenv("DEVTOOLS_BATCH_TOKEN_BUDGET", "0"))
+# Output tokens reserved per function of a multi-function request.
+BATCH_MAX_TOKENS_PER_FUNCTION = 300
+
+# Function bodies longer than this many lines are compacted before they are sent:
+# only their first lines, return/raise statements and the control flow leading to
+# them are kept. 0 sends every function in full.
+PROMPT_BODY_LINES = int(os.getenv("DEVTOOLS_PROMPT_BODY_LINES", "40"))
+
+# Size the output budget of a request from the shape of the function instead of
+# always reserving DOCSTRING_MAX_TOKENS.
+DYNAMIC_MAX_TOKENS = os.getenv("DEVTOOLS_DYNAMIC_MAX_TOKENS", "1") == "1"
+DOCSTRING_MAX_TOKENS = 500
+DOCSTRING_BASE_TOKENS = 128
+DOCSTRING_TOKENS_PER_PARAM = 32
+DOCSTRING_TOKENS_PER_BRANCH = 8
+DOCSTRING_TOKENS_PER_RAISE = 32
+
+# Request one docstring per distinct function (ignoring comments and formatting)
+# and reuse it for every copy of the function within a run.
+DEDUPLICATE = os.getenv("DEVTOOLS_DEDUPLICATE", "1") == "1"
+
+# Source files of at least MMAP_FILE_BYTES are memory-mapped and parsed in chunks
+# instead of being copied onto the heap. Files above MAX_FILE_BYTES are skipped
+# ("skip") or fail the run ("error"); 0 disables either limit.
+MMAP_FILE_BYTES = int(os.getenv("DEVTOOLS_MMAP_FILE_BYTES", str(1024 * 1024)))
+MAX_FILE_BYTES = int(os.getenv("DEVTOOLS_MAX_FILE_BYTES", str(16 * 1024 * 1024)))
+OVERSIZE_POLICY = os.getenv("DEVTOOLS_OVERSIZE_POLICY", "skip")
+
+# Weights of the priority score budgeted runs order functions by, see
+# `devtools.scheduler.priority`: public names, top-level definitions, long
+# functions and names referenced often across the run are documented first.
+PRIORITY_PUBLIC = float(os.getenv("DEVTOOLS_PRIORITY_PUBLIC", "2"))
+PRIORITY_TOP_LEVEL = float(os.getenv("DEVTOOLS_PRIORITY_TOP_LEVEL", "1"))
+PRIORITY_SIZE = float(os.getenv("DEVTOOLS_PRIORITY_SIZE", "0.5"))
+PRIORITY_REFERENCES = float(os.getenv("DEVTOOLS_PRIORITY_REFERENCES", "1"))
+
+# Hedged requests across a pool of LLM backends, see `HedgedClient`: a duplicate
+# is sent once a request takes longer than the HEDGE_QUANTILE of its backend's
+# last HEDGE_WINDOW latencies (HEDGE_INITIAL_DELAY seconds until it has
+# HEDGE_MIN_SAMPLES of them), at most HEDGE_MAX times per request.
+HEDGE_QUANTILE = float(os.getenv("DEVTOOLS_HEDGE_QUANTILE", "0.95"))
+HEDGE_MAX = int(os.getenv("DEVTOOLS_HEDGE_MAX", "1"))
+HEDGE_INITIAL_DELAY = float(os.getenv("DEVTOOLS_HEDGE_INITIAL_DELAY", "5"))
+HEDGE_MIN_DELAY = 0.05
+HEDGE_WINDOW = 256
+HEDGE_MIN_SAMPLES = 20
+# Weight of the latest outcome in a backend's moving error rate.
+HEDGE_ERROR_DECAY = 0.1
+
+# Limits of one Batch API input file; larger bulk runs are split into several
+# batches.
+BULK_MAX_REQUESTS = int(os.getenv("DEVTOOLS_BULK_MAX_REQUESTS", "50000"))
+BULK_MAX_BYTES = int(os.getenv("DEVTOOLS_BULK_MAX_BYTES", str(190 * 1024 * 1024)))
+
+# Ignore files honored when walking directories, in `.gitignore` syntax.
+IGNORE_FILES = (".gitignore", ".devtoolsignore")
+# Directories that are never walked into, ignore files or not.
+EXCLUDED_DIRS = frozenset(
+    os.getenv(
+        "DEVTOOLS_EXCLUDED_DIRS",
+        ".git,.hg,.svn,.venv,venv,node_modules,__pycache__,.tox,.nox,"
+        ".mypy_cache,.pytest_cache,.ruff_cache",
+    ).split(",")
+)
+
+# Unix socket of the resident docstring daemon and how often it polls the watched
+# paths for saved files, in seconds.
+DAEMON_SOCKET = os.getenv(
+    "DEVTOOLS_DAEMON_SOCKET",
+    os.path.join(os.getenv("XDG_RUNTIME_DIR", "/tmp"), f"devtools-{os.getuid()}.sock"),
+)
+WATCH_INTERVAL = float(os.getenv("DEVTOOLS_WATCH_INTERVAL", "0.5"))
+
 
 def system_prompt(language: str) -> str:
     """
@@ -16,3 +116,16 @@ def system_prompt(language: str) -> str:
         str: A message prompt detailing the requirements for writing a docstring.
     """
     return f"""You are an expert technical writer for a software company. You will be given the source code for a {language} function. If the function does NOT already provide a docstring, provide a {DOCSTRING_STYLE_TYPE} docstring that is grammatically correct and accurately describes the input function. The docstring should be terse and to the point only clarifying information that would be confusing to a mid level engineer. The docstring must be the only text in the response. Keep each line length to less than 80 characters. If there is already a docstring in the function the response should be empty."""
+
+
+def batch_system_prompt(language: str) -> str:
+    """
+    Generates a system prompt for documenting several functions in one request.
+
+    Args:
+        language (str): The programming language in which the functions are written.
+
+    Returns:
+        str: A message prompt asking for a JSON object of docstrings keyed by function id.
+    """
+    return f"""You are an expert technical writer for a software company. You will be given a JSON object whose "functions" list holds the id and source code of several {language} functions. For every function that does NOT already provide a docstring, write a {DOCSTRING_STYLE_TYPE} docstring that is grammatically correct and accurately describes the function. The docstring should be terse and to the point only clarifying information that would be confusing to a mid level engineer. Keep each line length to less than 80 characters. Respond with a single JSON object that maps every function id to its docstring exactly as it should appear in the source code, including the triple quotes. If a function already has a docstring map its id to an empty string."""
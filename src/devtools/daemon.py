@@ -0,0 +1,395 @@
+"""
+A resident docstring daemon and its thin client.
+
+The daemon keeps a `DocStringWriter` - with its language processors, grammars,
+pooled LLM clients and caches - alive in one event loop. It docstringifies the
+files of watched paths as they are saved and serves requests sent over a local
+Unix socket, so editor and pre-commit runs only pay for the LLM calls.
+
+Requests and responses are single-line JSON objects:
+
+    {"command": "docstringify", "paths": ["src/"], "since": "HEAD"}
+    {"command": "stats"}
+    {"command": "ping"}
+    {"command": "shutdown"}
+
+Every response holds `"ok": true` or `"ok": false` with an `"error"` message.
+This module imports nothing heavy at module level, so `request` is cheap to use.
+"""
+
+import asyncio
+import json
+import os
+import signal
+import socket
+import sys
+import threading
+from contextlib import asynccontextmanager
+from typing import TYPE_CHECKING, AsyncIterator, Iterable
+
+from devtools import config
+from devtools.incremental import ChangeSet, LineRanges
+from devtools.metrics import collector
+
+if TYPE_CHECKING:
+    from devtools.docstringer import DocStringWriter
+
+# Status of a file as seen by the watcher: (mtime_ns, size).
+FileState = tuple[int, int]
+
+
+def request(
+    message: dict,
+    socket_path: str = config.DAEMON_SOCKET,
+    *,
+    timeout: float | None = None,
+) -> dict:
+    """
+    Sends one request to a running daemon and waits for its response.
+
+    Args:
+        message (dict): The request, e.g. `{"command": "ping"}`.
+        socket_path (str, optional): The daemon's socket.
+        timeout (float, optional): Seconds to wait for the response. Defaults to
+            waiting until the daemon answers.
+
+    Returns:
+        dict: The response.
+
+    Raises:
+        ConnectionError: If no daemon listens on `socket_path`.
+        RuntimeError: If the daemon closed the connection without answering.
+    """
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+        sock.settimeout(timeout)
+        try:
+            sock.connect(socket_path)
+        except (FileNotFoundError, ConnectionRefusedError) as e:
+            raise ConnectionError(f"No daemon is listening on {socket_path}") from e
+        sock.sendall(json.dumps(message).encode("utf8") + b"\n")
+        with sock.makefile("rb") as f:
+            line = f.readline()
+    if not line:
+        raise RuntimeError("The daemon closed the connection without answering")
+    return json.loads(line)
+
+
+class DocStringDaemon:
+    """
+    Serves docstring requests over a Unix socket and docstringifies watched files
+    as they change, reusing one `DocStringWriter` for the daemon's lifetime.
+
+    Watched paths are polled: every `interval` seconds their files are listed with
+    the writer's ignore-aware walker and files with a new mtime or size are
+    processed. Files the daemon updates itself are not picked up again.
+    """
+
+    def __init__(
+        self,
+        writer: "DocStringWriter",
+        *,
+        watch: Iterable[str] = (),
+        socket_path: str = config.DAEMON_SOCKET,
+        interval: float = config.WATCH_INTERVAL,
+        verbosity: int = 0,
+    ) -> None:
+        """
+        Args:
+            writer (DocStringWriter): Generates and writes the docstrings.
+            watch (Iterable[str], optional): Files and directories to watch. Nothing
+                is watched by default, only socket requests are served.
+            socket_path (str, optional): Where to listen for requests.
+            interval (float, optional): Seconds between two polls of the watched
+                paths.
+            verbosity (int, optional): The verbosity level of the output.
+        """
+        self.writer = writer
+        self.watch = [os.path.abspath(path) for path in watch]
+        self.socket_path = socket_path
+        self.interval = interval
+        self.verbosity = verbosity
+        # Set once the socket accepts connections, e.g. for callers on other threads.
+        self.ready = threading.Event()
+        self._stopped: asyncio.Event | None = None
+        self._files: dict[str, FileState] = {}
+        # File -> (lock, number of requests holding or waiting for it).
+        self._locks: dict[str, tuple[asyncio.Lock, int]] = {}
+
+    def run(self) -> None:
+        """
+        Runs the daemon until it is asked to shut down or receives SIGINT/SIGTERM.
+
+        Raises:
+            RuntimeError: If another daemon already listens on the socket.
+        """
+        asyncio.run(self.serve())
+
+    async def serve(self) -> None:
+        """
+        Async counterpart of `run`.
+
+        Raises:
+            RuntimeError: If another daemon already listens on the socket.
+        """
+        from devtools.llm import registry
+
+        self._claim_socket()
+        self._stopped = asyncio.Event()
+        loop = asyncio.get_running_loop()
+        for signum in (signal.SIGINT, signal.SIGTERM):
+            try:
+                loop.add_signal_handler(signum, self._stopped.set)
+            except (RuntimeError, ValueError):
+                # Not the main thread: rely on the `shutdown` command instead.
+                pass
+
+        server = await asyncio.start_unix_server(self._serve_client, self.socket_path)
+        watcher = asyncio.create_task(self._watch()) if self.watch else None
+        self._status(f"Listening on {self.socket_path}")
+        self.ready.set()
+        try:
+            async with server:
+                await self._stopped.wait()
+        finally:
+            if watcher is not None:
+                watcher.cancel()
+                await asyncio.gather(watcher, return_exceptions=True)
+            await registry.aclose_loop()
+            if os.path.exists(self.socket_path):
+                os.unlink(self.socket_path)
+            self.ready.clear()
+
+    def stop(self) -> None:
+        """
+        Asks a running daemon to shut down; safe to call from any thread.
+        """
+        request({"command": "shutdown"}, self.socket_path)
+
+    async def docstringify(
+        self, paths: Iterable[str], *, since: str | None = None
+    ) -> dict:
+        """
+        Docstringifies files and directories, processing up to
+        `writer.max_concurrency` files at once.
+
+        Args:
+            paths (Iterable[str]): The files and directories to process.
+            since (str, optional): Only consider functions changed since this git
+                revision.
+
+        Returns:
+            dict: The number of `files` visited, docstring `insertions` and the
+                `errors` of files that could not be processed.
+        """
+        files: list[tuple[str, LineRanges]] = []
+        for path in map(os.path.abspath, paths):
+            changes = None
+            if since:
+                cwd = path if os.path.isdir(path) else os.path.dirname(path)
+                changes = await asyncio.to_thread(ChangeSet.from_git, since, cwd)
+            found = await asyncio.to_thread(
+                list, self.writer.iter_files(path, [0], changes=changes)
+            )
+            files += [(f, changes.line_ranges(f) if changes else None) for f in found]
+
+        semaphore = asyncio.Semaphore(self.writer.max_concurrency)
+
+        async def process(file_path: str, line_ranges: LineRanges) -> int | str:
+            async with semaphore:
+                try:
+                    return await self._docstringify_file(file_path, line_ranges)
+                except Exception as e:
+                    return f"{type(e).__name__}: {e}"
+
+        results = await asyncio.gather(*(process(*file) for file in files))
+        return {
+            "files": len(files),
+            "insertions": sum(r for r in results if isinstance(r, int)),
+            "errors": {f: r for (f, _), r in zip(files, results) if isinstance(r, str)},
+        }
+
+    async def _docstringify_file(self, file_path: str, line_ranges: LineRanges) -> int:
+        """
+        Docstringifies one file, never processing the same file twice at once.
+
+        Args:
+            file_path (str): The absolute path of the file.
+            line_ranges (LineRanges): Only functions overlapping these lines are
+                considered.
+
+        Returns:
+            int: The number of docstrings inserted.
+        """
+        async with self._file_lock(file_path):
+            n_insertions = await self.writer.docstringify_file_async(
+                file_path, verbosity=self.verbosity, line_ranges=line_ranges
+            )
+            # The update is written by now: remember it so the watcher does not
+            # take the daemon's own write for a save.
+            if (state := _state(file_path)) is not None:
+                self._files[file_path] = state
+        return n_insertions
+
+    @asynccontextmanager
+    async def _file_lock(self, file_path: str) -> AsyncIterator[None]:
+        """
+        Holds the lock of a file, dropping it once no request uses it any more.
+
+        Args:
+            file_path (str): The absolute path of the file.
+        """
+        lock, users = self._locks.get(file_path, (asyncio.Lock(), 0))
+        self._locks[file_path] = lock, users + 1
+        try:
+            async with lock:
+                yield
+        finally:
+            lock, users = self._locks[file_path]
+            if users == 1:
+                del self._locks[file_path]
+            else:
+                self._locks[file_path] = lock, users - 1
+
+    async def handle(self, message: dict) -> dict:
+        """
+        Executes one request.
+
+        Args:
+            message (dict): The request.
+
+        Returns:
+            dict: The response.
+        """
+        command = message.get("command")
+        if command == "ping":
+            return {"ok": True, "pid": os.getpid()}
+        if command == "stats":
+            return {"ok": True, **collector.summary()}
+        if command == "shutdown":
+            assert self._stopped is not None, "the daemon is not serving"
+            self._stopped.set()
+            return {"ok": True}
+        if command == "docstringify":
+            paths = message.get("paths") or []
+            if not paths:
+                return {"ok": False, "error": "`paths` is required"}
+            result = await self.docstringify(paths, since=message.get("since"))
+            return {"ok": True, **result}
+        return {"ok": False, "error": f"Unknown command: {command!r}"}
+
+    async def _serve_client(
+        self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter
+    ) -> None:
+        """
+        Answers the requests of one connection, one line each, until it closes.
+
+        Args:
+            reader (asyncio.StreamReader): The incoming side of the connection.
+            writer (asyncio.StreamWriter): The outgoing side of the connection.
+        """
+        try:
+            while line := await reader.readline():
+                try:
+                    response = await self.handle(json.loads(line))
+                except Exception as e:
+                    response = {"ok": False, "error": f"{type(e).__name__}: {e}"}
+                writer.write(json.dumps(response).encode("utf8") + b"\n")
+                await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+    async def _watch(self) -> None:
+        """
+        Polls the watched paths and docstringifies files whose mtime or size
+        changed, until cancelled.
+        """
+        await self._rescan()
+        while True:
+            await asyncio.sleep(self.interval)
+            if not (changed := await self._rescan()):
+                continue
+            result = await self.docstringify(changed)
+            for file_path, error in result["errors"].items():
+                self._status(f"Failed to docstringify {file_path}: {error}")
+
+    async def _rescan(self) -> list[str]:
+        """
+        Scans the watched paths and remembers the state of their files.
+
+        Returns:
+            list[str]: The files whose state changed since the previous scan.
+        """
+        before = dict(self._files)
+        current = await asyncio.to_thread(self._scan)
+        # A request may have written a file after the scan looked at it: keep the
+        # state stored for the daemon's own write, or it is taken for a save.
+        current.update(
+            (path, state)
+            for path, state in self._files.items()
+            if before.get(path) != state
+        )
+        changed = [
+            path for path, state in current.items() if self._files.get(path) != state
+        ]
+        self._files = current
+        return changed
+
+    def _scan(self) -> dict[str, FileState]:
+        """
+        Lists the files of the watched paths with their state.
+
+        Returns:
+            dict[str, FileState]: The state of every processable file.
+        """
+        files = {}
+        for path in self.watch:
+            for file_path in self.writer.iter_files(path, [0]):
+                if (state := _state(file_path)) is not None:
+                    files[file_path] = state
+        return files
+
+    def _claim_socket(self) -> None:
+        """
+        Removes a socket file left behind by a daemon that is no longer running.
+
+        Raises:
+            RuntimeError: If another daemon still listens on the socket.
+        """
+        if not os.path.exists(self.socket_path):
+            return
+        try:
+            request({"command": "ping"}, self.socket_path, timeout=1)
+        except (ConnectionError, OSError, RuntimeError, ValueError):
+            os.unlink(self.socket_path)
+            return
+        raise RuntimeError(f"A daemon is already listening on {self.socket_path}")
+
+    def _status(self, message: str) -> None:
+        """
+        Reports daemon events when running verbosely.
+
+        Args:
+            message (str): The message.
+        """
+        if self.verbosity > 0:
+            print(message, file=sys.stderr)
+
+
+def _state(file_path: str) -> FileState | None:
+    """
+    Returns the state the watcher compares to detect saves.
+
+    Args:
+        file_path (str): The path of the file.
+
+    Returns:
+        FileState | None: The mtime in nanoseconds and the size, or None if the file
+            is gone.
+    """
+    try:
+        stat = os.stat(file_path)
+    except OSError:
+        return None
+    return stat.st_mtime_ns, stat.st_size
@@ -1,30 +1,136 @@
+import asyncio
 import os
+import sys
+from contextlib import contextmanager
+from typing import Iterator, Sequence, TextIO
 
 from rich import print
+from tree_sitter import Tree
 
+from devtools import batching, config
+from devtools.file_input import (
+    FileTooLargeError,
+    Source,
+    peak_rss_mb,
+    read_source,
+    reset_peak_rss,
+)
+from devtools.file_output import WriteBehind, apply_update
+from devtools.incremental import ChangeSet, LineRanges, select_changed
+from devtools.lang_processor.function_declaration import FunctionDeclaration
 from devtools.lang_processor.lang_processor_interface import ILanguageProcessor
+from devtools.lang_processor.registry import ProcessorRegistry
 from devtools.llm.client_interface import IClient
+from devtools.metrics import collector, timed
+from devtools.scheduler import Budget, BudgetScheduler
+from devtools.walker import Walker
 
 
 class DocStringWriter:
 
     VERSION: str = "0.0.1"
 
-    def __init__(self, client: IClient, parser: ILanguageProcessor) -> None:
+    def __init__(
+        self,
+        client: IClient,
+        parser: ILanguageProcessor | ProcessorRegistry,
+        *,
+        max_concurrency: int = config.MAX_CONCURRENCY,
+        batch_token_budget: int = config.BATCH_TOKEN_BUDGET,
+        dynamic_max_tokens: bool = config.DYNAMIC_MAX_TOKENS,
+        diff_output: TextIO | None = None,
+        include: Sequence[str] = (),
+        exclude: Sequence[str] = (),
+        ignore_files: Sequence[str] = config.IGNORE_FILES,
+        deduplicate: bool = config.DEDUPLICATE,
+        max_file_bytes: int = config.MAX_FILE_BYTES,
+        mmap_file_bytes: int = config.MMAP_FILE_BYTES,
+        oversize_policy: str = config.OVERSIZE_POLICY,
+    ) -> None:
         """
         This initializer method is for setting up the client and parser attributes.
 
         Args:
             client (ClientInterface): An instance of a class that implements the
                 ClientInterface.
-            parser (LanguageParserInterface): An instance of a class that implements
-                the LanguageParserInterface.
+            parser (ILanguageProcessor | ProcessorRegistry): The processor of the
+                files to document, or a registry dispatching every file to the
+                processor of its language.
+            max_concurrency (int, optional): Maximum number of docstring requests in
+                flight at once for a single file. Defaults to `config.MAX_CONCURRENCY`.
+            batch_token_budget (int, optional): If positive, functions are packed into
+                multi-function requests of at most this many estimated input tokens.
+                Defaults to `config.BATCH_TOKEN_BUDGET`.
+            dynamic_max_tokens (bool, optional): Size the output budget of every
+                request from the shape of its functions instead of using the
+                client's default. Defaults to `config.DYNAMIC_MAX_TOKENS`.
+            diff_output (TextIO, optional): If given, files are left untouched and
+                their changes are streamed to this file as unified diffs instead.
+            include (Sequence[str], optional): If given, only files matching one of
+                these `.gitignore`-style globs, relative to the walked path, are
+                docstringified.
+            exclude (Sequence[str], optional): Globs of files and directories to
+                skip, in the same syntax.
+            ignore_files (Sequence[str], optional): Names of the ignore files honored
+                while walking directories. Defaults to `config.IGNORE_FILES`.
+            deduplicate (bool, optional): Request one docstring per function
+                fingerprint and reuse it for every copy of the function within a
+                run. Defaults to `config.DEDUPLICATE`.
+            max_file_bytes (int, optional): Size cap of source files; 0 disables it.
+                Defaults to `config.MAX_FILE_BYTES`.
+            mmap_file_bytes (int, optional): Source files of at least this size are
+                memory-mapped and parsed in chunks. Defaults to
+                `config.MMAP_FILE_BYTES`.
+            oversize_policy (str, optional): What to do with files above the cap:
+                `skip` them or raise an `error`. Defaults to
+                `config.OVERSIZE_POLICY`.
 
         Returns:
             None
         """
+        if max_concurrency < 1:
+            raise ValueError("`max_concurrency` must be at least 1")
+        if oversize_policy not in ("skip", "error"):
+            raise ValueError("`oversize_policy` must be `skip` or `error`")
+
         self.client = client
         self.parser = parser
+        self.processors = (
+            parser
+            if isinstance(parser, ProcessorRegistry)
+            else ProcessorRegistry([parser])
+        )
+        self.max_concurrency = max_concurrency
+        self.batch_token_budget = batch_token_budget
+        self.dynamic_max_tokens = dynamic_max_tokens
+        self.diff_output = diff_output
+        self.include = tuple(include)
+        self.exclude = tuple(exclude)
+        self.ignore_files = tuple(ignore_files)
+        self.deduplicate = deduplicate
+        self.max_file_bytes = max_file_bytes
+        self.mmap_file_bytes = mmap_file_bytes
+        self.oversize_policy = oversize_policy
+        # Status messages go to stderr while diffs are streamed, keeping them clean.
+        self._status = sys.stderr if diff_output is not None else None
+        # The write-behind thread of the running `docstringify`, see `write_behind`.
+        self._output: WriteBehind | None = None
+        # Number of functions never sent to the model because they already had a
+        # docstring.
+        self.skipped_calls = 0
+        # Number of functions never sent to the model because a copy of them was.
+        self.deduplicated_calls = 0
+        # Docstring of every fingerprint requested in the running event loop, see
+        # `generate_docstrings_async`.
+        self._shared: dict[str, asyncio.Future] = {}
+        self._shared_loop: asyncio.AbstractEventLoop | None = None
+
+    @property
+    def status(self) -> TextIO | None:
+        """
+        TextIO | None: The stream status messages are printed to; None for stdout.
+        """
+        return self._status
 
     def generate_docstring(self, function_text: str) -> str:
         """
@@ -39,7 +145,267 @@ class DocStringWriter:
         prompt = f"```\n{function_text}\n```"
         return self.client.send_prompt(prompt)
 
-    def docstringify(self, file_or_path: str, *, verbosity: int = 0) -> tuple[int, int]:
+    @timed("llm")
+    async def generate_docstring_async(
+        self,
+        function_text: str,
+        max_tokens: int | None = None,
+        system_prompt: str | None = None,
+    ) -> str:
+        """
+        Async counterpart of `generate_docstring`.
+
+        Args:
+            function_text (str): The text of the python function.
+            max_tokens (int, optional): The output budget of the request. Defaults to
+                the client's.
+            system_prompt (str, optional): The system prompt of the request. Defaults
+                to the client's.
+
+        Returns:
+            str: The docstring generated from the applied input function text.
+        """
+        prompt = f"```\n{function_text}\n```"
+        options = {}
+        if max_tokens is not None:
+            options["max_tokens"] = max_tokens
+        if system_prompt is not None:
+            options["system_prompt"] = system_prompt
+        return await self.client.send_prompt_async(prompt, **options)
+
+    async def generate_docstrings_async(
+        self,
+        functions: list[str],
+        *,
+        max_tokens: list[int] | None = None,
+        fingerprints: list[str | None] | None = None,
+        processor: ILanguageProcessor | None = None,
+        semaphore: asyncio.Semaphore | None = None,
+    ) -> list[str]:
+        """
+        Generates docstrings for all functions concurrently.
+
+        Functions sharing a fingerprint with a function requested earlier in the
+        same event loop, by this or a concurrent call, are not sent again: they wait
+        for the docstring of the first copy instead.
+
+        Args:
+            functions (list[str]): The function texts to document.
+            max_tokens (list[int], optional): The output budget of every function,
+                see `prompt_inputs`. Defaults to the client's.
+            fingerprints (list[str | None], optional): The fingerprint of every
+                function, see `FunctionDeclaration.fingerprint`. Functions without
+                one are always requested.
+            processor (ILanguageProcessor, optional): The processor of the functions'
+                language, which supplies the system prompts. Defaults to the client's
+                system prompt.
+            semaphore (asyncio.Semaphore, optional): Limits the number of requests in
+                flight. A new one sized by `max_concurrency` is used if omitted.
+
+        Returns:
+            list[str]: The docstrings, in the same order as `functions`.
+        """
+        budgets: list[int | None] = (
+            [None] * len(functions) if max_tokens is None else list(max_tokens)
+        )
+        if not self.deduplicate or fingerprints is None:
+            return await self._request_docstrings(
+                functions, budgets, processor, semaphore
+            )
+
+        loop = asyncio.get_running_loop()
+        if self._shared_loop is not loop:
+            self._shared, self._shared_loop = {}, loop
+        requested: list[int] = []
+        # Index of every function requested first -> its fingerprint and result.
+        owned: dict[int, tuple[str, asyncio.Future]] = {}
+        copies: dict[int, asyncio.Future] = {}
+        for i, fingerprint in enumerate(fingerprints):
+            if fingerprint is None:
+                requested.append(i)
+            elif (future := self._shared.get(fingerprint)) is not None:
+                copies[i] = future
+            else:
+                requested.append(i)
+                owned[i] = fingerprint, loop.create_future()
+                self._shared[fingerprint] = owned[i][1]
+        self.deduplicated_calls += len(copies)
+        collector.count("deduplicated_calls", len(copies))
+
+        try:
+            results = await self._request_docstrings(
+                [functions[i] for i in requested],
+                [budgets[i] for i in requested],
+                processor,
+                semaphore,
+            )
+        except BaseException as e:
+            for fingerprint, future in owned.values():
+                # Later copies request the function again.
+                del self._shared[fingerprint]
+                if isinstance(e, asyncio.CancelledError):
+                    future.cancel()
+                else:
+                    future.set_exception(e)
+                    # Mark the exception as retrieved even if no copy awaits it.
+                    future.exception()
+            raise
+
+        docstrings = [""] * len(functions)
+        for i, docstring in zip(requested, results):
+            docstrings[i] = docstring
+            if i in owned:
+                owned[i][1].set_result(docstring)
+        for i, future in copies.items():
+            docstrings[i] = await future
+
+        return docstrings
+
+    async def _request_docstrings(
+        self,
+        functions: list[str],
+        max_tokens: list[int | None],
+        processor: ILanguageProcessor | None,
+        semaphore: asyncio.Semaphore | None,
+    ) -> list[str]:
+        """
+        Requests the docstrings of functions, one request per function or packed
+        into batches, see `generate_docstrings_async`.
+
+        Args:
+            functions (list[str]): The function texts to document.
+            max_tokens (list[int | None]): The output budget of every function.
+            processor (ILanguageProcessor | None): Supplies the system prompts.
+            semaphore (asyncio.Semaphore | None): Limits the requests in flight.
+
+        Returns:
+            list[str]: The docstrings, in the same order as `functions`.
+        """
+        if semaphore is None:
+            semaphore = asyncio.Semaphore(self.max_concurrency)
+        system_prompt = self.system_prompt_for(processor)
+
+        async def bounded(i: int) -> str:
+            async with semaphore:
+                return await self.generate_docstring_async(
+                    functions[i], max_tokens[i], system_prompt
+                )
+
+        if self.batch_token_budget <= 0:
+            return list(await asyncio.gather(*map(bounded, range(len(functions)))))
+
+        async def bounded_batch(batch: list[int]) -> list[str]:
+            budgets = [b for i in batch if (b := max_tokens[i]) is not None]
+            async with semaphore:
+                docstrings = await self.generate_batch_async(
+                    [functions[i] for i in batch],
+                    budgets if len(budgets) == len(batch) else None,
+                    processor.batch_system_prompt() if processor else None,
+                )
+            if docstrings is None:
+                # Fall back to one request per function.
+                docstrings = await asyncio.gather(*map(bounded, batch))
+            return list(docstrings)
+
+        batches = batching.pack_batches(functions, self.batch_token_budget)
+        results = await asyncio.gather(*map(bounded_batch, batches))
+        docstrings = [""] * len(functions)
+        for batch, batch_docstrings in zip(batches, results):
+            for i, docstring in zip(batch, batch_docstrings):
+                docstrings[i] = docstring
+
+        return docstrings
+
+    def system_prompt_for(self, processor: ILanguageProcessor | None) -> str | None:
+        """
+        Returns the system prompt of single-function requests: the prompt of the
+        language of the file, unless the client has a system prompt configured.
+
+        Args:
+            processor (ILanguageProcessor | None): The processor of the file.
+
+        Returns:
+            str | None: The system prompt, or None to use the client's.
+        """
+        if processor is None or getattr(self.client, "system_prompt_configured", False):
+            return None
+        return processor.system_prompt()
+
+    @timed("llm_batch")
+    async def generate_batch_async(
+        self,
+        functions: list[str],
+        max_tokens: list[int] | None = None,
+        system_prompt: str | None = None,
+    ) -> list[str] | None:
+        """
+        Generates the docstrings of several functions with a single request.
+
+        Args:
+            functions (list[str]): The function texts of the batch.
+            max_tokens (list[int], optional): The output budget of every function.
+                Defaults to `config.BATCH_MAX_TOKENS_PER_FUNCTION` each.
+            system_prompt (str, optional): The system prompt asking for a JSON object
+                of docstrings. Defaults to a language-agnostic one.
+
+        Returns:
+            list[str] | None: The docstrings in batch order, or None if the response
+                could not be unpacked.
+        """
+        response = await self.client.send_prompt_async(
+            batching.build_batch_prompt(functions),
+            system_prompt=system_prompt or config.batch_system_prompt("programming"),
+            response_format={"type": "json_object"},
+            max_tokens=(
+                sum(max_tokens)
+                if max_tokens is not None
+                else config.BATCH_MAX_TOKENS_PER_FUNCTION * len(functions)
+            ),
+        )
+        try:
+            return batching.parse_batch_response(response, len(functions))
+        except ValueError as e:
+            print(
+                f"[yellow]Retrying batch one function at a time: {e}[/yellow]",
+                file=self._status,
+            )
+            return None
+
+    def prompt_inputs(
+        self, functions: list[FunctionDeclaration]
+    ) -> tuple[list[str], list[int] | None]:
+        """
+        Builds the (compacted) prompt texts and output budgets of functions and
+        records their size in the metrics.
+
+        Args:
+            functions (list[FunctionDeclaration]): The functions to document.
+
+        Returns:
+            tuple[list[str], list[int] | None]: The prompt text of every function and,
+                if `dynamic_max_tokens` is set, its output budget.
+        """
+        texts = [f.prompt_text for f in functions]
+        collector.count("prompt_chars", sum(map(len, texts)))
+        collector.count(
+            "elided_lines", sum(n for f in functions for *_, n in f.elisions)
+        )
+        collector.count("compacted_functions", sum(bool(f.elisions) for f in functions))
+        if not self.dynamic_max_tokens:
+            return texts, None
+
+        max_tokens = [batching.estimate_max_tokens(f) for f in functions]
+        collector.count("max_tokens_requested", sum(max_tokens))
+        return texts, max_tokens
+
+    def docstringify(
+        self,
+        file_or_path: str,
+        *,
+        verbosity: int = 0,
+        changes: ChangeSet | None = None,
+        budget: Budget | None = None,
+    ) -> tuple[int, int]:
         """
         Traverses the directory or file given by 'file_or_path' and applies docstring insertion
         to all python files. If 'file_or_path' is a directory, recursively explores it to find
@@ -49,65 +415,442 @@ class DocStringWriter:
             file_or_path (str): A path to a directory or file.
             verbosity (int, optional): If set to a non-zero value, provides additional
                 operation details. Default is 0.
+            changes (ChangeSet, optional): If given, only the changed files below
+                'file_or_path' are visited and only the functions overlapping their
+                changed lines are considered.
+            budget (Budget, optional): If given, the most valuable functions are
+                documented first and the run stops once the budget is spent, see
+                `BudgetScheduler`.
 
         Returns:
             tuple[int, int]: A tuple where the first element is the number of directories
                 traversed and the second element is the number of docstring insertions
                 performed.
         """
-        if os.path.isdir(file_or_path):
-            n_dirs = 1
+        return asyncio.run(
+            self.docstringify_async(
+                file_or_path, verbosity=verbosity, changes=changes, budget=budget
+            )
+        )
+
+    async def docstringify_async(
+        self,
+        file_or_path: str,
+        *,
+        verbosity: int = 0,
+        changes: ChangeSet | None = None,
+        budget: Budget | None = None,
+    ) -> tuple[int, int]:
+        """
+        Async counterpart of `docstringify`. All files are processed in one event
+        loop, so the pooled connections of the client are reused across files;
+        they are closed once the run is done.
+
+        Args:
+            file_or_path (str): A path to a directory or file.
+            verbosity (int, optional): If set to a non-zero value, provides additional
+                operation details. Default is 0.
+            changes (ChangeSet, optional): Restricts the run to changed files and lines.
+            budget (Budget, optional): Limits the run, see `docstringify`.
+
+        Returns:
+            tuple[int, int]: The number of directories traversed and the number of
+                docstring insertions performed.
+        """
+        from devtools.llm import registry
+
+        try:
+            if budget is not None:
+                scheduler = BudgetScheduler(self, budget)
+                return await scheduler.run(
+                    file_or_path, verbosity=verbosity, changes=changes
+                )
+
+            n_dirs = [0]
             n_insertions = 0
-            for f in os.listdir(file_or_path):
-                di, ni = self.docstringify(os.path.join(file_or_path, f))
-                n_dirs += di
-                n_insertions += ni
-            return n_dirs, n_insertions
+            with self.write_behind():
+                files = self.iter_files(
+                    file_or_path, n_dirs, changes=changes, verbosity=verbosity
+                )
+                for file_path in files:
+                    n_insertions += await self.docstringify_file_async(
+                        file_path,
+                        verbosity=verbosity,
+                        line_ranges=(
+                            changes.line_ranges(file_path) if changes else None
+                        ),
+                    )
+        finally:
+            await registry.aclose_loop()
+
+        return n_dirs[0], n_insertions
+
+    @contextmanager
+    def write_behind(self) -> Iterator[WriteBehind]:
+        """
+        Hands the updated files of `write_result` to a write-behind thread until the
+        block is left, which waits for the pending writes.
+
+        Yields:
+            WriteBehind: The running writer.
+        """
+        with WriteBehind(diff=self.diff_output) as output:
+            self._output = output
+            try:
+                yield output
+            finally:
+                self._output = None
+
+    def iter_files(
+        self,
+        file_or_path: str,
+        n_dirs: list[int],
+        *,
+        changes: ChangeSet | None = None,
+        verbosity: int = 0,
+    ) -> Iterator[str]:
+        """
+        Yields the files below `file_or_path` that any language processor accepts,
+        in a single walk. Ignored and excluded directories are pruned without being
+        entered, see `Walker`.
+
+        Args:
+            file_or_path (str): A path to a directory or file.
+            n_dirs (list[int]): Single-element counter of traversed directories.
+            changes (ChangeSet, optional): If given, only changed files are yielded
+                and no directories are traversed.
+            verbosity (int, optional): If set to a non-zero value, reports the
+                number of pruned directories. Default is 0.
+
+        Yields:
+            str: The path of a file to docstringify.
+        """
+        walker = self.walker(file_or_path)
+        if changes is not None:
+            for file_path in changes.paths(file_or_path):
+                if walker.selects(file_path):
+                    yield file_path
+            return
 
-        elif os.path.isfile(file_or_path) and self.parser.verify_extension(
-            file_or_path
-        ):
-            return 0, self.docstringify_file(file_or_path, verbosity=verbosity)
+        start = n_dirs[0]
+        for file_path in walker:
+            n_dirs[0] = start + walker.n_dirs
+            yield file_path
+        n_dirs[0] = start + walker.n_dirs
 
-        return 0, 0
+        collector.count("dirs_walked", walker.n_dirs)
+        collector.count("dirs_pruned", walker.n_pruned)
+        if verbosity > 0 and walker.n_pruned:
+            print(
+                f"Skipped {walker.n_pruned} ignored directories below {file_or_path}",
+                file=self._status,
+            )
 
-    def docstringify_file(self, file_path: str, *, verbosity: int = 0) -> int:
+    def walker(self, file_or_path: str) -> Walker:
+        """
+        Creates the walker of a path with the writer's file selection.
+
+        Args:
+            file_or_path (str): A path to a directory or file.
+
+        Returns:
+            Walker: The walker.
+        """
+        return Walker(
+            file_or_path,
+            accept=self.processors.handles,
+            include=self.include,
+            exclude=self.exclude,
+            ignore_files=self.ignore_files,
+        )
+
+    def docstringify_file(
+        self,
+        file_path: str,
+        *,
+        verbosity: int = 0,
+        line_ranges: LineRanges = None,
+    ) -> int:
         """
         Generates and writes docstrings into a python source code file.
 
         Args:
             file_path (str): The path to the source code file.
             verbosity (int, optional): The verbosity level of the output. Defaults to 0.
+            line_ranges (LineRanges, optional): Only functions overlapping these
+                zero-based line ranges are considered. Defaults to the whole file.
 
         Returns:
             int: The number of docstrings inserted into the source code.
         """
-        with open(file_path, "r") as f:
-            source_code = f.read()
-        # Parse the source code file
-        root_node = self.parser.to_ast(source_code)
+        from devtools.llm import registry
+
+        async def run() -> int:
+            try:
+                return await self.docstringify_file_async(
+                    file_path, verbosity=verbosity, line_ranges=line_ranges
+                )
+            finally:
+                await registry.aclose_loop()
+
+        return asyncio.run(run())
 
-        # Extract function declarations
-        functions = self.parser.extract_function_declarations(root_node)
+    async def docstringify_file_async(
+        self,
+        file_path: str,
+        *,
+        verbosity: int = 0,
+        line_ranges: LineRanges = None,
+    ) -> int:
+        """
+        Generates and writes docstrings into a python source code file, requesting
+        the docstrings of all its functions concurrently. Reading, parsing,
+        insertion and the write run on a worker thread, so a large file does not
+        stall the event loop.
+
+        Args:
+            file_path (str): The path to the source code file.
+            verbosity (int, optional): The verbosity level of the output. Defaults to 0.
+            line_ranges (LineRanges, optional): Only functions overlapping these
+                zero-based line ranges are considered. Defaults to the whole file.
+
+        Returns:
+            int: The number of docstrings inserted into the source code.
+
+        Raises:
+            ValueError: If no language processor accepts the file.
+        """
+        processor = self.processor_for(file_path)
+        parsed = await asyncio.to_thread(
+            self._parse_file, file_path, processor, line_ranges, verbosity
+        )
+        if parsed is None:
+            return 0
+        source_code, tree, undocumented = parsed
 
         # Generate docstrings for each function
-        docstrings = [self.generate_docstring(text) for text in functions]
+        texts, max_tokens = self.prompt_inputs(undocumented)
+        docstrings = await self.generate_docstrings_async(
+            texts,
+            max_tokens=max_tokens,
+            fingerprints=[f.fingerprint for f in undocumented],
+            processor=processor,
+        )
+
+        return await asyncio.to_thread(
+            self._write_file,
+            file_path,
+            processor,
+            source_code,
+            tree,
+            undocumented,
+            docstrings,
+            verbosity,
+        )
+
+    def _parse_file(
+        self,
+        file_path: str,
+        processor: ILanguageProcessor,
+        line_ranges: LineRanges,
+        verbosity: int,
+    ) -> tuple[Source, Tree, list[FunctionDeclaration]] | None:
+        """
+        Reads and parses a file and extracts the functions that still need a
+        docstring; the first half of `docstringify_file_async`.
+
+        Args:
+            file_path (str): The path to the source code file.
+            processor (ILanguageProcessor): The processor of the file.
+            line_ranges (LineRanges): Only functions overlapping these lines are
+                considered.
+            verbosity (int): The verbosity level of the output.
+
+        Returns:
+            tuple[Source, Tree, list[FunctionDeclaration]] | None: The source, its
+                tree and the undocumented functions, or None if the file was
+                skipped for its size.
+        """
+        reset_peak_rss()
+        try:
+            with collector.stage("read"):
+                source_code = read_source(
+                    file_path,
+                    max_bytes=self.max_file_bytes,
+                    mmap_bytes=self.mmap_file_bytes,
+                )
+        except FileTooLargeError as e:
+            self.record_oversize(file_path, e, verbosity=verbosity)
+            return None
+        # Parse the source code file
+        tree = processor.parse(source_code)
+        root_node = tree.root_node
+
+        # Extract function declarations that still need a docstring
+        functions = select_changed(
+            processor.extract_function_declarations(root_node, source_code),
+            line_ranges,
+        )
+        undocumented = [f for f in functions if not f.has_docstring]
+        self.record_skipped(
+            file_path, len(functions) - len(undocumented), verbosity=verbosity
+        )
+        return source_code, tree, undocumented
+
+    def _write_file(
+        self,
+        file_path: str,
+        processor: ILanguageProcessor,
+        source_code: Source,
+        tree: Tree,
+        undocumented: list[FunctionDeclaration],
+        docstrings: list[str],
+        verbosity: int,
+    ) -> int:
+        """
+        Inserts the generated docstrings and writes the result; the second half of
+        `docstringify_file_async`.
 
+        Args:
+            file_path (str): The path to the source code file.
+            processor (ILanguageProcessor): The processor of the file.
+            source_code (Source): The source the functions were extracted from.
+            tree (Tree): The tree of the source.
+            undocumented (list[FunctionDeclaration]): The functions to document.
+            docstrings (list[str]): The docstring of each undocumented function.
+            verbosity (int): The verbosity level of the output.
+
+        Returns:
+            int: The number of docstrings inserted into the source code.
+        """
         # Insert docstrings into the source code
-        updated_code, n_insertions = self.parser.insert_docstrings(
-            source_code, functions, docstrings
+        updated_code, n_insertions = processor.insert_docstrings(
+            source_code, undocumented, docstrings, tree=tree
         )
 
-        # Write the updated code back to the file
-        if n_insertions > 0:
-            with open(file_path, "w") as file:
-                file.write(updated_code)
+        n_insertions = self.write_result(
+            file_path,
+            updated_code,
+            n_insertions,
+            verbosity=verbosity,
+            original=source_code,
+        )
+        self.record_peak_rss(file_path, peak_rss_mb(), verbosity=verbosity)
+        return n_insertions
+
+    def processor_for(self, file_path: str) -> ILanguageProcessor:
+        """
+        Returns the language processor of a file.
+
+        Args:
+            file_path (str): The path to the source code file.
+
+        Returns:
+            ILanguageProcessor: The processor, created on first use.
+
+        Raises:
+            ValueError: If no language processor accepts the file.
+        """
+        if (processor := self.processors.processor_for(file_path)) is None:
+            raise ValueError(f"No language processor accepts {file_path}")
+        return processor
+
+    def record_skipped(self, file_path: str, n_skipped: int, *, verbosity: int = 0):
+        """
+        Counts functions that were not sent to the model because they are already
+        documented.
+
+        Args:
+            file_path (str): The path to the source code file.
+            n_skipped (int): The number of already documented functions in the file.
+            verbosity (int, optional): The verbosity level of the output. Defaults to 0.
+        """
+        self.skipped_calls += n_skipped
+        collector.count("functions_skipped", n_skipped)
+        if n_skipped > 0 and verbosity > 0:
+            print(
+                f"Skipped {n_skipped} already documented functions in {file_path}.",
+                file=self._status,
+            )
+
+    def record_oversize(
+        self, file_path: str, error: FileTooLargeError, *, verbosity: int = 0
+    ) -> None:
+        """
+        Applies the oversize policy to a file above the size cap.
 
+        Args:
+            file_path (str): The path to the source code file.
+            error (FileTooLargeError): The error raised when reading the file.
+            verbosity (int, optional): The verbosity level of the output. Defaults to 0.
+
+        Raises:
+            FileTooLargeError: If the policy is `error`.
+        """
+        if self.oversize_policy == "error":
+            raise error
+        collector.count("files_oversize")
+        if verbosity > 0:
+            print(f"[yellow]Skipped {error}.[/yellow]", file=self._status)
+
+    def record_peak_rss(
+        self, file_path: str, peak_mb: float, *, verbosity: int = 0
+    ) -> None:
+        """
+        Records the peak resident set size reached while processing a file.
+
+        Args:
+            file_path (str): The path to the source code file.
+            peak_mb (float): The peak RSS in MiB.
+            verbosity (int, optional): Reported per file from level 2 on.
+        """
+        collector.maximum("peak_rss_mb", peak_mb)
+        if verbosity > 1:
+            print(f"Peak RSS {peak_mb:.1f} MiB for {file_path}.", file=self._status)
+
+    def write_result(
+        self,
+        file_path: str,
+        updated_code: str,
+        n_insertions: int,
+        *,
+        verbosity: int = 0,
+        original: Source | None = None,
+    ) -> int:
+        """
+        Writes the updated code back to the file if anything was inserted and reports
+        the outcome. During `docstringify` the write is queued on the write-behind
+        thread; with `diff_output` set a diff is emitted instead.
+
+        Args:
+            file_path (str): The path to the source code file.
+            updated_code (str): The source code with docstrings inserted.
+            n_insertions (int): The number of docstrings inserted into the source code.
+            verbosity (int, optional): The verbosity level of the output. Defaults to 0.
+            original (Source, optional): The source the update is based on, used for
+                diffs. Read from the file if omitted.
+
+        Returns:
+            int: The number of docstrings inserted into the source code.
+        """
+        collector.count("files")
+        collector.count("docstrings_inserted", n_insertions)
+        # Write the updated code back to the file
+        if n_insertions > 0 and self._output is not None:
+            self._output.submit(file_path, original, updated_code)
+        elif n_insertions > 0:
+            apply_update(file_path, original, updated_code, diff=self.diff_output)
         if n_insertions > 1:
-            print(f"Automagically generated {n_insertions} docstrings in {file_path}.")
+            print(
+                f"Automagically generated {n_insertions} docstrings in {file_path}.",
+                file=self._status,
+            )
         elif n_insertions == 1:
-            print(f"Automagically generated {n_insertions} docstring in {file_path}.")
+            print(
+                f"Automagically generated {n_insertions} docstring in {file_path}.",
+                file=self._status,
+            )
         elif verbosity > 0:
-            print(f"No docstrings generated in {file_path}.")
+            print(f"No docstrings generated in {file_path}.", file=self._status)
 
         return n_insertions
@@ -0,0 +1,93 @@
+"""
+Reading source files with bounded memory: large files are memory-mapped instead
+of copied onto the heap, files above a size cap are refused, and the peak resident
+set size can be measured per file.
+"""
+
+import mmap
+import os
+import resource
+import sys
+
+from devtools import config
+
+# A source buffer: the bytes of a small file or the read-only map of a large one.
+# Both support slicing, `find`/`rfind` and `memoryview`.
+Source = bytes | mmap.mmap
+
+
+class FileTooLargeError(ValueError):
+    """
+    Raised for files above the size cap when the oversize policy is `error`.
+    """
+
+
+def read_source(
+    file_path: str,
+    *,
+    max_bytes: int = config.MAX_FILE_BYTES,
+    mmap_bytes: int = config.MMAP_FILE_BYTES,
+) -> Source:
+    """
+    Reads a source file, memory-mapping it if it is large. The map is released when
+    the last reference to it goes away, so it may outlive this call, e.g. in the
+    function declarations pointing into it. Atomic replacements of the file leave
+    the map intact; truncating the file in place while it is mapped does not.
+
+    Args:
+        file_path (str): The file to read.
+        max_bytes (int, optional): Larger files are refused; 0 disables the cap.
+        mmap_bytes (int, optional): Files of at least this size are memory-mapped;
+            0 always reads files onto the heap.
+
+    Returns:
+        Source: The content of the file.
+
+    Raises:
+        FileTooLargeError: If the file is larger than `max_bytes`.
+    """
+    with open(file_path, "rb") as f:
+        size = os.fstat(f.fileno()).st_size
+        if max_bytes > 0 and size > max_bytes:
+            raise FileTooLargeError(
+                f"{file_path} is {size} bytes, above the cap of {max_bytes} bytes"
+            )
+        if mmap_bytes > 0 and size >= mmap_bytes:
+            return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        return f.read()
+
+
+def reset_peak_rss() -> bool:
+    """
+    Resets the peak resident set size of this process, so `peak_rss_mb` measures
+    from now on. Only supported on Linux.
+
+    Returns:
+        bool: True if the peak was reset.
+    """
+    try:
+        with open("/proc/self/clear_refs", "w") as f:
+            f.write("5")
+        return True
+    except OSError:
+        return False
+
+
+def peak_rss_mb() -> float:
+    """
+    Returns the peak resident set size of this process since it started or since
+    the last `reset_peak_rss`.
+
+    Returns:
+        float: The peak RSS in MiB.
+    """
+    try:
+        with open("/proc/self/status", "rb") as f:
+            for line in f:
+                if line.startswith(b"VmHWM:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    # ru_maxrss is in KiB on Linux but in bytes on macOS, and never resets.
+    unit = 1 if sys.platform == "darwin" else 1024
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * unit / 2**20
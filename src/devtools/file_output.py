@@ -0,0 +1,218 @@
+"""
+Applying updated source files: atomic in-place writes or unified diffs, done on a
+write-behind thread so disk I/O stays off the processing path.
+"""
+
+import difflib
+import os
+import queue
+import stat
+import sys
+import tempfile
+import threading
+from typing import TextIO
+
+from rich import print
+
+from devtools.file_input import Source
+from devtools.metrics import timed
+
+# Sentinel telling the writer thread to stop.
+_STOP = None
+
+
+def write_atomic(file_path: str, content: str) -> None:
+    """
+    Replaces a file's content through a temporary file in the same directory, so
+    an interrupted write never leaves a truncated file behind. The file mode of the
+    original file is preserved, and symbolic links are written through rather than
+    replaced.
+
+    Args:
+        file_path (str): The file to replace.
+        content (str): The new content.
+    """
+    file_path = os.path.realpath(file_path)
+    fd, tmp_path = tempfile.mkstemp(
+        dir=os.path.dirname(file_path),
+        prefix=f".{os.path.basename(file_path)}.",
+        suffix=".tmp",
+    )
+    try:
+        with os.fdopen(fd, "w", encoding="utf8", newline="") as f:
+            f.write(content)
+            f.flush()
+            os.fsync(f.fileno())
+        if os.path.exists(file_path):
+            mode = stat.S_IMODE(os.stat(file_path).st_mode)
+        else:
+            # New files get the usual permissions rather than those of mkstemp.
+            umask = os.umask(0)
+            os.umask(umask)
+            mode = 0o666 & ~umask
+        os.chmod(tmp_path, mode)
+        os.replace(tmp_path, file_path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+
+
+def unified_diff(file_path: str, original: str, updated: str) -> str:
+    """
+    Renders the change of a file as a unified diff that `git apply` and `patch -p1`
+    accept.
+
+    Args:
+        file_path (str): The changed file; shown relative to the working directory.
+        original (str): The content before the change.
+        updated (str): The content after the change.
+
+    Returns:
+        str: The diff, empty if nothing changed.
+    """
+    path = os.path.relpath(file_path).replace(os.sep, "/")
+    lines = difflib.unified_diff(
+        original.splitlines(keepends=True),
+        updated.splitlines(keepends=True),
+        fromfile=f"a/{path}",
+        tofile=f"b/{path}",
+    )
+    return "".join(
+        line if line.endswith("\n") else f"{line}\n\\ No newline at end of file\n"
+        for line in lines
+    )
+
+
+class WriteBehind:
+    """
+    Applies file updates on a dedicated thread, either writing them atomically or
+    streaming them as unified diffs without touching the tree.
+
+    Use it as a context manager: leaving the block waits for every pending update,
+    also when the run is interrupted, and re-raises the first failed update.
+    """
+
+    def __init__(self, *, diff: TextIO | None = None, max_pending: int = 64) -> None:
+        """
+        Args:
+            diff (TextIO, optional): If given, updates are written to this stream as
+                unified diffs instead of being applied to the files.
+            max_pending (int, optional): Updates queued before `submit` blocks.
+        """
+        self.diff = diff
+        self._queue: queue.Queue = queue.Queue(maxsize=max_pending)
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._errors: list[BaseException] = []
+
+    def __enter__(self) -> "WriteBehind":
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+    def submit(self, file_path: str, original: Source | None, updated: str) -> None:
+        """
+        Queues an update, blocking while too many updates are pending.
+
+        Args:
+            file_path (str): The file to update.
+            original (Source | None): The content the update is based on, used for
+                diffs. Read from the file if omitted.
+            updated (str): The new content.
+
+        Raises:
+            RuntimeError: If the writer has already been closed.
+        """
+        if not self._thread.is_alive():
+            raise RuntimeError("the write-behind thread is not running")
+        self._queue.put((file_path, original, updated))
+
+    def close(self) -> None:
+        """
+        Waits for the pending updates and stops the writer thread.
+
+        Raises:
+            Exception: The first error raised by an update.
+        """
+        if self._thread.is_alive():
+            self._queue.put(_STOP)
+            self._thread.join()
+        if self._errors:
+            raise self._errors[0]
+
+    def _run(self) -> None:
+        """
+        Applies queued updates until the stop sentinel arrives.
+        """
+        while (item := self._queue.get()) is not _STOP:
+            try:
+                apply_update(*item, diff=self.diff)
+            except Exception as e:
+                self._errors.append(e)
+
+
+@timed("write")
+def apply_update(
+    file_path: str, original: Source | None, updated: str, *, diff: TextIO | None = None
+) -> bool:
+    """
+    Writes an updated file atomically, or its unified diff to `diff`.
+
+    A file whose content no longer matches `original`, e.g. because it was saved
+    in an editor while its docstrings were generated, is left alone.
+
+    Args:
+        file_path (str): The file to update.
+        original (Source | None): The content the update is based on, used for
+            diffs. Read from the file if omitted.
+        updated (str): The new content.
+        diff (TextIO, optional): Stream to write the diff to instead of the file.
+
+    Returns:
+        bool: False if the file changed since `original` was read.
+    """
+    if diff is None:
+        if original is not None and _changed(file_path, original):
+            print(
+                f"[yellow]{file_path} changed while its docstrings were generated;"
+                " not updated.[/yellow]",
+                file=sys.stderr,
+            )
+            return False
+        write_atomic(file_path, updated)
+        return True
+
+    if original is None:
+        with open(file_path, "rb") as f:
+            original = f.read()
+    diff.write(unified_diff(file_path, str(memoryview(original), "utf8"), updated))
+    diff.flush()
+    return True
+
+
+def _changed(file_path: str, original: Source) -> bool:
+    """
+    Checks whether a file's content differs from what it was, comparing in chunks
+    so large files are never read whole.
+
+    Args:
+        file_path (str): The file.
+        original (Source): The expected content.
+
+    Returns:
+        bool: True if the file was modified or removed.
+    """
+    expected = memoryview(original)
+    try:
+        with open(file_path, "rb") as f:
+            if os.fstat(f.fileno()).st_size != len(expected):
+                return True
+            position = 0
+            while chunk := f.read(1 << 20):
+                if expected[position : position + len(chunk)] != chunk:
+                    return True
+                position += len(chunk)
+    except OSError:
+        return True
+    return False
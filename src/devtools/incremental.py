@@ -0,0 +1,234 @@
+import hashlib
+import json
+import os
+import re
+import subprocess
+from typing import Iterable
+
+from devtools.lang_processor.function_declaration import FunctionDeclaration
+
+# Inclusive, zero-based line ranges; None means every line of the file changed.
+LineRanges = list[tuple[int, int]] | None
+
+_HUNK_HEADER = re.compile(r"^@@ -\d+(?:,\d+)? \+(\d+)(?:,(\d+))? @@")
+
+
+class ChangeSet:
+    """
+    The files (and, where known, the lines of those files) that changed since the
+    previous run. Incremental runs only consider the functions it touches.
+    """
+
+    def __init__(self, files: dict[str, LineRanges]) -> None:
+        """
+        Args:
+            files (dict[str, LineRanges]): Maps absolute file paths to the changed
+                line ranges, or None if the whole file should be considered.
+        """
+        self.files = files
+
+    def __contains__(self, file_path: str) -> bool:
+        return os.path.abspath(file_path) in self.files
+
+    def __len__(self) -> int:
+        return len(self.files)
+
+    def paths(self, below: str | None = None) -> list[str]:
+        """
+        Lists the changed files that still exist, optionally restricted to a path.
+
+        Args:
+            below (str, optional): Only return files at or below this path.
+
+        Returns:
+            list[str]: The sorted absolute paths of changed files.
+        """
+        root = os.path.abspath(below) if below is not None else None
+        return sorted(
+            path
+            for path in self.files
+            if os.path.isfile(path)
+            and (root is None or path == root or path.startswith(root + os.sep))
+        )
+
+    def line_ranges(self, file_path: str) -> LineRanges:
+        """
+        Returns the changed line ranges of a file.
+
+        Args:
+            file_path (str): The path to the file.
+
+        Returns:
+            LineRanges: The changed ranges, or None if the whole file changed.
+        """
+        return self.files.get(os.path.abspath(file_path))
+
+    @classmethod
+    def from_git(cls, base: str, cwd: str = ".") -> "ChangeSet":
+        """
+        Collects the lines changed in the working tree relative to a git revision.
+        Untracked files are included in full.
+
+        Args:
+            base (str): The revision to diff against, e.g. `HEAD~1` or `origin/main`.
+            cwd (str, optional): A directory inside the repository.
+
+        Returns:
+            ChangeSet: The changed files and lines.
+
+        Raises:
+            subprocess.CalledProcessError: If a git command fails.
+        """
+        top = _git(cwd, "rev-parse", "--show-toplevel").strip()
+        diff = _git(
+            top,
+            "diff",
+            "--unified=0",
+            "--no-color",
+            "--no-ext-diff",
+            "--diff-filter=AMR",
+            base,
+            "--",
+        )
+        files: dict[str, LineRanges] = {}
+        ranges: list[tuple[int, int]] = []
+        for line in diff.splitlines():
+            if line.startswith("+++ "):
+                ranges = []
+                if line[4:] != "/dev/null":
+                    files[os.path.join(top, line[6:])] = ranges
+            elif match := _HUNK_HEADER.match(line):
+                start = int(match.group(1))
+                count = int(match.group(2) or 1)
+                # A pure deletion reports the line before it; mark both neighbours.
+                end = start + count - 1 if count else start + 1
+                ranges.append((max(start - 1, 0), end - 1))
+
+        untracked = _git(top, "ls-files", "--others", "--exclude-standard", "-z")
+        for path in filter(None, untracked.split("\0")):
+            files[os.path.join(top, path)] = None
+
+        return cls(files)
+
+
+class Manifest:
+    """
+    Remembers the (mtime, size, content hash) of every file seen by a run so the
+    next run can tell which files changed without git.
+    """
+
+    def __init__(self, path: str) -> None:
+        """
+        Loads the manifest at `path`, starting empty if it does not exist yet.
+
+        Args:
+            path (str): The location of the manifest JSON file.
+        """
+        self.path = path
+        self.entries: dict[str, tuple[float, int, str]] = {}
+        if os.path.exists(path):
+            with open(path, "r") as f:
+                self.entries = {k: tuple(v) for k, v in json.load(f).items()}
+
+    def changes(self, file_paths: Iterable[str]) -> ChangeSet:
+        """
+        Selects the files whose content differs from the manifest. The hash is only
+        computed when the mtime or size differs.
+
+        Args:
+            file_paths (Iterable[str]): The candidate files.
+
+        Returns:
+            ChangeSet: The new or modified files, each considered in full.
+        """
+        changed: dict[str, LineRanges] = {}
+        for file_path in file_paths:
+            path = os.path.abspath(file_path)
+            stat = os.stat(path)
+            entry = self.entries.get(path)
+            if entry is not None and entry[:2] == (stat.st_mtime, stat.st_size):
+                continue
+            if entry is None or entry[2] != _hash_file(path):
+                changed[path] = None
+
+        return ChangeSet(changed)
+
+    def update(self, file_paths: Iterable[str]) -> None:
+        """
+        Records the current state of files, e.g. after they were docstringified.
+
+        Args:
+            file_paths (Iterable[str]): The files to record.
+        """
+        for file_path in file_paths:
+            path = os.path.abspath(file_path)
+            if not os.path.isfile(path):
+                self.entries.pop(path, None)
+                continue
+            stat = os.stat(path)
+            self.entries[path] = (stat.st_mtime, stat.st_size, _hash_file(path))
+
+    def save(self) -> None:
+        """
+        Writes the manifest back to disk.
+        """
+        with open(self.path, "w") as f:
+            json.dump(self.entries, f)
+
+
+def select_changed(
+    functions: list[FunctionDeclaration], line_ranges: LineRanges
+) -> list[FunctionDeclaration]:
+    """
+    Keeps the functions that overlap any changed line range.
+
+    Args:
+        functions (list[FunctionDeclaration]): The functions of a file.
+        line_ranges (LineRanges): The changed lines, or None if the whole file changed.
+
+    Returns:
+        list[FunctionDeclaration]: The functions that need to be considered.
+    """
+    if line_ranges is None:
+        return functions
+
+    return [
+        f
+        for f in functions
+        if any(
+            start <= f.end_line and f.start_line <= end for start, end in line_ranges
+        )
+    ]
+
+
+def _git(cwd: str, *args: str) -> str:
+    """
+    Runs a git command and returns its output.
+
+    Args:
+        cwd (str): The directory to run git in.
+        *args (str): The git arguments.
+
+    Returns:
+        str: The standard output of the command.
+    """
+    return subprocess.run(
+        ["git", *args], cwd=cwd, check=True, capture_output=True, text=True
+    ).stdout
+
+
+def _hash_file(path: str) -> str:
+    """
+    Computes the SHA-256 of a file's content.
+
+    Args:
+        path (str): The path to the file.
+
+    Returns:
+        str: The hex digest.
+    """
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        while chunk := f.read(1 << 20):
+            digest.update(chunk)
+    return digest.hexdigest()
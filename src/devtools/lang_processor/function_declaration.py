@@ -0,0 +1,144 @@
+from devtools.file_input import Source
+
+
+class FunctionDeclaration:
+    """
+    A lightweight reference to a function inside a source file.
+
+    Only byte offsets into the (shared) source buffer are stored, so extracting
+    the functions of a file does not copy their text. `text` decodes the function
+    on demand, e.g. when a prompt is built. `prompt_text` is the compacted text sent
+    to the model: decorators included, long stretches of the body elided.
+    """
+
+    __slots__ = (
+        "name",
+        "start_line",
+        "end_line",
+        "start_byte",
+        "end_byte",
+        "header_end_byte",
+        "body_start_byte",
+        "body_end_byte",
+        "indent",
+        "has_docstring",
+        "source",
+        "prompt_start_byte",
+        "elisions",
+        "n_params",
+        "complexity",
+        "n_raises",
+        "fingerprint",
+        "depth",
+    )
+
+    def __init__(
+        self,
+        *,
+        name: str,
+        start_line: int,
+        end_line: int,
+        start_byte: int,
+        end_byte: int,
+        header_end_byte: int,
+        body_start_byte: int,
+        body_end_byte: int,
+        indent: str,
+        has_docstring: bool,
+        source: Source,
+        prompt_start_byte: int | None = None,
+        elisions: tuple[tuple[int, int, int], ...] = (),
+        n_params: int = 0,
+        complexity: int = 1,
+        n_raises: int = 0,
+        fingerprint: str | None = None,
+        depth: int = 0,
+    ) -> None:
+        """
+        Args:
+            name (str): The name of the function.
+            start_line (int): Zero-based line of the start of the function definition.
+            end_line (int): Zero-based line of the end of the function definition.
+            start_byte (int): Offset of the first byte of the function definition.
+            end_byte (int): Offset one past the last byte of the function definition.
+            header_end_byte (int): Offset one past the colon ending the signature.
+            body_start_byte (int): Offset of the first statement of the body.
+            body_end_byte (int): Offset one past the last byte of the body.
+            indent (str): The indentation of the body statements.
+            has_docstring (bool): Whether the body starts with a docstring.
+            source (Source): The UTF-8 encoded source the offsets refer to, possibly
+                a memory-mapped file.
+            prompt_start_byte (int, optional): Offset where the prompt starts, i.e.
+                the first decorator. Defaults to `start_byte`.
+            elisions (tuple[tuple[int, int, int], ...], optional): Sorted,
+                non-overlapping (start_byte, end_byte, n_lines) ranges of the body
+                left out of the prompt.
+            n_params (int, optional): The number of parameters.
+            complexity (int, optional): One plus the number of branches.
+            n_raises (int, optional): The number of raise statements.
+            fingerprint (str, optional): Digest of the function's tokens, equal for
+                copies that only differ in comments and formatting. None if the
+                function is not deduplicated.
+            depth (int, optional): The number of enclosing function and class
+                definitions, 0 for a top-level function.
+        """
+        self.name = name
+        self.start_line = start_line
+        self.end_line = end_line
+        self.start_byte = start_byte
+        self.end_byte = end_byte
+        self.header_end_byte = header_end_byte
+        self.body_start_byte = body_start_byte
+        self.body_end_byte = body_end_byte
+        self.indent = indent
+        self.has_docstring = has_docstring
+        self.source = source
+        self.prompt_start_byte = (
+            start_byte if prompt_start_byte is None else prompt_start_byte
+        )
+        self.elisions = elisions
+        self.n_params = n_params
+        self.complexity = complexity
+        self.n_raises = n_raises
+        self.fingerprint = fingerprint
+        self.depth = depth
+
+    @property
+    def text(self) -> str:
+        """
+        str: The source code of the function.
+        """
+        # Decode straight from the shared buffer without an intermediate copy.
+        return str(memoryview(self.source)[self.start_byte : self.end_byte], "utf8")
+
+    @property
+    def prompt_text(self) -> str:
+        """
+        str: The source code of the function and its decorators, with every elided
+        range replaced by an `...` placeholder.
+        """
+        view = memoryview(self.source)
+        chunks = []
+        position = self.prompt_start_byte
+        for start, end, n_lines in self.elisions:
+            chunks.append(str(view[position:start], "utf8"))
+            plural = "s" if n_lines > 1 else ""
+            chunks.append(f"...  # {n_lines} line{plural} elided")
+            position = end
+        chunks.append(str(view[position : self.end_byte], "utf8"))
+        return "".join(chunks)
+
+    @property
+    def inline_body(self) -> bool:
+        """
+        bool: Whether the body starts on the same line as the signature, as in
+        `def f(): return 1`.
+        """
+        return self.source.find(b"\n", self.header_end_byte, self.body_start_byte) < 0
+
+    def __repr__(self) -> str:
+        return (
+            f"FunctionDeclaration(name={self.name!r}, "
+            f"span=({self.start_byte}, {self.end_byte}), "
+            f"has_docstring={self.has_docstring})"
+        )
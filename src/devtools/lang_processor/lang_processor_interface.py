@@ -1,9 +1,17 @@
 from abc import ABC, abstractmethod
+from collections import Counter
 
-from tree_sitter import Language, Node, Parser
+from tree_sitter import Language, Node, Parser, Tree
+
+from devtools import config
+from devtools.file_input import Source
+from devtools.lang_processor.function_declaration import FunctionDeclaration
 
 
 class ILanguageProcessor(ABC):
+    # The language name used in prompts.
+    language_name: str = "programming"
+
     @abstractmethod
     def __init__(self):
         """
@@ -29,48 +37,109 @@ class ILanguageProcessor(ABC):
         pass
 
     @abstractmethod
-    def to_ast(self, content: str) -> Node:
+    def parse(self, content: str | Source) -> Tree:
+        """
+        Parses the given content into a syntax tree, which can be edited and
+        reparsed incrementally.
+
+        Args:
+            content (str | Source): The text content, or its encoded bytes (possibly
+                memory-mapped), which needs to be parsed.
+
+        Returns:
+            Tree: The syntax tree of the content.
+        """
+        pass
+
+    def to_ast(self, content: str | Source) -> Node:
         """
         Converts the given content into an Abstract Syntax Tree (AST) node object.
 
         Args:
-            content (str): The text content which needs to be converted.
+            content (str | Source): The text content, or its encoded bytes (possibly
+                memory-mapped), which needs to be converted.
 
         Returns:
             Node: An AST node object representing the input content.
         """
-        pass
+        return self.parse(content).root_node
 
     @abstractmethod
-    def extract_function_declarations(self, root_node: Node) -> list[str]:
+    def extract_function_declarations(
+        self, root_node: Node, source: Source | None = None
+    ) -> list[FunctionDeclaration]:
         """
         This function extracts function declarations from a given root node.
 
         Args:
             self: A reference to the current instance of the class.
             root_node (Node): The root node from which function declarations should be extracted.
+            source (Source, optional): The encoded source code the tree was parsed from.
 
         Returns:
-            list[str]: A list of strings, each string being a function declaration.
+            list[FunctionDeclaration]: A span record for each function declaration.
         """
         pass
 
     @abstractmethod
     def insert_docstrings(
-        self, source_code: str, functions: list[str], docstrings: list[str]
+        self,
+        source_code: str | Source,
+        functions: list[FunctionDeclaration],
+        docstrings: list[str],
+        *,
+        tree: Tree | None = None,
     ) -> tuple[str, int]:
         """
-        Inserts docstrings into given Python source code.
+        Inserts docstrings into given Python source code. Docstrings whose insertion
+        would break the syntax of the code are left out.
 
         Args:
-            source_code (str): The Python source code where the docstrings will be inserted.
-            functions (list[str]): List of function names in the source code where the
+            source_code (str | Source): The Python source code where the docstrings will be
+                                      inserted, as text or as the bytes it was parsed from.
+            functions (list[FunctionDeclaration]): List of functions in the source code where the
                                    corresponding docstring needs to be inserted.
             docstrings (list[str]): List of docstrings that need to be inserted into
                                     the corresponding functions in the source code.
+            tree (Tree, optional): The tree `source_code` was parsed into, see
+                `parse`. It is edited in place to validate every insertion
+                incrementally; the source is parsed again if omitted.
 
         Returns:
             tuple[str, int]: Tuple containing the modified source code with the inserted
                              docstring and the number of successful docstring insertions.
         """
         pass
+
+    def count_references(self, root_node: Node, source: Source) -> Counter[str]:
+        """
+        Counts how often every name occurs in a parse tree, used to rank functions
+        by how widely they are used. Languages without support count nothing.
+
+        Args:
+            root_node (Node): The root node of a parse tree.
+            source (Source): The encoded source code the tree was parsed from.
+
+        Returns:
+            Counter[str]: The number of occurrences of every name.
+        """
+        return Counter()
+
+    def system_prompt(self) -> str:
+        """
+        Returns the system prompt for documenting a single function of this language.
+
+        Returns:
+            str: The system prompt.
+        """
+        return config.system_prompt(self.language_name)
+
+    def batch_system_prompt(self) -> str:
+        """
+        Returns the system prompt for documenting several functions of this language
+        with one request.
+
+        Returns:
+            str: The system prompt.
+        """
+        return config.batch_system_prompt(self.language_name)
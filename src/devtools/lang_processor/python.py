@@ -1,25 +1,129 @@
-import black
-import tree_sitter_python as tspython
-from tree_sitter import Language, Node, Parser
+import hashlib
+import sys
+import textwrap
+import threading
+from collections import Counter
+from typing import Callable, Iterator
 
+from rich import print
+from tree_sitter import Language, Node, Parser, Point, Tree
+
+from devtools import config
+from devtools.file_input import Source
+from devtools.lang_processor.function_declaration import FunctionDeclaration
 from devtools.lang_processor.lang_processor_interface import ILanguageProcessor
+from devtools.lang_processor.queries import compiled_query
+from devtools.metrics import collector, timed
+
+FUNCTION_QUERY = "(function_definition) @function"
+IDENTIFIER_QUERY = "(identifier) @identifier"
+
+# Statements kept in compacted prompts wherever they are in the body.
+KEPT_STATEMENTS = frozenset(["return_statement", "raise_statement"])
+# Nodes adding a branch to the complexity of a function.
+BRANCH_NODES = frozenset(
+    [
+        "if_statement",
+        "elif_clause",
+        "for_statement",
+        "while_statement",
+        "except_clause",
+        "case_clause",
+        "boolean_operator",
+        "conditional_expression",
+        "for_in_clause",
+        "if_clause",
+    ]
+)
+# Definitions whose bodies belong to another scope.
+NESTED_SCOPES = frozenset(
+    ["function_definition", "class_definition", "decorated_definition"]
+)
+
+# Bytes handed to tree-sitter per read callback when parsing a memory-mapped file.
+PARSE_CHUNK_BYTES = 64 * 1024
+
+# Tokens that do not change the meaning of a function and are left out of its
+# fingerprint. Whitespace is not part of the token stream to begin with.
+FINGERPRINT_SKIPPED = frozenset(["comment", "line_continuation"])
 
 
 class PythonProcessor(ILanguageProcessor):
-    def __init__(self):
+    language_name = "python"
+
+    def __init__(
+        self,
+        *,
+        full_format: bool = False,
+        line_width: int = config.LINE_WIDTH,
+        prompt_body_lines: int = config.PROMPT_BODY_LINES,
+    ):
         """
-        Initializes the instance with the given tree-sitter language.
+        Initializes the processor. The tree-sitter grammar is only loaded when the
+        first file is parsed.
 
         Args:
-            ts_language (Language): Tree-sitter language module.
+            full_format (bool, optional): Reformat the whole file with black after
+                inserting docstrings. By default only the inserted docstrings are
+                formatted, which is cheaper and leaves unrelated code untouched.
+            line_width (int, optional): The width inserted docstrings are wrapped to.
+            prompt_body_lines (int, optional): Bodies longer than this many lines are
+                compacted for the prompt; 0 always sends the full function.
 
         Attributes:
-            parser (Parser): A Tree-sitter parser.
+            parser (Parser): A Tree-sitter parser owned by the calling thread.
             language (Language): A Tree-sitter language module.
         """
-        self.language = Language(tspython.language())
-        self.parser = Parser()
-        self.parser.language = self.language
+        self.full_format = full_format
+        self.line_width = line_width
+        self.prompt_body_lines = prompt_body_lines
+        self._language: Language | None = None
+        self._local = threading.local()
+
+    def __getstate__(self) -> dict:
+        """
+        Pickles only the settings; the grammar and parsers are rebuilt on load, so
+        the processor can be sent to worker processes.
+
+        Returns:
+            dict: The constructor arguments.
+        """
+        return {
+            "full_format": self.full_format,
+            "line_width": self.line_width,
+            "prompt_body_lines": self.prompt_body_lines,
+        }
+
+    def __setstate__(self, state: dict) -> None:
+        """
+        Rebuilds a processor from its pickled settings.
+
+        Args:
+            state (dict): The constructor arguments.
+        """
+        self.__init__(**state)
+
+    @property
+    def language(self) -> Language:
+        """
+        Language: The Python grammar, loaded on first use.
+        """
+        if self._language is None:
+            import tree_sitter_python as tspython
+
+            self._language = Language(tspython.language())
+            collector.count("grammars_loaded")
+        return self._language
+
+    @property
+    def parser(self) -> Parser:
+        """
+        Parser: The parser of the calling thread. Tree-sitter parsers are not safe
+        to share between threads, so each thread lazily gets its own.
+        """
+        if (parser := getattr(self._local, "parser", None)) is None:
+            parser = self._local.parser = Parser(self.language)
+        return parser
 
     def verify_extension(self, file_path: str) -> bool:
         """
@@ -33,96 +137,874 @@ class PythonProcessor(ILanguageProcessor):
         """
         return file_path.endswith(".py")
 
-    def to_ast(self, content: str) -> Node:
+    @timed("parse")
+    def parse(self, content: str | Source) -> Tree:
         """
-        Converts the given string content into an Abstract Syntax Tree (AST).
+        Parses the given content into a syntax tree.
 
         Args:
-            content (str): The string to be converted.
+            content (str | Source): The source to be parsed. Bytes are parsed as
+                is, strings are encoded as UTF-8 first and memory-mapped files are
+                fed to tree-sitter in chunks, so they are never copied whole.
 
         Returns:
-            Node: The root node of the parsed AST.
+            Tree: The syntax tree. Nodes of a memory-mapped file have no `text`;
+                slice the source by their byte offsets instead.
         """
-        tree = self.parser.parse(bytes(content, "utf8"))
-        return tree.root_node
+        if isinstance(content, str):
+            content = content.encode("utf8")
+        if isinstance(content, bytes):
+            return self.parser.parse(content)
+        return self.parser.parse(_chunk_reader(content))
 
-    def extract_function_declarations(self, root_node: Node) -> list[str]:
+    @timed("extract")
+    def extract_function_declarations(
+        self, root_node: Node, source: Source | None = None
+    ) -> list[FunctionDeclaration]:
         """
         Extracts function declarations from the root node of a parse tree.
 
         Args:
             root_node (Node): The root node of a parse tree.
+            source (Source, optional): The UTF-8 encoded source that was parsed. Taken
+                from the tree if omitted, which requires it to be parsed from bytes.
 
         Returns:
-            list[str]: A list of strings where each string is a serialized representation
-                       of a unique function declaration in the parse tree.
+            list[FunctionDeclaration]: The span records of every function definition
+                in the parse tree, in source order.
         """
-        query = self.language.query(
-            "(function_definition name: (identifier) @function_name)"
-        )
-
+        if source is None:
+            # The module node starts after any leading whitespace; pad it back so
+            # byte offsets still index the original source.
+            if root_node.text is None:
+                raise ValueError("`source` is required for trees parsed in chunks")
+            source = b" " * root_node.start_byte + root_node.text
         functions = []
-        for match in query.captures(root_node):
-            function_node = match[0].parent
-            function_text = function_node.text.decode("utf8")
-            functions.append(function_text)
+        for function_node in self._function_nodes(root_node):
+            name = function_node.child_by_field_name("name")
+            parameters = function_node.child_by_field_name("parameters")
+            body = function_node.child_by_field_name("body")
+            if name is None or parameters is None or body is None:
+                continue
+
+            header_end_byte = next(
+                child.end_byte for child in function_node.children if child.type == ":"
+            )
+            line_start = source.rfind(b"\n", 0, body.start_byte) + 1
+            if line_start > header_end_byte:
+                indent = source[line_start : body.start_byte].decode("utf8")
+            else:
+                # The body shares the line of the signature: indent one level
+                # deeper than the `def`.
+                def_line_start = source.rfind(b"\n", 0, function_node.start_byte) + 1
+                indent = " " * (function_node.start_byte - def_line_start + 4)
+
+            decorator = function_node.parent
+            if decorator is not None and decorator.type != "decorated_definition":
+                decorator = None
+            branches, raises = self._count_branches(body)
+            has_docstring = self.has_docstring(function_node)
+            functions.append(
+                FunctionDeclaration(
+                    name=_node_text(name, source),
+                    start_line=function_node.start_point[0],
+                    end_line=function_node.end_point[0],
+                    start_byte=function_node.start_byte,
+                    end_byte=function_node.end_byte,
+                    header_end_byte=header_end_byte,
+                    body_start_byte=body.start_byte,
+                    body_end_byte=body.end_byte,
+                    indent=indent,
+                    has_docstring=has_docstring,
+                    source=source,
+                    prompt_start_byte=(
+                        decorator.start_byte if decorator is not None else None
+                    ),
+                    elisions=tuple(self._elisions(body)),
+                    n_params=len(
+                        [p for p in parameters.named_children if p.type != "comment"]
+                    ),
+                    complexity=1 + branches,
+                    n_raises=raises,
+                    depth=sum(
+                        node.type in ("function_definition", "class_definition")
+                        for node in _ancestors(function_node)
+                    ),
+                    fingerprint=(
+                        None
+                        if has_docstring
+                        else self.fingerprint(
+                            function_node if decorator is None else decorator, source
+                        )
+                    ),
+                )
+            )
 
         return functions
 
+    @timed("query")
+    def count_references(self, root_node: Node, source: Source) -> Counter[str]:
+        """
+        Counts the identifiers of a parse tree by name, definitions included.
+
+        Args:
+            root_node (Node): The root node of a parse tree.
+            source (Source): The UTF-8 encoded source that was parsed.
+
+        Returns:
+            Counter[str]: The number of occurrences of every name.
+        """
+        query = compiled_query(self.language, IDENTIFIER_QUERY)
+        return Counter(
+            source[node.start_byte : node.end_byte].decode("utf8")
+            for node, _ in query.captures(root_node)
+        )
+
+    def has_docstring(self, function_node: Node) -> bool:
+        """
+        Checks whether the first statement of a function body is a string literal.
+
+        Args:
+            function_node (Node): A `function_definition` node.
+
+        Returns:
+            bool: True if the function already has a docstring, False otherwise.
+        """
+        body = function_node.child_by_field_name("body")
+        if body is None:
+            return False
+
+        for statement in body.named_children:
+            if statement.type == "comment":
+                continue
+            return (
+                statement.type == "expression_statement"
+                and statement.named_children[0].type
+                in ("string", "concatenated_string")
+            )
+
+        return False
+
+    def fingerprint(self, node: Node, source: Source) -> str:
+        """
+        Hashes the token stream of a function, so copies of it that only differ in
+        comments, whitespace or line breaks share a fingerprint.
+
+        Args:
+            node (Node): The `function_definition` node, or the
+                `decorated_definition` around it.
+            source (Source): The UTF-8 encoded source that was parsed.
+
+        Returns:
+            str: The hex digest.
+        """
+        digest = hashlib.blake2b(self.language_name.encode("utf8"), digest_size=16)
+        stack = [node]
+        while stack:
+            current = stack.pop()
+            if current.type in FINGERPRINT_SKIPPED:
+                continue
+            if current.child_count:
+                stack.extend(reversed(current.children))
+                continue
+            # Separate tokens so that `ab` differs from `a b`.
+            digest.update(current.type.encode("utf8") + b"\0")
+            if current.is_named:
+                digest.update(source[current.start_byte : current.end_byte] + b"\0")
+        return digest.hexdigest()
+
+    @timed("query")
+    def _elisions(self, body: Node) -> list[tuple[int, int, int]]:
+        """
+        Selects the parts of a long function body left out of its prompt.
+
+        The first `prompt_body_lines` lines of the body are kept, and so are return
+        and raise statements together with the headers of the control flow leading
+        to them. Every other run of statements is elided.
+
+        Args:
+            body (Node): The `block` node of the function body.
+
+        Returns:
+            list[tuple[int, int, int]]: The (start_byte, end_byte, n_lines) ranges
+                to elide, in source order.
+        """
+        if (
+            self.prompt_body_lines <= 0
+            or body.end_point[0] - body.start_point[0] < self.prompt_body_lines
+        ):
+            return []
+        return self._elide_block(body, body.start_point[0] + self.prompt_body_lines)
+
+    def _elide_block(self, block: Node, keep_until: int) -> list[tuple[int, int, int]]:
+        """
+        Selects the statements of a block to elide, see `_elisions`.
+
+        Args:
+            block (Node): A `block` node.
+            keep_until (int): Statements ending before this zero-based line are kept.
+
+        Returns:
+            list[tuple[int, int, int]]: The ranges to elide, in source order.
+        """
+        elisions = []
+        run: list[Node] = []
+        for statement in block.named_children:
+            if statement.end_point[0] < keep_until or statement.type in KEPT_STATEMENTS:
+                inner = []
+            elif statement.type not in NESTED_SCOPES and (
+                statement.start_point[0] < keep_until or self._contains_kept(statement)
+            ):
+                # Keep the header of the compound statement, compact its blocks.
+                inner = [
+                    elision
+                    for child in self._blocks(statement)
+                    for elision in self._elide_block(child, keep_until)
+                ]
+            else:
+                inner = None
+
+            if inner is None:
+                run.append(statement)
+                continue
+            if run:
+                elisions.append(_elision(run))
+                run = []
+            elisions.extend(inner)
+
+        if run:
+            elisions.append(_elision(run))
+        return elisions
+
+    def _blocks(self, statement: Node) -> list[Node]:
+        """
+        Collects the blocks directly governed by a compound statement, e.g. the
+        branches of an `if` or the handlers of a `try`.
+
+        Args:
+            statement (Node): A statement node.
+
+        Returns:
+            list[Node]: The `block` nodes, in source order.
+        """
+        blocks = []
+        stack = list(reversed(statement.children))
+        while stack:
+            node = stack.pop()
+            if node.type == "block":
+                blocks.append(node)
+            elif node.type not in NESTED_SCOPES:
+                stack.extend(reversed(node.children))
+        return blocks
+
+    def _contains_kept(self, node: Node) -> bool:
+        """
+        Checks whether a statement contains a return or raise of the same scope.
+
+        Args:
+            node (Node): A statement node.
+
+        Returns:
+            bool: True if a kept statement is nested in `node`.
+        """
+        return any(n.type in KEPT_STATEMENTS for n in _scope_nodes(node))
+
+    def _count_branches(self, body: Node) -> tuple[int, int]:
+        """
+        Counts the branches and raise statements of a function body, ignoring
+        nested functions and classes.
+
+        Args:
+            body (Node): The `block` node of the function body.
+
+        Returns:
+            tuple[int, int]: The number of branches and of raise statements.
+        """
+        branches = raises = 0
+        for node in _scope_nodes(body):
+            branches += node.type in BRANCH_NODES
+            raises += node.type == "raise_statement"
+        return branches, raises
+
+    def _function_nodes(self, root_node: Node) -> list[Node]:
+        """
+        Collects the function definition nodes of a parse tree in source order.
+
+        Args:
+            root_node (Node): The root node of a parse tree.
+
+        Returns:
+            list[Node]: The `function_definition` nodes.
+        """
+        query = compiled_query(self.language, FUNCTION_QUERY)
+        return [node for node, _ in query.captures(root_node)]
+
+    @timed("insert")
     def insert_docstrings(
-        self, source_code: str, functions: list[str], docstrings: list[str]
+        self,
+        source_code: str | Source,
+        functions: list[FunctionDeclaration],
+        docstrings: list[str],
+        *,
+        tree: Tree | None = None,
     ) -> tuple[str, int]:
         """
         This function inserts docstrings into source_code at the beginning of each function specified
         in the `functions` list, corresponding to the `docstrings` list.
 
+        Every insertion is validated: the insertions are applied to the syntax tree
+        with `Tree.edit` and the source is reparsed incrementally, reusing the
+        subtrees they do not touch. A docstring that breaks the syntax of the code,
+        or is not a lone string literal, is rejected and reported; the others are
+        kept.
+
         Args:
-            source_code (str): The python source code as a string.
-            functions (list[str]): A list of functions' text from the source code.
+            source_code (str | Source): The python source code, either as a string or
+                as the UTF-8 encoded bytes it was parsed from, possibly memory-mapped.
+            functions (list[FunctionDeclaration]): The functions of `source_code`, as
+                returned by `extract_function_declarations`.
             docstrings (list[str]): A list of docstrings to be inserted. An empty string means the
                                     corresponding function already contains a docstring.
+            tree (Tree, optional): The tree `source_code` was parsed into, edited in
+                place while validating. The source is parsed again if omitted.
         Returns:
             tuple: A tuple containing the formatted source code with inserted docstrings and the number
                    of inserted docstrings.
 
         Raises:
             AssertionError: If the number of functions does not equal to the number of docstrings.
-            ValueError: If unable to identify the proper location for inserting the docstring.
         """
         assert len(functions) == len(
             docstrings
         ), f"`len(functions)={len(functions)}` != `len(docstrings)={len(docstrings)}`"
-        updated_code = source_code
-        insertions = 0
-        for function_text, docstring in zip(functions, docstrings):
+
+        source = (
+            source_code.encode("utf8") if isinstance(source_code, str) else source_code
+        )
+        newline = _newline(source)
+        edits = []
+        for function, docstring in zip(functions, docstrings):
             # If the docstring is empty it means the function already contains a docstring.
             if not len(docstring.strip()):
                 continue
+            edits.append(
+                (function, *self._docstring_edit(function, docstring, newline))
+            )
+        if not edits:
+            return str(memoryview(source), "utf8"), 0
 
-            # Split the function text into lines
-            lines = function_text.split("\n")
+        if tree is None:
+            tree = self.parse(source)
+        with collector.stage("validate"):
+            buffer, n_insertions = self._apply_edits(source, tree, edits)
+        updated_code = buffer.decode("utf8")
 
-            # Find the index of the first line after the function header
-            i = -1
-            for i, line in enumerate(lines):
-                if line.strip().endswith(":"):
-                    break
+        if not self.full_format or not n_insertions:
+            return updated_code, n_insertions
 
-            if i < 0:
-                raise ValueError("Unable to find location for docstring")
+        import black
 
-            indent = " " * (len(lines[i + 1]) - len(lines[i + 1].lstrip()))
+        # Format the updated code using Black
+        with collector.stage("format"):
+            try:
+                formatted_code = black.format_str(updated_code, mode=black.FileMode())
+            except Exception as e:
+                # The insertions are valid on their own: keep them unformatted.
+                print(
+                    f"[yellow]Could not format the file with black, keeping it "
+                    f"unformatted: {e}[/yellow]",
+                    file=sys.stderr,
+                )
+                return updated_code, n_insertions
+        if newline != "\n":
+            # Black writes "\n"; keep the line endings of the file.
+            formatted_code = formatted_code.replace("\n", newline)
+        return formatted_code, n_insertions
 
-            # Insert the docstring after the function header
-            lines.insert(i + 1, f"{indent}{docstring}")
+    def _apply_edits(
+        self,
+        source: Source,
+        tree: Tree,
+        edits: list[tuple[FunctionDeclaration, int, int, bytes]],
+    ) -> tuple[bytearray, int]:
+        """
+        Applies docstring edits and validates each of them. All edits are applied to
+        the tree with `Tree.edit` and the source is reparsed once, reusing every
+        subtree they do not touch; the edited functions are then checked one by
+        one. Edits that break the syntax, or are not a lone string literal, are
+        undone and reported, and the source is reparsed again until every edit left
+        passes, so a file without bad docstrings is only reparsed once.
 
-            # Join the lines back into the updated function text
-            updated_function_text = "\n".join(lines)
+        Every docstring is parsed on its own first: that is cheap, and keeps ones
+        that are broken anyway, e.g. an unterminated string, from sending the
+        parser into error recovery over the rest of the file.
 
-            # Replace the original function text with the updated one
-            updated_code = updated_code.replace(function_text, updated_function_text)
-            insertions += 1
+        Args:
+            source (Source): The source the offsets of the edits refer to.
+            tree (Tree): The tree of `source`, edited in place.
+            edits (list[tuple[FunctionDeclaration, int, int, bytes]]): The function
+                of every edit, the byte range to replace and its replacement.
 
-        # Format the updated code using Black
-        formatted_code = black.format_str(updated_code, mode=black.FileMode())
-        return formatted_code, insertions
+        Returns:
+            tuple[bytearray, int]: The updated source and the number of edits kept.
+        """
+        checked = []
+        for edit in sorted(edits, key=lambda edit: edit[1]):
+            docstring = edit[3].strip()
+            root_node = self.parser.parse(docstring).root_node
+            if root_node.has_error:
+                error = _first_error(root_node)
+                line = 1 if error is None else error.start_point[0] + 1
+                _reject(edit[0], _syntax_reason(error, f"line {line} of the docstring"))
+            elif reason := _literal_error(root_node.named_children, len(docstring)):
+                _reject(edit[0], reason)
+            else:
+                checked.append(edit)
+        if not checked:
+            return bytearray(source), 0
+
+        edits = checked
+        replaced = [bytes(source[start:end]) for _, start, end, _ in edits]
+        root_node = tree.root_node
+        file_had_error = root_node.has_error
+        had_error = [
+            _has_error(_function_node(root_node, function.start_byte))
+            for function, *_ in edits
+        ]
+        buffer = bytearray(source)
+        _splice(buffer, tree, [(start, end, text) for _, start, end, text in edits])
+        tree = self.parser.parse(bytes(buffer), tree)
+
+        kept = list(range(len(edits)))
+        while kept:
+            # The offset and row of every kept edit in the updated source.
+            shifts, byte_shift, row_shift = [], 0, 0
+            for i in kept:
+                _, start, end, text = edits[i]
+                shifts.append((start + byte_shift, row_shift))
+                byte_shift += len(text) - (end - start)
+                row_shift += text.count(b"\n") - replaced[i].count(b"\n")
+
+            rejected = _syntax_rejection(
+                tree.root_node, edits, kept, shifts, file_had_error, had_error
+            )
+            if rejected is None:
+                rejected = _docstring_rejections(tree.root_node, edits, kept, shifts)
+            if not rejected:
+                break
+
+            spans = []
+            for k, reason in sorted(rejected.items()):
+                i = kept[k]
+                function, _, _, text = edits[i]
+                spans.append((shifts[k][0], shifts[k][0] + len(text), replaced[i]))
+                _reject(function, reason)
+            _splice(buffer, tree, spans)
+            tree = self.parser.parse(bytes(buffer), tree)
+            kept = [i for k, i in enumerate(kept) if k not in rejected]
+
+        return buffer, len(kept)
+
+    def _docstring_edit(
+        self, function: FunctionDeclaration, docstring: str, newline: str = "\n"
+    ) -> tuple[int, int, bytes]:
+        """
+        Builds the splice that puts a docstring in front of the body of a function.
+
+        Args:
+            function (FunctionDeclaration): The function to document.
+            docstring (str): The docstring to insert.
+            newline (str, optional): The line ending of the file.
+
+        Returns:
+            tuple[int, int, bytes]: The byte range to replace and its replacement.
+        """
+        text = f"{self.format_docstring(docstring, function.indent)}\n{function.indent}"
+        if function.inline_body:
+            # Move the body onto its own line below the docstring.
+            text = f"\n{function.indent}{text}"
+            start = function.header_end_byte
+        else:
+            start = function.body_start_byte
+        return (
+            start,
+            function.body_start_byte,
+            text.replace("\n", newline).encode("utf8"),
+        )
+
+    def format_docstring(self, docstring: str, indent: str) -> str:
+        """
+        Re-indents a docstring to the body of its function and wraps lines that are
+        longer than `line_width`, keeping the relative indentation of its lines.
+
+        Args:
+            docstring (str): The docstring, including its quotes.
+            indent (str): The indentation of the function body.
+
+        Returns:
+            str: The docstring without indentation on its first line, ready to be
+                placed at the start of the body.
+        """
+        first, *rest = docstring.strip().split("\n")
+        lines = [first.strip()]
+        for line in textwrap.dedent("\n".join(rest)).split("\n") if rest else []:
+            lines.append(f"{indent}{line}".rstrip() if line.strip() else "")
+
+        wrapped = []
+        for i, line in enumerate(lines):
+            prefix = indent if i == 0 else ""
+            if len(prefix) + len(line) <= self.line_width:
+                wrapped.append(line)
+                continue
+
+            leading = line[: len(line) - len(line.lstrip())] if i else indent
+            continuation = leading if leading == indent else leading + "    "
+            filled = textwrap.wrap(
+                line.strip(),
+                width=self.line_width,
+                initial_indent=leading,
+                subsequent_indent=continuation,
+                break_long_words=False,
+                break_on_hyphens=False,
+            )
+            filled[0] = filled[0][len(prefix) :]
+            wrapped.extend(filled)
+
+        return "\n".join(wrapped)
+
+
+def _scope_nodes(node: Node) -> Iterator[Node]:
+    """
+    Walks the descendants of a node without entering nested functions or classes.
+
+    Args:
+        node (Node): The node to walk.
+
+    Yields:
+        Node: Every descendant of the same scope, in pre-order.
+    """
+    stack = list(reversed(node.children))
+    while stack:
+        child = stack.pop()
+        yield child
+        if child.type not in NESTED_SCOPES:
+            stack.extend(reversed(child.children))
+
+
+def _chunk_reader(source: Source) -> Callable[[int, Point | tuple[int, int]], bytes]:
+    """
+    Builds the read callback that feeds a source to tree-sitter in chunks.
+
+    Args:
+        source (Source): The source.
+
+    Returns:
+        Callable[[int, Point | tuple[int, int]], bytes]: The callback.
+    """
+
+    def read(byte: int, _point: Point | tuple[int, int]) -> bytes:
+        return source[byte : byte + PARSE_CHUNK_BYTES]
+
+    return read
+
+
+def _points(source: bytearray, offsets: list[int]) -> dict[int, Point]:
+    """
+    Converts byte offsets to the (row, byte column) points of tree-sitter in a
+    single pass over the source.
+
+    Args:
+        source (bytearray): The source.
+        offsets (list[int]): The byte offsets.
+
+    Returns:
+        dict[int, Point]: The point of every offset.
+    """
+    points = {}
+    row = position = 0
+    for offset in sorted(set(offsets)):
+        row += source.count(b"\n", position, offset)
+        points[offset] = (row, offset - source.rfind(b"\n", 0, offset) - 1)
+        position = offset
+    return points
+
+
+def _function_node(root_node: Node, start_byte: int) -> Node | None:
+    """
+    Finds the function definition starting at a byte offset.
+
+    Args:
+        root_node (Node): The root node of a tree.
+        start_byte (int): The offset of the `def` keyword, or `async` of async
+            functions.
+
+    Returns:
+        Node | None: The function definition, or None if none starts there.
+    """
+    node = root_node.descendant_for_byte_range(start_byte, start_byte)
+    while node is not None and node.start_byte == start_byte:
+        if node.type == "function_definition":
+            return node
+        node = node.parent
+    return None
+
+
+def _newline(source: Source) -> str:
+    """
+    Detects the line ending of a source from its first line.
+
+    Args:
+        source (Source): The source.
+
+    Returns:
+        str: `"\\r\\n"` for Windows line endings, `"\\n"` otherwise.
+    """
+    end = source.find(b"\n")
+    return "\r\n" if end > 0 and source[end - 1 : end] == b"\r" else "\n"
+
+
+def _has_error(node: Node | None) -> bool:
+    """
+    Checks whether a node is missing or contains a syntax error.
+
+    Args:
+        node (Node | None): The node.
+
+    Returns:
+        bool: True if the node is None or has an error.
+    """
+    return node is None or node.has_error
+
+
+def _splice(buffer: bytearray, tree: Tree, spans: list[tuple[int, int, bytes]]) -> None:
+    """
+    Replaces byte ranges of a source and records the edits in its tree, so the
+    next parse can reuse the unchanged subtrees.
+
+    Args:
+        buffer (bytearray): The source, updated in place.
+        tree (Tree): The tree of `buffer`, edited in place.
+        spans (list[tuple[int, int, bytes]]): The byte ranges to replace and their
+            replacements, in source order and not overlapping.
+    """
+    points = _points(
+        buffer, [offset for start, end, _ in spans for offset in (start, end)]
+    )
+    for start, end, text in reversed(spans):
+        buffer[start:end] = text
+        row, column = points[start]
+        if (newline := text.rfind(b"\n")) < 0:
+            new_end_point = (row, column + len(text))
+        else:
+            new_end_point = (row + text.count(b"\n"), len(text) - newline - 1)
+        tree.edit(
+            start, end, start + len(text), points[start], points[end], new_end_point
+        )
+
+
+def _syntax_rejection(
+    root_node: Node,
+    edits: list[tuple[FunctionDeclaration, int, int, bytes]],
+    kept: list[int],
+    shifts: list[tuple[int, int]],
+    had_error: bool,
+    function_had_error: list[bool],
+) -> dict[int, str] | None:
+    """
+    Looks for a syntax error caused by the edits and blames the last edit before
+    it, since a broken docstring can only break the code that follows it. Errors
+    the file or a function already had before the edits are not held against
+    them.
+
+    Args:
+        root_node (Node): The root node of the updated tree.
+        edits (list[tuple[FunctionDeclaration, int, int, bytes]]): The edits.
+        kept (list[int]): The indices of the edits applied to the tree.
+        shifts (list[tuple[int, int]]): The offset of every kept edit in the updated
+            source and the number of rows the edits before it added.
+        had_error (bool): Whether the file had a syntax error before the edits.
+        function_had_error (list[bool]): Whether the function of every edit had a
+            syntax error before the edits.
+
+    Returns:
+        dict[int, str] | None: Why the guilty edit is rejected, by its position in
+            `kept`, or None if the edits did not break the syntax.
+    """
+    error = None
+    if not had_error:
+        if not root_node.has_error:
+            return None
+        error = _first_error(root_node)
+        position = root_node.end_byte if error is None else error.start_byte
+    else:
+        for k, i in enumerate(kept):
+            function = edits[i][0]
+            start_byte = function.start_byte + shifts[k][0] - edits[i][1]
+            node = _function_node(root_node, start_byte)
+            if not function_had_error[i] and _has_error(node):
+                error = None if node is None else _first_error(node)
+                position = start_byte if error is None else error.start_byte
+                break
+        else:
+            return None
+
+    k = max([k for k, (start, _) in enumerate(shifts) if start <= position], default=0)
+    line = None if error is None else error.start_point[0] - shifts[k][1] + 1
+    return {k: _syntax_reason(error, f"line {line}")}
+
+
+def _docstring_rejections(
+    root_node: Node,
+    edits: list[tuple[FunctionDeclaration, int, int, bytes]],
+    kept: list[int],
+    shifts: list[tuple[int, int]],
+) -> dict[int, str]:
+    """
+    Checks that every edit put a lone string literal at the start of the body of
+    its function.
+
+    Args:
+        root_node (Node): The root node of the updated tree.
+        edits (list[tuple[FunctionDeclaration, int, int, bytes]]): The edits.
+        kept (list[int]): The indices of the edits applied to the tree.
+        shifts (list[tuple[int, int]]): The offset of every kept edit in the updated
+            source and the number of rows the edits before it added.
+
+    Returns:
+        dict[int, str]: Why edits are rejected, by their position in `kept`.
+    """
+    rejected = {}
+    for k, i in enumerate(kept):
+        function, start, _, text = edits[i]
+        node = _function_node(root_node, function.start_byte + shifts[k][0] - start)
+        body = None if node is None else node.child_by_field_name("body")
+        if body is None:
+            continue
+
+        reason = _literal_error(body.named_children, shifts[k][0] + len(text))
+        if reason is not None:
+            rejected[k] = reason
+    return rejected
+
+
+def _literal_error(statements: list[Node], end: int) -> str | None:
+    """
+    Checks that a docstring is a lone string literal.
+
+    Args:
+        statements (list[Node]): The statements of the body holding the docstring.
+        end (int): The offset one past the docstring.
+
+    Returns:
+        str | None: Why the docstring is rejected, or None if it is fine.
+    """
+    statements = [child for child in statements if child.type != "comment"]
+    first = statements[0] if statements else None
+    if (
+        first is None
+        or first.type != "expression_statement"
+        or first.named_child_count != 1
+        or first.named_children[0].type != "string"
+        or first.end_byte > end
+    ):
+        return "the response is not a string literal"
+    if len(statements) > 1 and statements[1].start_byte < end:
+        return "the response holds more than a docstring"
+    return None
+
+
+def _syntax_reason(error: Node | None, where: str) -> str:
+    """
+    Describes the syntax error a docstring caused.
+
+    Args:
+        error (Node | None): The first error or missing node, if any was found.
+        where (str): Where the error is, e.g. `line 3`.
+
+    Returns:
+        str: The description.
+    """
+    if error is None:
+        return "it breaks the syntax of the function"
+    if error.is_missing:
+        return f"missing `{error.type}` at {where}"
+    return f"syntax error at {where}"
+
+
+def _reject(function: FunctionDeclaration, reason: str) -> None:
+    """
+    Reports a rejected docstring.
+
+    Args:
+        function (FunctionDeclaration): The function the docstring was written for.
+        reason (str): Why the docstring is rejected.
+    """
+    collector.count("docstrings_rejected")
+    print(
+        f"[yellow]Rejected the docstring of {function.name} "
+        f"(line {function.start_line + 1}): {reason}.[/yellow]",
+        file=sys.stderr,
+    )
+
+
+def _first_error(node: Node) -> Node | None:
+    """
+    Finds the first error or missing node below a node.
+
+    Args:
+        node (Node): The node to search.
+
+    Returns:
+        Node | None: The first error or missing node, in source order.
+    """
+    if node.is_error or node.is_missing:
+        return node
+    for child in node.children:
+        if child.has_error and (error := _first_error(child)) is not None:
+            return error
+    return None
+
+
+def _ancestors(node: Node) -> Iterator[Node]:
+    """
+    Walks up the parents of a node.
+
+    Args:
+        node (Node): The node.
+
+    Yields:
+        Node: Every ancestor, innermost first.
+    """
+    parent = node.parent
+    while parent is not None:
+        yield parent
+        parent = parent.parent
+
+
+def _node_text(node: Node, source: Source) -> str:
+    """
+    Decodes the text of a node from the source it was parsed from.
+
+    Args:
+        node (Node): The node.
+        source (Source): The UTF-8 encoded source.
+
+    Returns:
+        str: The text of the node.
+    """
+    return str(memoryview(source)[node.start_byte : node.end_byte], "utf8")
+
+
+def _elision(statements: list[Node]) -> tuple[int, int, int]:
+    """
+    Builds the elided range covering a run of consecutive statements.
+
+    Args:
+        statements (list[Node]): The statements, in source order.
+
+    Returns:
+        tuple[int, int, int]: The start byte, end byte and number of lines.
+    """
+    first, last = statements[0], statements[-1]
+    n_lines = last.end_point[0] - first.start_point[0] + 1
+    return first.start_byte, last.end_byte, n_lines
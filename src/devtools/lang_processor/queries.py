@@ -0,0 +1,18 @@
+from functools import lru_cache
+
+from tree_sitter import Language, Query
+
+
+@lru_cache(maxsize=None)
+def compiled_query(language: Language, source: str) -> Query:
+    """
+    Compiles a tree-sitter query once per language and reuses it afterwards.
+
+    Args:
+        language (Language): The language the query is written for.
+        source (str): The query source, e.g. `(function_definition) @function`.
+
+    Returns:
+        Query: The compiled query.
+    """
+    return language.query(source)
@@ -0,0 +1,137 @@
+import functools
+import os
+import threading
+from typing import Callable, Iterable
+
+from devtools.lang_processor.lang_processor_interface import ILanguageProcessor
+
+ProcessorFactory = Callable[[], ILanguageProcessor]
+
+
+class ProcessorRegistry:
+    """
+    Dispatches files to language processors by extension, so a single walk serves
+    every language of a repository.
+
+    Processors are created from their factory the first time a matching file is
+    seen; languages that never occur never load a grammar. Registered processor
+    instances are matched with their own `verify_extension` instead.
+    """
+
+    def __init__(self, processors: Iterable[ILanguageProcessor] = ()) -> None:
+        """
+        Args:
+            processors (Iterable[ILanguageProcessor], optional): Ready-made
+                processors, consulted after the registered extensions.
+        """
+        self._factories: dict[str, ProcessorFactory] = {}
+        self._instances: dict[ProcessorFactory, ILanguageProcessor] = {}
+        self._processors = list(processors)
+        self._lock = threading.Lock()
+
+    def __getstate__(self) -> dict:
+        """
+        Pickles the factories and ready-made processors; created processors are
+        rebuilt lazily, e.g. inside worker processes.
+
+        Returns:
+            dict: The registry's configuration.
+        """
+        return {"factories": self._factories, "processors": self._processors}
+
+    def __setstate__(self, state: dict) -> None:
+        """
+        Restores a registry from its pickled configuration.
+
+        Args:
+            state (dict): The registry's configuration.
+        """
+        self.__init__(state["processors"])
+        self._factories = state["factories"]
+
+    def register(self, extensions: Iterable[str], factory: ProcessorFactory) -> None:
+        """
+        Maps file extensions to a processor factory. All extensions of one factory
+        share a single processor.
+
+        Args:
+            extensions (Iterable[str]): Extensions including the dot, e.g. `.py`.
+            factory (ProcessorFactory): Creates the processor; must be picklable to
+                be used with the parallel pipeline.
+        """
+        for extension in extensions:
+            self._factories[extension.lower()] = factory
+
+    @property
+    def loaded(self) -> list[ILanguageProcessor]:
+        """
+        list[ILanguageProcessor]: The processors created so far.
+        """
+        return list(self._instances.values())
+
+    def handles(self, file_path: str) -> bool:
+        """
+        Checks whether any processor accepts a file, without creating one.
+
+        Args:
+            file_path (str): The path of the file.
+
+        Returns:
+            bool: True if the file can be processed.
+        """
+        return _extension(file_path) in self._factories or any(
+            p.verify_extension(file_path) for p in self._processors
+        )
+
+    def processor_for(self, file_path: str) -> ILanguageProcessor | None:
+        """
+        Returns the processor of a file, creating it on first use.
+
+        Args:
+            file_path (str): The path of the file.
+
+        Returns:
+            ILanguageProcessor | None: The processor, or None if no processor
+                accepts the file.
+        """
+        factory = self._factories.get(_extension(file_path))
+        if factory is None:
+            return next(
+                (p for p in self._processors if p.verify_extension(file_path)), None
+            )
+
+        if (processor := self._instances.get(factory)) is None:
+            with self._lock:
+                if (processor := self._instances.get(factory)) is None:
+                    processor = self._instances[factory] = factory()
+        return processor
+
+
+def default_registry(**options) -> ProcessorRegistry:
+    """
+    Builds the registry of every supported language.
+
+    Args:
+        **options: Passed to the processor constructors, e.g. `full_format`.
+
+    Returns:
+        ProcessorRegistry: The registry.
+    """
+    from devtools.lang_processor.python import PythonProcessor
+
+    registry = ProcessorRegistry()
+    registry.register([".py"], functools.partial(PythonProcessor, **options))
+    return registry
+
+
+def _extension(file_path: str) -> str:
+    """
+    Returns the lower-cased extension of a path, including the dot.
+
+    Args:
+        file_path (str): The path of the file.
+
+    Returns:
+        str: The extension, empty if there is none.
+    """
+    return os.path.splitext(file_path)[1].lower()
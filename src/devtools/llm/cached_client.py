@@ -0,0 +1,255 @@
+import asyncio
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+
+from devtools import config
+from devtools.llm.client_interface import IClient
+from devtools.metrics import collector
+
+
+class CachedClient(IClient):
+    """
+    Wraps any `IClient` with a persistent, content-addressed response cache.
+
+    Responses are stored in a SQLite database keyed by a hash of everything that
+    determines the answer: the prompt (which embeds the function text), the model,
+    the system prompt and the docstring style. Entries older than `max_age` are
+    dropped and the least recently used entries are evicted once the stored
+    responses exceed `max_bytes`.
+    """
+
+    def __init__(
+        self,
+        client: IClient,
+        *,
+        cache_dir: str = config.CACHE_DIR,
+        max_bytes: int = config.CACHE_MAX_BYTES,
+        max_age: int = config.CACHE_MAX_AGE,
+    ):
+        """
+        Opens (or creates) the cache database in `cache_dir`.
+
+        Args:
+            client (IClient): The client that answers cache misses.
+            cache_dir (str, optional): Directory holding the cache database.
+            max_bytes (int, optional): Upper bound on the size of stored responses.
+            max_age (int, optional): Seconds after which an entry is discarded.
+        """
+        self.client = client
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self.hits = 0
+        self.misses = 0
+        self._size = 0
+
+        os.makedirs(cache_dir, exist_ok=True)
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(
+            os.path.join(cache_dir, "responses.sqlite3"), check_same_thread=False
+        )
+        self._db.execute(
+            """CREATE TABLE IF NOT EXISTS responses (
+                key TEXT PRIMARY KEY,
+                response TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                created REAL NOT NULL,
+                last_used REAL NOT NULL
+            )"""
+        )
+        self._db.execute(
+            "CREATE INDEX IF NOT EXISTS responses_last_used ON responses (last_used)"
+        )
+        self._db.commit()
+        self.evict()
+
+    @property
+    def model(self) -> str:
+        """
+        str: The model of the wrapped client, if it has one.
+        """
+        return getattr(self.client, "model", "")
+
+    @property
+    def system_prompt(self) -> str:
+        """
+        str: The system prompt of the wrapped client, if it has one.
+        """
+        return getattr(self.client, "system_prompt", "")
+
+    @property
+    def system_prompt_configured(self) -> bool:
+        """
+        bool: Whether the wrapped client has a system prompt configured.
+        """
+        return getattr(self.client, "system_prompt_configured", False)
+
+    def cache_key(self, prompt: str, **kwargs) -> str:
+        """
+        Computes the content address of a request.
+
+        Args:
+            prompt (str): The prompt message to be sent.
+            **kwargs: The request options, which also distinguish entries.
+
+        Returns:
+            str: A hex digest identifying the request.
+        """
+        payload = json.dumps(
+            [
+                self.model,
+                kwargs.get("system_prompt", self.system_prompt),
+                config.DOCSTRING_STYLE_TYPE,
+                prompt,
+                sorted(kwargs.items()),
+            ],
+            default=str,
+        )
+        return hashlib.sha256(payload.encode("utf8")).hexdigest()
+
+    def send_prompt(self, prompt: str, **kwargs) -> str:
+        """
+        Returns the cached response for the prompt, asking the wrapped client on a miss.
+
+        Args:
+            prompt (str): The prompt message to be sent.
+            **kwargs: Passed through to the wrapped client.
+
+        Returns:
+            str: String with the response to the prompt.
+        """
+        key = self.cache_key(prompt, **kwargs)
+        if (response := self.get(key)) is not None:
+            return response
+
+        response = self.client.send_prompt(prompt, **kwargs)
+        self.put(key, response)
+        return response
+
+    async def send_prompt_async(self, prompt: str, **kwargs) -> str:
+        """
+        Async counterpart of `send_prompt`.
+
+        Args:
+            prompt (str): The prompt message to be sent.
+            **kwargs: Passed through to the wrapped client.
+
+        Returns:
+            str: String with the response to the prompt.
+        """
+        key = self.cache_key(prompt, **kwargs)
+        # Lookups and stores write to the database; keep them off the event loop.
+        if (response := await asyncio.to_thread(self.get, key)) is not None:
+            return response
+
+        response = await self.client.send_prompt_async(prompt, **kwargs)
+        await asyncio.to_thread(self.put, key, response)
+        return response
+
+    def get(self, key: str) -> str | None:
+        """
+        Looks up a response and marks it as recently used.
+
+        Args:
+            key (str): The key returned by `cache_key`.
+
+        Returns:
+            str | None: The cached response, or None on a miss or expired entry.
+        """
+        now = time.time()
+        with self._lock:
+            row = self._db.execute(
+                "SELECT response FROM responses WHERE key = ? AND created >= ?",
+                (key, now - self.max_age),
+            ).fetchone()
+            if row is None:
+                self.misses += 1
+                collector.count("cache_misses")
+                return None
+
+            self.hits += 1
+            collector.count("cache_hits")
+            self._db.execute(
+                "UPDATE responses SET last_used = ? WHERE key = ?", (now, key)
+            )
+            self._db.commit()
+            return row[0]
+
+    def put(self, key: str, response: str) -> None:
+        """
+        Stores a response, evicting old entries if the cache grew too large.
+        Failed responses are never stored.
+
+        Args:
+            key (str): The key returned by `cache_key`.
+            response (str): The response to store.
+        """
+        if response == "ERROR":
+            return
+
+        now = time.time()
+        size = len(response.encode("utf8"))
+        with self._lock:
+            row = self._db.execute(
+                "SELECT size FROM responses WHERE key = ?", (key,)
+            ).fetchone()
+            self._db.execute(
+                "INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?)",
+                (key, response, size, now, now),
+            )
+            self._db.commit()
+            # A replaced entry no longer counts towards the size.
+            self._size += size - (row[0] if row is not None else 0)
+        if self._size > self.max_bytes:
+            self.evict()
+
+    def evict(self) -> int:
+        """
+        Drops expired entries, then least recently used entries until the stored
+        responses fit in `max_bytes`.
+
+        Returns:
+            int: The number of evicted entries.
+        """
+        with self._lock:
+            evicted = self._db.execute(
+                "DELETE FROM responses WHERE created < ?",
+                (time.time() - self.max_age,),
+            ).rowcount
+            (size,) = self._db.execute(
+                "SELECT COALESCE(SUM(size), 0) FROM responses"
+            ).fetchone()
+            if size > self.max_bytes:
+                rows = self._db.execute(
+                    "SELECT key, size FROM responses ORDER BY last_used"
+                )
+                stale = []
+                for key, entry_size in rows:
+                    if size <= self.max_bytes:
+                        break
+                    stale.append((key,))
+                    size -= entry_size
+                self._db.executemany("DELETE FROM responses WHERE key = ?", stale)
+                evicted += len(stale)
+            self._db.commit()
+            self._size = size
+        return evicted
+
+    def stats(self) -> dict[str, int]:
+        """
+        Returns the hit/miss counters of this client.
+
+        Returns:
+            dict[str, int]: The number of cache hits and misses.
+        """
+        return {"hits": self.hits, "misses": self.misses}
+
+    def close(self) -> None:
+        """
+        Closes the cache database.
+        """
+        with self._lock:
+            self._db.close()
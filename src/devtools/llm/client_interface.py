@@ -1,3 +1,4 @@
+import asyncio
 from abc import ABC
 
 
@@ -35,3 +36,19 @@ class IClient(ABC):
             Any additional keyword arguments (**kwargs) are ignored.
         """
         raise NotImplemented()
+
+    async def send_prompt_async(self, prompt: str, **kwargs) -> str:
+        """
+        Sends a prompt message without blocking the event loop.
+
+        Subclasses with a native async transport should override this. The default
+        runs `send_prompt` in a worker thread so every client can be awaited.
+
+        Args:
+            prompt (str): The prompt message to be sent.
+            **kwargs: Passed through to `send_prompt`.
+
+        Returns:
+            str: String with the response to the prompt.
+        """
+        return await asyncio.to_thread(self.send_prompt, prompt, **kwargs)
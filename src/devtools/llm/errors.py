@@ -0,0 +1,20 @@
+class RetryableError(RuntimeError):
+    def __init__(self, message: str, *, retry_after: float | None = None):
+        """
+        A request failed in a way that may succeed if it is sent again, e.g. a
+        dropped connection or a 5xx response.
+
+        Args:
+            message (str): A description of the failure.
+            retry_after (float, optional): Seconds the server asked us to wait
+                before retrying, if it said so.
+        """
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class RateLimitedError(RetryableError):
+    """
+    The server throttled the request (HTTP 429). Clients should slow down, not
+    just retry.
+    """
@@ -1,13 +1,15 @@
 from devtools import config
+from devtools.llm.client_interface import IClient
 from devtools.llm.openai_client import OpenAIClient
 
 
-def create_openai_agent():
+def create_openai_agent() -> OpenAIClient:
     """
     Creates and returns an instance of the OpenAIClient class.
 
     The OpenAIClient constructor takes in two arguments: an auth dictionary containing
-    an 'api_key', and a config dictionary which is currently empty.
+    an 'api_key', and a config dictionary which is currently empty. Its HTTP
+    connections come from the process-wide pool in `devtools.llm.registry`.
 
     Returns:
         OpenAIClient: An instance of OpenAIClient with the given API key as its
@@ -19,7 +21,7 @@ def create_openai_agent():
 AGENT_LIBRARY = {"openai": create_openai_agent}
 
 
-def agent_factory(ai: str):
+def agent_factory(ai: str) -> IClient:
     """
     Creates an agent based on the provided AI identifier.
 
@@ -27,8 +29,10 @@ def agent_factory(ai: str):
         ai (str): The identifier of the AI agent to be created. This string should match an
         entry in AGENT_LIBRARY.
 
+    Returns:
+        IClient: The created agent, backed by the shared connection pool.
+
     Raises:
         KeyError: If the provided AI identifier does not exist in AGENT_LIBRARY.
     """
-    if ai.lower() in AGENT_LIBRARY:
-        AGENT_LIBRARY[ai.lower()]
+    return AGENT_LIBRARY[ai.lower()]()
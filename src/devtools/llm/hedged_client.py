@@ -0,0 +1,315 @@
+import asyncio
+import math
+import statistics
+import threading
+import time
+from collections import deque
+from typing import Sequence
+
+from devtools import config
+from devtools.llm import registry
+from devtools.llm.client_interface import IClient
+from devtools.metrics import collector
+
+
+class BackendStats:
+    """
+    Latency and error statistics of one backend of a `HedgedClient`, over a window
+    of its most recent requests.
+    """
+
+    def __init__(self, window: int = config.HEDGE_WINDOW) -> None:
+        """
+        Args:
+            window (int, optional): The number of recent latencies kept.
+        """
+        self.latencies: deque[float] = deque(maxlen=window)
+        self.requests = 0
+        self.errors = 0
+        self.wins = 0
+        # Exponentially weighted share of failed requests.
+        self.error_rate = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, seconds: float) -> None:
+        """
+        Records a successful request.
+
+        Args:
+            seconds (float): The latency of the request.
+        """
+        with self._lock:
+            self.latencies.append(seconds)
+            self.requests += 1
+            self.error_rate *= 1 - config.HEDGE_ERROR_DECAY
+
+    def fail(self) -> None:
+        """
+        Records a failed request.
+        """
+        with self._lock:
+            self.requests += 1
+            self.errors += 1
+            self.error_rate += config.HEDGE_ERROR_DECAY * (1 - self.error_rate)
+
+    def quantile(self, q: float) -> float | None:
+        """
+        Returns a latency quantile of the recent requests.
+
+        Args:
+            q (float): The quantile, between 0 and 1.
+
+        Returns:
+            float | None: The latency in seconds, or None until
+                `config.HEDGE_MIN_SAMPLES` requests succeeded.
+        """
+        with self._lock:
+            if len(self.latencies) < config.HEDGE_MIN_SAMPLES:
+                return None
+            latencies = sorted(self.latencies)
+        return latencies[min(int(q * len(latencies)), len(latencies) - 1)]
+
+    @property
+    def cost(self) -> float:
+        """
+        float: The expected latency of a request, inflated by the error rate. 0
+        for a backend that was not tried yet, so it is tried first, and infinite
+        for one that only failed so far.
+        """
+        with self._lock:
+            if not self.latencies:
+                return math.inf if self.errors else 0.0
+            median = statistics.median(self.latencies)
+        return median / max(1 - self.error_rate, 0.01)
+
+
+class HedgedClient(IClient):
+    """
+    Spreads requests over a pool of interchangeable backends, e.g. different
+    models or endpoints, to cut tail latency.
+
+    Every request goes to the backend with the lowest expected latency first. If
+    it has not answered once its usual latency is exceeded (the `hedge_quantile`
+    of its recent requests), a duplicate is sent to the next backend; the first
+    good answer wins and the others are cancelled. A backend that fails hands the
+    request to the next one right away.
+    """
+
+    def __init__(
+        self,
+        backends: Sequence[IClient],
+        *,
+        hedge_quantile: float = config.HEDGE_QUANTILE,
+        max_hedges: int = config.HEDGE_MAX,
+        initial_delay: float = config.HEDGE_INITIAL_DELAY,
+        min_delay: float = config.HEDGE_MIN_DELAY,
+    ):
+        """
+        Args:
+            backends (Sequence[IClient]): The pool, in order of preference while
+                they have no statistics yet.
+            hedge_quantile (float, optional): Latency quantile of a backend after
+                which a duplicate is sent.
+            max_hedges (int, optional): Duplicates sent per request at most, not
+                counting the ones replacing failed requests.
+            initial_delay (float, optional): Seconds to wait before hedging while
+                a backend has too few samples to estimate its quantile.
+            min_delay (float, optional): Lower bound of the wait before hedging.
+
+        Raises:
+            ValueError: If the pool is empty.
+        """
+        if not backends:
+            raise ValueError("`backends` must not be empty")
+
+        self.backends = list(backends)
+        self.stats = [BackendStats() for _ in self.backends]
+        self.hedge_quantile = hedge_quantile
+        self.max_hedges = max_hedges
+        self.initial_delay = initial_delay
+        self.min_delay = min_delay
+        self.hedges = 0
+
+    @property
+    def model(self) -> str:
+        """
+        str: The models of the pool, joined by `|`. Any of them may answer a
+        request, so together they identify its response, e.g. in cache keys.
+        """
+        models = (getattr(backend, "model", "") for backend in self.backends)
+        return "|".join(dict.fromkeys(models))
+
+    @property
+    def system_prompt(self) -> str:
+        """
+        str: The system prompt of the first backend, if it has one.
+        """
+        return getattr(self.backends[0], "system_prompt", "")
+
+    @property
+    def system_prompt_configured(self) -> bool:
+        """
+        bool: Whether the first backend has a system prompt configured.
+        """
+        return getattr(self.backends[0], "system_prompt_configured", False)
+
+    def send_prompt(self, prompt: str, **kwargs) -> str:
+        """
+        Sends a prompt, hedging as needed. Runs its own event loop, so it must not
+        be called from a running one; prefer `send_prompt_async`.
+
+        Args:
+            prompt (str): The prompt message to be sent.
+            **kwargs: Passed through to the backends.
+
+        Returns:
+            str: The first good response.
+
+        Raises:
+            Exception: The error of the last backend tried if every backend failed.
+        """
+
+        async def run() -> str:
+            try:
+                return await self.send_prompt_async(prompt, **kwargs)
+            finally:
+                await registry.aclose_loop()
+
+        return asyncio.run(run())
+
+    async def send_prompt_async(self, prompt: str, **kwargs) -> str:
+        """
+        Async counterpart of `send_prompt`.
+
+        Args:
+            prompt (str): The prompt message to be sent.
+            **kwargs: Passed through to the backends.
+
+        Returns:
+            str: The first good response, or the last response if no backend gave
+                a good one.
+
+        Raises:
+            Exception: The error of the last backend tried if every backend failed.
+        """
+        candidates = self.ranked()
+        pending: dict[asyncio.Task, int] = {}
+        hedges = 0
+        error: BaseException | None = None
+        response: str | None = None
+
+        def launch() -> float | None:
+            """
+            Sends the request to the next candidate.
+
+            Returns:
+                float | None: Seconds to wait for it before hedging, or None if no
+                    further hedge may be sent.
+            """
+            i = candidates.pop(0)
+            task = asyncio.create_task(self._send(i, prompt, **kwargs))
+            pending[task] = i
+            if not candidates or hedges >= self.max_hedges:
+                return None
+            return self.hedge_delay(i)
+
+        try:
+            delay = launch()
+            while pending:
+                done, _ = await asyncio.wait(
+                    pending, timeout=delay, return_when=asyncio.FIRST_COMPLETED
+                )
+                if not done:
+                    # The request is slower than usual: hedge it.
+                    hedges += 1
+                    self.hedges += 1
+                    collector.count("hedged_requests")
+                    delay = launch()
+                    continue
+
+                for task in done:
+                    i = pending.pop(task)
+                    if task.exception() is not None:
+                        error = task.exception()
+                        continue
+                    result = task.result()
+                    if _is_good(result):
+                        self.stats[i].wins += 1
+                        return result
+                    response = result
+                if candidates and not pending:
+                    # Replace the failed request right away.
+                    delay = launch()
+        finally:
+            for task in pending:
+                task.cancel()
+            if pending:
+                collector.count("hedges_cancelled", len(pending))
+                await asyncio.gather(*pending, return_exceptions=True)
+
+        if response is not None:
+            return response
+        assert error is not None, "no backend answered or failed"
+        raise error
+
+    def ranked(self) -> list[int]:
+        """
+        Orders the backends by their expected latency, see `BackendStats.cost`.
+
+        Returns:
+            list[int]: The backend indices, preferred first.
+        """
+        return sorted(range(len(self.backends)), key=lambda i: self.stats[i].cost)
+
+    def hedge_delay(self, i: int) -> float:
+        """
+        Returns how long to wait for a backend before sending a duplicate.
+
+        Args:
+            i (int): The index of the backend.
+
+        Returns:
+            float: The delay in seconds.
+        """
+        latency = self.stats[i].quantile(self.hedge_quantile)
+        return max(self.initial_delay if latency is None else latency, self.min_delay)
+
+    async def _send(self, i: int, prompt: str, **kwargs) -> str:
+        """
+        Sends a prompt to one backend and records the outcome in its statistics.
+        Cancelled requests are not recorded.
+
+        Args:
+            i (int): The index of the backend.
+            prompt (str): The prompt message to be sent.
+            **kwargs: Passed through to the backend.
+
+        Returns:
+            str: The response of the backend.
+        """
+        start = time.perf_counter()
+        try:
+            response = await self.backends[i].send_prompt_async(prompt, **kwargs)
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            self.stats[i].fail()
+            raise
+        if _is_good(response):
+            self.stats[i].observe(time.perf_counter() - start)
+        else:
+            self.stats[i].fail()
+        return response
+
+
+def _is_good(response: str) -> bool:
+    """
+    Checks whether a response can be used, see `OpenAIClient.send_prompt`.
+
+    Args:
+        response (str): The response of a backend.
+
+    Returns:
+        bool: False for the `ERROR` placeholder of a missing completion.
+    """
+    return response != "ERROR"
@@ -1,8 +1,21 @@
-from openai import OpenAI
+from contextlib import contextmanager
+from typing import IO, Callable, Iterator, Mapping
+
+import openai
+from openai import AsyncOpenAI
+from openai.types import Batch
 from rich import print
 
 from devtools.config import system_prompt
+from devtools.llm import registry
 from devtools.llm.client_interface import IClient
+from devtools.llm.errors import RateLimitedError, RetryableError
+from devtools.metrics import collector
+
+# HTTP statuses worth retrying besides 429.
+RETRYABLE_STATUSES = {408, 409, 500, 502, 503, 504}
+# Endpoint of the requests sent through the Batch API.
+BATCH_ENDPOINT = "/v1/chat/completions"
 
 
 class OpenAIClient(IClient):
@@ -14,7 +27,9 @@ class OpenAIClient(IClient):
             auth (dict): The dictionary containing API key. It must contain an 'api_key' key.
             config (dict): The configuration dictionary. This can contain 'model' and
                            'system_prompt' keys. Defaults to 'gpt-4' for 'model' and
-                           SYSTEM_PROMPT for 'system_prompt' if not provided.
+                           SYSTEM_PROMPT for 'system_prompt' if not provided. It may
+                           also set 'base_url', 'timeout' and 'max_retries' (the
+                           openai library's own retries, 2 by default).
 
         Raises:
             RuntimeError: If 'api_key' is not found in the 'auth' dictionary.
@@ -27,7 +42,25 @@ class OpenAIClient(IClient):
         self.system_prompt = config.get(
             "system_prompt", system_prompt(config.get("language", "programming"))
         )
-        self.client = OpenAI(api_key=api_key)
+        # A configured system prompt takes precedence over the per-language ones.
+        self.system_prompt_configured = "system_prompt" in config
+        self._client_options = {
+            "api_key": api_key,
+            "base_url": config.get("base_url"),
+            "max_retries": config.get("max_retries", 2),
+            "timeout": config.get("timeout"),
+        }
+        self.client = registry.openai_client(**self._client_options)
+        # Called with the response headers of every request, e.g. to track the
+        # rate limits reported by the server.
+        self.header_listeners: list[Callable[[Mapping[str, str]], None]] = []
+
+    @property
+    def async_client(self) -> AsyncOpenAI:
+        """
+        AsyncOpenAI: The pooled async client of the running event loop.
+        """
+        return registry.async_openai_client(**self._client_options)
 
     def send_prompt(self, prompt: str, **kwargs) -> str:
         """
@@ -40,12 +73,149 @@ class OpenAIClient(IClient):
         Returns:
             str: The server's response to the chat prompt, or 'ERROR' if response content is None.
         """
-        response = self.client.chat.completions.create(
+        with collector.stage("request"), _translate_errors():
+            raw = self.client.chat.completions.with_raw_response.create(
+                **self._completion_params(prompt, **kwargs)
+            )
+        response = self._parse(raw)
+        if (res := response.choices[0].message.content) is not None:
+            return res
+
+        return "ERROR"
+
+    async def send_prompt_async(self, prompt: str, **kwargs) -> str:
+        """
+        Sends a chat prompt through the async client and awaits the response.
+
+        Args:
+            prompt (str): The string to send as the user input.
+            **kwargs: Additional key-value pairs to be passed to `completions.create`.
+
+        Returns:
+            str: The server's response to the chat prompt, or 'ERROR' if response content is None.
+        """
+        with collector.stage("request"), _translate_errors():
+            raw = await self.async_client.chat.completions.with_raw_response.create(
+                **self._completion_params(prompt, **kwargs)
+            )
+        response = self._parse(raw)
+        if (res := response.choices[0].message.content) is not None:
+            return res
+
+        return "ERROR"
+
+    def batch_request(self, custom_id: str, prompt: str, **kwargs) -> dict:
+        """
+        Builds one line of a Batch API input file: the chat completion request
+        `send_prompt` would send.
+
+        Args:
+            custom_id (str): Identifies the request's result in the output file.
+            prompt (str): The string to send as the user input.
+            **kwargs: Request overrides, as for `send_prompt`.
+
+        Returns:
+            dict: The request, to be serialized as one JSON line.
+        """
+        return {
+            "custom_id": custom_id,
+            "method": "POST",
+            "url": BATCH_ENDPOINT,
+            "body": self._completion_params(prompt, **kwargs),
+        }
+
+    def submit_batch(
+        self, requests: bytes | IO[bytes], *, metadata: dict[str, str] | None = None
+    ) -> str:
+        """
+        Uploads a Batch API input file and starts processing it.
+
+        Args:
+            requests (bytes | IO[bytes]): The JSONL input file or its content, see
+                `batch_request`.
+            metadata (dict, optional): Strings attached to the batch.
+
+        Returns:
+            str: The id of the batch.
+        """
+        with _translate_errors():
+            file = (
+                ("batch.jsonl", requests) if isinstance(requests, bytes) else requests
+            )
+            uploaded = self.client.files.create(file=file, purpose="batch")
+            batch = self.client.batches.create(
+                input_file_id=uploaded.id,
+                endpoint=BATCH_ENDPOINT,
+                completion_window="24h",
+                metadata=metadata or openai.omit,
+            )
+        collector.count("batches_submitted")
+        return batch.id
+
+    def retrieve_batch(self, batch_id: str) -> Batch:
+        """
+        Fetches the state of a batch.
+
+        Args:
+            batch_id (str): The id returned by `submit_batch`.
+
+        Returns:
+            Batch: The batch, with its `status`, `request_counts` and output files.
+        """
+        with _translate_errors():
+            return self.client.batches.retrieve(batch_id)
+
+    def download_file(self, file_id: str) -> str:
+        """
+        Downloads a file, e.g. the output file of a completed batch.
+
+        Args:
+            file_id (str): The id of the file.
+
+        Returns:
+            str: The content of the file.
+        """
+        with _translate_errors():
+            return self.client.files.content(file_id).text
+
+    def _parse(self, raw):
+        """
+        Notifies the header listeners, parses a raw completion response and
+        records its token usage.
+
+        Args:
+            raw: The raw response returned by `with_raw_response.create`.
+
+        Returns:
+            ChatCompletion: The parsed completion.
+        """
+        for listener in self.header_listeners:
+            listener(raw.headers)
+        response = raw.parse()
+        collector.count("requests")
+        if response.usage is not None:
+            collector.count("prompt_tokens", response.usage.prompt_tokens)
+            collector.count("completion_tokens", response.usage.completion_tokens)
+        return response
+
+    def _completion_params(self, prompt: str, **kwargs) -> dict:
+        """
+        Builds the keyword arguments for a chat completion request.
+
+        Args:
+            prompt (str): The string to send as the user input.
+            **kwargs: Request overrides; 'max_tokens', 'system_prompt' and
+                'response_format' are honored.
+
+        Returns:
+            dict: Keyword arguments for `chat.completions.create`.
+        """
+        params = dict(
             model=self.model,
             messages=[
                 {
                     "role": "system",
-                    "content": self.system_prompt,
+                    "content": kwargs.get("system_prompt", self.system_prompt),
                 },
                 {"role": "user", "content": prompt},
             ],
@@ -55,7 +225,51 @@ class OpenAIClient(IClient):
             frequency_penalty=0,
             presence_penalty=0,
         )
-        if (res := response.choices[0].message.content) is not None:
-            return res
+        if "response_format" in kwargs:
+            params["response_format"] = kwargs["response_format"]
 
-        return "ERROR"
+        return params
+
+
+@contextmanager
+def _translate_errors() -> Iterator[None]:
+    """
+    Re-raises transient openai errors as `RetryableError`/`RateLimitedError` so
+    client wrappers can handle them without depending on openai.
+
+    Raises:
+        RateLimitedError: If the server throttled the request.
+        RetryableError: If the request failed transiently.
+    """
+    try:
+        yield
+    except openai.RateLimitError as e:
+        raise RateLimitedError(
+            str(e), retry_after=retry_after(e.response.headers)
+        ) from e
+    except openai.APIStatusError as e:
+        if e.status_code not in RETRYABLE_STATUSES:
+            raise
+        raise RetryableError(str(e), retry_after=retry_after(e.response.headers)) from e
+    except openai.APIConnectionError as e:
+        raise RetryableError(str(e)) from e
+
+
+def retry_after(headers: Mapping[str, str]) -> float | None:
+    """
+    Reads how long the server asked clients to wait from the response headers.
+
+    Args:
+        headers (Mapping[str, str]): The response headers.
+
+    Returns:
+        float | None: The delay in seconds, or None if the server did not say.
+    """
+    try:
+        if (ms := headers.get("retry-after-ms")) is not None:
+            return float(ms) / 1000
+        if (seconds := headers.get("retry-after")) is not None:
+            return float(seconds)
+    except ValueError:
+        pass
+    return None
@@ -0,0 +1,367 @@
+import asyncio
+import itertools
+import random
+import re
+import threading
+import time
+import weakref
+from typing import Mapping
+
+from devtools import config
+from devtools.batching import estimate_tokens
+from devtools.llm.client_interface import IClient
+from devtools.llm.errors import RateLimitedError, RetryableError
+from devtools.metrics import collector
+
+_DURATION_PART = re.compile(r"(\d+(?:\.\d+)?)(ms|s|m|h)")
+_DURATION_UNITS = {"ms": 0.001, "s": 1, "m": 60, "h": 3600}
+
+
+class TokenBucket:
+    """
+    A thread-safe token bucket refilled continuously at `per_minute / 60` per second.
+
+    Reservations may overdraw the bucket; the caller is told how long to wait
+    until its reservation is covered, which keeps requests in arrival order.
+    """
+
+    def __init__(self, per_minute: float) -> None:
+        """
+        Args:
+            per_minute (float): The sustained rate, which is also the burst size.
+        """
+        self.per_minute = per_minute
+        self._level = per_minute
+        self._updated = time.monotonic()
+        self._paused_until = 0.0
+        self._lock = threading.Lock()
+
+    def reserve(self, amount: float) -> float:
+        """
+        Takes `amount` from the bucket.
+
+        Args:
+            amount (float): The number of requests or tokens to reserve.
+
+        Returns:
+            float: Seconds to wait before the reservation may be used.
+        """
+        with self._lock:
+            now = time.monotonic()
+            rate = self.per_minute / 60
+            self._level = min(
+                self.per_minute, self._level + (now - self._updated) * rate
+            )
+            self._updated = now
+            self._level -= min(amount, self.per_minute)
+            wait = -self._level / rate if self._level < 0 else 0.0
+            return max(wait, self._paused_until - now)
+
+    def pause(self, seconds: float) -> None:
+        """
+        Holds back every reservation for `seconds`, e.g. because the server reported
+        the quota as exhausted.
+
+        Args:
+            seconds (float): How long to pause.
+        """
+        with self._lock:
+            self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+
+
+class AdaptiveConcurrency:
+    """
+    An async concurrency limit adjusted by additive-increase/multiplicative-decrease:
+    every success grows the limit by roughly one per round of requests, every
+    throttling event halves it.
+    """
+
+    def __init__(
+        self, max_limit: int, *, min_limit: int = 1, decrease_interval: float = 1.0
+    ) -> None:
+        """
+        Args:
+            max_limit (int): The upper bound and starting value of the limit.
+            min_limit (int, optional): The lower bound of the limit.
+            decrease_interval (float, optional): Throttling events within this many
+                seconds of a decrease count as the same congestion signal.
+        """
+        self.max_limit = max_limit
+        self.min_limit = min_limit
+        self.decrease_interval = decrease_interval
+        self.limit = float(max_limit)
+        self.in_flight = 0
+        self._last_decrease = 0.0
+        self._conditions: weakref.WeakKeyDictionary = weakref.WeakKeyDictionary()
+
+    def _condition(self) -> asyncio.Condition:
+        """
+        Returns the condition of the running event loop; asyncio primitives cannot
+        be shared between loops.
+
+        Returns:
+            asyncio.Condition: The condition guarding `in_flight`.
+        """
+        loop = asyncio.get_running_loop()
+        if (condition := self._conditions.get(loop)) is None:
+            condition = self._conditions[loop] = asyncio.Condition()
+        return condition
+
+    async def __aenter__(self) -> None:
+        condition = self._condition()
+        async with condition:
+            await condition.wait_for(lambda: self.in_flight < int(self.limit))
+            self.in_flight += 1
+
+    async def __aexit__(self, *exc_info) -> None:
+        condition = self._condition()
+        async with condition:
+            self.in_flight -= 1
+            condition.notify_all()
+
+    def increase(self) -> None:
+        """
+        Additively grows the limit after a successful request.
+        """
+        self.limit = min(self.max_limit, self.limit + 1 / self.limit)
+
+    def decrease(self) -> None:
+        """
+        Multiplicatively shrinks the limit after the server throttled a request.
+        """
+        now = time.monotonic()
+        if now - self._last_decrease >= self.decrease_interval:
+            self.limit = max(self.min_limit, self.limit / 2)
+            self._last_decrease = now
+
+
+class RateLimitedClient(IClient):
+    """
+    Wraps any `IClient` with rate limiting and retries.
+
+    Requests are paced by token buckets for requests and tokens per minute, failed
+    requests raising `RetryableError` are retried with jittered exponential backoff
+    (honoring the server's retry-after), and the number of concurrent async
+    requests adapts to throttling. If the wrapped client reports response headers
+    (see `OpenAIClient.header_listeners`), the quotas advertised in the
+    `x-ratelimit-*` headers are adopted and exhausted quotas pause the buckets
+    until they reset.
+    """
+
+    def __init__(
+        self,
+        client: IClient,
+        *,
+        requests_per_minute: float | None = None,
+        tokens_per_minute: float | None = None,
+        max_concurrency: int = config.MAX_CONCURRENCY,
+        max_retries: int = 6,
+        base_delay: float = 0.5,
+        max_delay: float = 60.0,
+    ):
+        """
+        Args:
+            client (IClient): The client to wrap.
+            requests_per_minute (float, optional): Request quota. Learned from the
+                response headers if omitted.
+            tokens_per_minute (float, optional): Token quota. Learned from the
+                response headers if omitted.
+            max_concurrency (int, optional): Upper bound of concurrent async requests.
+            max_retries (int, optional): Retries per request before giving up.
+            base_delay (float, optional): Backoff of the first retry in seconds.
+            max_delay (float, optional): Upper bound of a single backoff in seconds.
+        """
+        self.client = client
+        self.requests = (
+            TokenBucket(requests_per_minute) if requests_per_minute else None
+        )
+        self.tokens = TokenBucket(tokens_per_minute) if tokens_per_minute else None
+        self.concurrency = AdaptiveConcurrency(max_concurrency)
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.retries = 0
+        self.throttled = 0
+
+        if (listeners := getattr(client, "header_listeners", None)) is not None:
+            listeners.append(self.observe_headers)
+
+    @property
+    def model(self) -> str:
+        """
+        str: The model of the wrapped client, if it has one.
+        """
+        return getattr(self.client, "model", "")
+
+    @property
+    def system_prompt(self) -> str:
+        """
+        str: The system prompt of the wrapped client, if it has one.
+        """
+        return getattr(self.client, "system_prompt", "")
+
+    @property
+    def system_prompt_configured(self) -> bool:
+        """
+        bool: Whether the wrapped client has a system prompt configured.
+        """
+        return getattr(self.client, "system_prompt_configured", False)
+
+    def send_prompt(self, prompt: str, **kwargs) -> str:
+        """
+        Sends a prompt through the wrapped client, pacing and retrying as needed.
+
+        Args:
+            prompt (str): The prompt message to be sent.
+            **kwargs: Passed through to the wrapped client.
+
+        Returns:
+            str: String with the response to the prompt.
+
+        Raises:
+            RetryableError: If the request still fails after `max_retries` retries.
+        """
+        for attempt in itertools.count():
+            time.sleep(self._reserve(prompt, **kwargs))
+            try:
+                response = self.client.send_prompt(prompt, **kwargs)
+            except RetryableError as e:
+                time.sleep(self._on_failure(e, attempt))
+            else:
+                self.concurrency.increase()
+                return response
+        # `_on_failure` raises once the retries are used up.
+        raise AssertionError("unreachable")
+
+    async def send_prompt_async(self, prompt: str, **kwargs) -> str:
+        """
+        Async counterpart of `send_prompt` that also applies the adaptive
+        concurrency limit.
+
+        Args:
+            prompt (str): The prompt message to be sent.
+            **kwargs: Passed through to the wrapped client.
+
+        Returns:
+            str: String with the response to the prompt.
+
+        Raises:
+            RetryableError: If the request still fails after `max_retries` retries.
+        """
+        for attempt in itertools.count():
+            await asyncio.sleep(self._reserve(prompt, **kwargs))
+            try:
+                async with self.concurrency:
+                    response = await self.client.send_prompt_async(prompt, **kwargs)
+            except RetryableError as e:
+                await asyncio.sleep(self._on_failure(e, attempt))
+            else:
+                self.concurrency.increase()
+                return response
+        # `_on_failure` raises once the retries are used up.
+        raise AssertionError("unreachable")
+
+    def observe_headers(self, headers: Mapping[str, str]) -> None:
+        """
+        Adopts the quotas reported by the server and pauses a bucket whose quota is
+        exhausted until the server says it resets.
+
+        Args:
+            headers (Mapping[str, str]): The headers of a response.
+        """
+        for kind in ("requests", "tokens"):
+            bucket = getattr(self, kind)
+            limit = _to_float(headers.get(f"x-ratelimit-limit-{kind}"))
+            if bucket is None and limit:
+                bucket = TokenBucket(limit)
+                setattr(self, kind, bucket)
+            remaining = _to_float(headers.get(f"x-ratelimit-remaining-{kind}"))
+            reset = parse_duration(headers.get(f"x-ratelimit-reset-{kind}"))
+            if bucket is not None and remaining == 0 and reset:
+                bucket.pause(reset)
+
+    def _reserve(self, prompt: str, **kwargs) -> float:
+        """
+        Reserves one request and the estimated tokens of a prompt.
+
+        Args:
+            prompt (str): The prompt message to be sent.
+            **kwargs: The request options; 'max_tokens' counts towards the tokens.
+
+        Returns:
+            float: Seconds to wait before sending the request.
+        """
+        wait = self.requests.reserve(1) if self.requests else 0.0
+        if self.tokens:
+            tokens = estimate_tokens(kwargs.get("system_prompt", self.system_prompt))
+            tokens += estimate_tokens(prompt) + kwargs.get("max_tokens", 500)
+            wait = max(wait, self.tokens.reserve(tokens))
+        return wait
+
+    def _on_failure(self, error: RetryableError, attempt: int) -> float:
+        """
+        Records a failed attempt and computes the backoff before the next one.
+
+        Args:
+            error (RetryableError): The failure.
+            attempt (int): The zero-based number of the failed attempt.
+
+        Returns:
+            float: Seconds to wait before retrying.
+
+        Raises:
+            RetryableError: If no retries are left.
+        """
+        if isinstance(error, RateLimitedError):
+            self.throttled += 1
+            collector.count("throttled")
+            self.concurrency.decrease()
+        if attempt >= self.max_retries:
+            raise error
+
+        self.retries += 1
+        collector.count("retries")
+        # Full jitter, but never earlier than the server asked for.
+        delay = random.uniform(0, min(self.max_delay, self.base_delay * 2**attempt))
+        if error.retry_after is not None:
+            delay = max(delay, min(error.retry_after, self.max_delay))
+            for bucket in (self.requests, self.tokens):
+                if bucket is not None:
+                    bucket.pause(delay)
+        return delay
+
+
+def parse_duration(value: str | None) -> float | None:
+    """
+    Parses the reset durations used in rate-limit headers, e.g. `1s`, `6m0s` or `20ms`.
+
+    Args:
+        value (str | None): The header value.
+
+    Returns:
+        float | None: The duration in seconds, or None if it cannot be parsed.
+    """
+    if not value:
+        return None
+    if (seconds := _to_float(value)) is not None:
+        return seconds
+    parts = _DURATION_PART.findall(value)
+    if not parts:
+        return None
+    return sum(float(amount) * _DURATION_UNITS[unit] for amount, unit in parts)
+
+
+def _to_float(value: str | None) -> float | None:
+    """
+    Converts a header value to a float.
+
+    Args:
+        value (str | None): The header value.
+
+    Returns:
+        float | None: The number, or None if it is missing or malformed.
+    """
+    try:
+        return float(value) if value is not None else None
+    except ValueError:
+        return None
@@ -0,0 +1,243 @@
+"""
+Process-wide registry of LLM clients backed by one shared HTTP connection pool.
+
+Every `OpenAIClient`, wrapper and worker of a process goes through this module,
+so connections are kept alive and reused instead of each client paying for its
+own TCP and TLS handshakes. Async clients are kept per event loop because their
+connections cannot outlive the loop that opened them; `aclose_loop` closes them
+before the loop ends.
+"""
+
+import asyncio
+import atexit
+import importlib.util
+import threading
+import weakref
+
+import httpx
+from openai import AsyncOpenAI, OpenAI
+
+from devtools import config
+
+_lock = threading.Lock()
+_pool_options: dict = {}
+_http_client: httpx.Client | None = None
+# Event loop -> httpx.AsyncClient
+_async_http_clients: weakref.WeakKeyDictionary = weakref.WeakKeyDictionary()
+_openai_clients: dict[tuple, OpenAI] = {}
+# Event loop -> {options: AsyncOpenAI}
+_async_openai_clients: weakref.WeakKeyDictionary = weakref.WeakKeyDictionary()
+
+
+def configure_pool(
+    *,
+    max_connections: int = config.HTTP_MAX_CONNECTIONS,
+    max_keepalive_connections: int = config.HTTP_MAX_KEEPALIVE_CONNECTIONS,
+    keepalive_expiry: float = config.HTTP_KEEPALIVE_EXPIRY,
+    timeout: float = config.HTTP_TIMEOUT,
+    http2: bool = config.HTTP2,
+) -> None:
+    """
+    Sets the options of the shared connection pool. Clients handed out afterwards
+    use the new pool; existing pools are closed.
+
+    Args:
+        max_connections (int, optional): Upper bound of open connections.
+        max_keepalive_connections (int, optional): Idle connections kept open.
+        keepalive_expiry (float, optional): Seconds an idle connection is kept.
+        timeout (float, optional): Default request timeout in seconds.
+        http2 (bool, optional): Negotiate HTTP/2; requires the `h2` package.
+
+    Raises:
+        RuntimeError: If HTTP/2 is requested but `h2` is not installed.
+    """
+    if http2 and importlib.util.find_spec("h2") is None:
+        raise RuntimeError(
+            "HTTP/2 requires the `h2` package: pip install 'httpx[http2]'"
+        )
+
+    close_all()
+    with _lock:
+        _pool_options.update(
+            _pool_settings(
+                max_connections,
+                max_keepalive_connections,
+                keepalive_expiry,
+                timeout,
+                http2,
+            )
+        )
+
+
+def http_client() -> httpx.Client:
+    """
+    Returns the shared synchronous HTTP client.
+
+    Returns:
+        httpx.Client: The pooled client.
+    """
+    global _http_client
+    with _lock:
+        if _http_client is None:
+            _http_client = httpx.Client(**_options())
+        return _http_client
+
+
+def async_http_client() -> httpx.AsyncClient:
+    """
+    Returns the shared asynchronous HTTP client of the running event loop.
+
+    Returns:
+        httpx.AsyncClient: The pooled client.
+    """
+    loop = asyncio.get_running_loop()
+    with _lock:
+        if (client := _async_http_clients.get(loop)) is None:
+            client = _async_http_clients[loop] = httpx.AsyncClient(**_options())
+        return client
+
+
+def openai_client(
+    *,
+    api_key: str,
+    base_url: str | None = None,
+    max_retries: int = 2,
+    timeout: float | None = None,
+) -> OpenAI:
+    """
+    Returns an OpenAI client on the shared pool, reusing one per set of options.
+
+    Args:
+        api_key (str): The API key.
+        base_url (str, optional): Overrides the API endpoint.
+        max_retries (int, optional): Retries done by the openai library itself.
+        timeout (float, optional): Overrides the pool's request timeout.
+
+    Returns:
+        OpenAI: The client.
+    """
+    key = (api_key, base_url, max_retries, timeout)
+    if (client := _openai_clients.get(key)) is None:
+        client = OpenAI(**_openai_options(*key), http_client=http_client())
+        client = _openai_clients.setdefault(key, client)
+    return client
+
+
+def async_openai_client(
+    *,
+    api_key: str,
+    base_url: str | None = None,
+    max_retries: int = 2,
+    timeout: float | None = None,
+) -> AsyncOpenAI:
+    """
+    Async counterpart of `openai_client`, scoped to the running event loop.
+
+    Args:
+        api_key (str): The API key.
+        base_url (str, optional): Overrides the API endpoint.
+        max_retries (int, optional): Retries done by the openai library itself.
+        timeout (float, optional): Overrides the pool's request timeout.
+
+    Returns:
+        AsyncOpenAI: The client.
+    """
+    key = (api_key, base_url, max_retries, timeout)
+    http = async_http_client()
+    with _lock:
+        clients = _async_openai_clients.setdefault(asyncio.get_running_loop(), {})
+        if (client := clients.get(key)) is None:
+            client = clients[key] = AsyncOpenAI(
+                **_openai_options(*key), http_client=http
+            )
+        return client
+
+
+async def aclose_loop() -> None:
+    """
+    Closes the async pool of the running event loop and forgets its clients.
+    Async clients handed out afterwards open a new pool.
+    """
+    loop = asyncio.get_running_loop()
+    with _lock:
+        client = _async_http_clients.pop(loop, None)
+        _async_openai_clients.pop(loop, None)
+    if client is not None:
+        await client.aclose()
+
+
+def close_all() -> None:
+    """
+    Closes the shared synchronous pool and forgets every handed out client.
+    Async pools can only be closed from their own event loop, see `aclose_loop`.
+    """
+    global _http_client
+    with _lock:
+        if _http_client is not None:
+            _http_client.close()
+        _http_client = None
+        _openai_clients.clear()
+        _async_http_clients.clear()
+        _async_openai_clients.clear()
+
+
+def _options() -> dict:
+    """
+    Returns the pool options, applying the defaults on first use.
+
+    Returns:
+        dict: Keyword arguments for `httpx.Client`/`httpx.AsyncClient`.
+    """
+    if not _pool_options:
+        _pool_options.update(
+            _pool_settings(
+                config.HTTP_MAX_CONNECTIONS,
+                config.HTTP_MAX_KEEPALIVE_CONNECTIONS,
+                config.HTTP_KEEPALIVE_EXPIRY,
+                config.HTTP_TIMEOUT,
+                config.HTTP2,
+            )
+        )
+    return _pool_options
+
+
+def _pool_settings(
+    max_connections: int,
+    max_keepalive_connections: int,
+    keepalive_expiry: float,
+    timeout: float,
+    http2: bool,
+) -> dict:
+    """
+    Translates the pool options of `configure_pool` into httpx arguments.
+
+    Returns:
+        dict: Keyword arguments for `httpx.Client`/`httpx.AsyncClient`.
+    """
+    return {
+        "limits": httpx.Limits(
+            max_connections=max_connections,
+            max_keepalive_connections=max_keepalive_connections,
+            keepalive_expiry=keepalive_expiry,
+        ),
+        "timeout": httpx.Timeout(timeout),
+        "http2": http2,
+    }
+
+
+def _openai_options(
+    api_key: str, base_url: str | None, max_retries: int, timeout: float | None
+) -> dict:
+    """
+    Builds the constructor arguments shared by the sync and async openai clients.
+
+    Returns:
+        dict: Keyword arguments for `OpenAI`/`AsyncOpenAI`.
+    """
+    options = {"api_key": api_key, "base_url": base_url, "max_retries": max_retries}
+    if timeout is not None:
+        options["timeout"] = timeout
+    return options
+
+
+atexit.register(close_all)
@@ -0,0 +1,340 @@
+"""
+Per-stage timings and counters of docstring runs.
+
+Stages (reading, parsing, querying, LLM requests, insertion, formatting, writing)
+are timed with `collector.stage(name)` and counted events with
+`collector.count(name)`; stages may nest, e.g. `format` runs inside `insert`.
+High-water marks such as the peak RSS are kept with `collector.maximum(name)`. The
+process-wide `collector` can be exported as a JSON summary or a Prometheus
+textfile at the end of a run. Worker processes hand their measurements to the
+parent with `drain` and `merge`.
+"""
+
+import bisect
+import functools
+import inspect
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Iterator
+
+# Upper bounds, in seconds, of the stage duration histogram buckets.
+BUCKETS = (
+    0.0001,
+    0.0005,
+    0.001,
+    0.005,
+    0.01,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1.0,
+    2.5,
+    5.0,
+    10.0,
+    30.0,
+    60.0,
+)
+
+
+class Histogram:
+    """
+    A cumulative-bucket histogram of durations in the style of Prometheus.
+    """
+
+    def __init__(self) -> None:
+        # counts[i] holds the observations in (BUCKETS[i - 1], BUCKETS[i]]; the
+        # last entry counts everything above the largest bucket.
+        self.counts = [0] * (len(BUCKETS) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    def observe(self, value: float) -> None:
+        """
+        Records one observation.
+
+        Args:
+            value (float): The duration in seconds.
+        """
+        self.counts[bisect.bisect_left(BUCKETS, value)] += 1
+        self.count += 1
+        self.sum += value
+        self.max = max(self.max, value)
+
+    def merge(self, other: "Histogram") -> None:
+        """
+        Adds the observations of another histogram.
+
+        Args:
+            other (Histogram): The histogram to add.
+        """
+        self.counts = [a + b for a, b in zip(self.counts, other.counts)]
+        self.count += other.count
+        self.sum += other.sum
+        self.max = max(self.max, other.max)
+
+    def quantile(self, q: float) -> float:
+        """
+        Estimates a quantile by interpolating linearly within its bucket.
+
+        Args:
+            q (float): The quantile, between 0 and 1.
+
+        Returns:
+            float: The estimated duration in seconds, 0 if nothing was observed.
+        """
+        if not self.count:
+            return 0.0
+
+        rank = q * self.count
+        seen = 0
+        for i, n in enumerate(self.counts):
+            if n and seen + n >= rank:
+                lower = BUCKETS[i - 1] if i else 0.0
+                upper = BUCKETS[i] if i < len(BUCKETS) else self.max
+                return min(lower + (upper - lower) * (rank - seen) / n, self.max)
+            seen += n
+        return self.max
+
+
+class Metrics:
+    """
+    A thread-safe collection of stage histograms, counters and maximum gauges.
+    """
+
+    def __init__(self) -> None:
+        self.stages: dict[str, Histogram] = {}
+        self.counters: dict[str, float] = {}
+        self.gauges: dict[str, float] = {}
+        # Called with (stage, seconds) after every timed stage.
+        self.stage_listeners: list[Callable[[str, float], None]] = []
+        self._lock = threading.Lock()
+
+    def __getstate__(self) -> dict:
+        # Locks and listeners stay behind when measurements cross processes.
+        return {
+            "stages": self.stages,
+            "counters": self.counters,
+            "gauges": self.gauges,
+        }
+
+    def __setstate__(self, state: dict) -> None:
+        self.__init__()
+        self.stages = state["stages"]
+        self.counters = state["counters"]
+        self.gauges = state["gauges"]
+
+    @contextmanager
+    def stage(self, name: str) -> Iterator[None]:
+        """
+        Times the enclosed block as one run of a stage. Works around `await`s too,
+        in which case the wall time including the wait is recorded.
+
+        Args:
+            name (str): The stage name, e.g. `parse` or `llm`.
+        """
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start)
+
+    def observe(self, name: str, seconds: float) -> None:
+        """
+        Records one run of a stage and notifies the stage listeners.
+
+        Args:
+            name (str): The stage name.
+            seconds (float): The duration of the run.
+        """
+        with self._lock:
+            if (histogram := self.stages.get(name)) is None:
+                histogram = self.stages[name] = Histogram()
+            histogram.observe(seconds)
+        for listener in self.stage_listeners:
+            listener(name, seconds)
+
+    def count(self, name: str, amount: float = 1) -> None:
+        """
+        Increments a counter.
+
+        Args:
+            name (str): The counter name, e.g. `cache_hits`.
+            amount (float, optional): The increment. Defaults to 1.
+        """
+        if not amount:
+            return
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + amount
+
+    def maximum(self, name: str, value: float) -> None:
+        """
+        Raises a gauge to `value` if that is above its current value.
+
+        Args:
+            name (str): The gauge name, e.g. `peak_rss_mb`.
+            value (float): The observed value.
+        """
+        with self._lock:
+            self.gauges[name] = max(self.gauges.get(name, value), value)
+
+    def drain(self) -> "Metrics":
+        """
+        Takes the measurements recorded so far, leaving this collection empty.
+
+        Returns:
+            Metrics: A picklable copy of the measurements, see `merge`.
+        """
+        drained = Metrics()
+        with self._lock:
+            drained.stages, self.stages = self.stages, {}
+            drained.counters, self.counters = self.counters, {}
+            drained.gauges, self.gauges = self.gauges, {}
+        return drained
+
+    def merge(self, other: "Metrics") -> None:
+        """
+        Adds the measurements of another collection, e.g. from a worker process.
+
+        Args:
+            other (Metrics): The measurements to add.
+        """
+        with self._lock:
+            for name, histogram in other.stages.items():
+                self.stages.setdefault(name, Histogram()).merge(histogram)
+            for name, amount in other.counters.items():
+                self.counters[name] = self.counters.get(name, 0) + amount
+            for name, value in other.gauges.items():
+                self.gauges[name] = max(self.gauges.get(name, value), value)
+
+    def reset(self) -> None:
+        """
+        Discards every measurement.
+        """
+        self.drain()
+
+    def summary(self) -> dict:
+        """
+        Summarizes the measurements.
+
+        Returns:
+            dict: The counters, the gauges and, per stage, the number of runs, total
+                seconds and the mean, p50, p99 and maximum duration in milliseconds.
+        """
+        with self._lock:
+            stages = {
+                name: {
+                    "count": h.count,
+                    "total_s": round(h.sum, 6),
+                    "mean_ms": round(1000 * h.sum / h.count, 3),
+                    "p50_ms": round(1000 * h.quantile(0.5), 3),
+                    "p99_ms": round(1000 * h.quantile(0.99), 3),
+                    "max_ms": round(1000 * h.max, 3),
+                }
+                for name, h in sorted(self.stages.items())
+            }
+            return {
+                "stages": stages,
+                "counters": dict(sorted(self.counters.items())),
+                "gauges": dict(sorted(self.gauges.items())),
+            }
+
+    def write_json(self, path: str) -> None:
+        """
+        Writes the summary as JSON.
+
+        Args:
+            path (str): The output file.
+        """
+        _write_atomic(path, json.dumps(self.summary(), indent=2) + "\n")
+
+    def write_prometheus(self, path: str, *, prefix: str = "devtools") -> None:
+        """
+        Writes the measurements in the Prometheus text format, e.g. for the
+        node_exporter textfile collector. The file is replaced atomically.
+
+        Args:
+            path (str): The output file, conventionally ending in `.prom`.
+            prefix (str, optional): Prefix of every metric name.
+        """
+        lines = [
+            f"# HELP {prefix}_stage_seconds Duration of docstring run stages.",
+            f"# TYPE {prefix}_stage_seconds histogram",
+        ]
+        with self._lock:
+            for name, h in sorted(self.stages.items()):
+                cumulative = 0
+                for bound, n in zip((*BUCKETS, "+Inf"), h.counts):
+                    cumulative += n
+                    lines.append(
+                        f'{prefix}_stage_seconds_bucket{{stage="{name}",le="{bound}"}}'
+                        f" {cumulative}"
+                    )
+                lines.append(f'{prefix}_stage_seconds_sum{{stage="{name}"}} {h.sum}')
+                lines.append(
+                    f'{prefix}_stage_seconds_count{{stage="{name}"}} {h.count}'
+                )
+            for name, amount in sorted(self.counters.items()):
+                lines.append(f"# TYPE {prefix}_{name}_total counter")
+                lines.append(f"{prefix}_{name}_total {amount:g}")
+            for name, value in sorted(self.gauges.items()):
+                lines.append(f"# TYPE {prefix}_{name} gauge")
+                lines.append(f"{prefix}_{name} {value:g}")
+
+        _write_atomic(path, "\n".join(lines) + "\n")
+
+
+def timed(name: str) -> Callable:
+    """
+    Decorates a function or coroutine function so every call is timed as a run
+    of a stage of the process-wide `collector`.
+
+    Args:
+        name (str): The stage name.
+
+    Returns:
+        Callable: The decorator.
+    """
+
+    def decorator(function: Callable) -> Callable:
+        if inspect.iscoroutinefunction(function):
+
+            @functools.wraps(function)
+            async def async_wrapper(*args, **kwargs):
+                with collector.stage(name):
+                    return await function(*args, **kwargs)
+
+            return async_wrapper
+
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            with collector.stage(name):
+                return function(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
+
+
+def _write_atomic(path: str, content: str) -> None:
+    """
+    Writes a file through a temporary file so readers never see partial content,
+    creating its directory if needed. See `file_output.write_atomic`.
+
+    Args:
+        path (str): The output file.
+        content (str): The file content.
+    """
+    # Imported here because `file_output` depends on this module.
+    from devtools.file_output import write_atomic
+
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    write_atomic(path, content)
+
+
+# The measurements of this process.
+collector = Metrics()
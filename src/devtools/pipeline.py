@@ -0,0 +1,334 @@
+import asyncio
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+from devtools.docstringer import DocStringWriter
+from devtools.file_input import (
+    FileTooLargeError,
+    peak_rss_mb,
+    read_source,
+    reset_peak_rss,
+)
+from devtools.incremental import ChangeSet, LineRanges, select_changed
+from devtools.lang_processor.function_declaration import FunctionDeclaration
+from devtools.lang_processor.lang_processor_interface import ILanguageProcessor
+from devtools.lang_processor.registry import ProcessorRegistry
+from devtools.metrics import Metrics, collector
+
+# Language processors owned by each process pool worker, see `_init_worker`.
+_worker_processors: ProcessorRegistry | None = None
+
+
+def _init_worker(processors: ProcessorRegistry) -> None:
+    """
+    Installs the language processors used by a process pool worker. Each worker
+    only creates the processors, and loads the grammars, of the files it sees.
+
+    Args:
+        processors (ProcessorRegistry): The (unpickled) registry of the writer.
+    """
+    global _worker_processors
+    _worker_processors = processors
+
+
+def _processor(file_path: str) -> ILanguageProcessor:
+    """
+    Returns the worker's language processor of a file.
+
+    Args:
+        file_path (str): The path to the source code file.
+
+    Returns:
+        ILanguageProcessor: The processor.
+    """
+    assert _worker_processors is not None, "worker was not initialized"
+    processor = _worker_processors.processor_for(file_path)
+    assert processor is not None, f"no processor for {file_path}"
+    return processor
+
+
+def _extract(
+    file_path: str,
+    line_ranges: LineRanges = None,
+    max_bytes: int = 0,
+    mmap_bytes: int = 0,
+) -> tuple[bytes, list[FunctionDeclaration], int, Metrics]:
+    """
+    Reads and parses a source file inside a worker process.
+
+    Args:
+        file_path (str): The path to the source code file.
+        line_ranges (LineRanges, optional): Only functions overlapping these lines
+            are returned. Defaults to the whole file.
+        max_bytes (int, optional): Size cap of the file, see `read_source`.
+        mmap_bytes (int, optional): Size from which the file is memory-mapped and
+            parsed in chunks, see `read_source`.
+
+    Returns:
+        tuple[bytes, list[FunctionDeclaration], int, Metrics]: The source code, its
+            undocumented function declarations, the number of already documented
+            functions and the worker's measurements.
+
+    Raises:
+        FileTooLargeError: If the file is larger than `max_bytes`.
+    """
+    processor = _processor(file_path)
+    reset_peak_rss()
+    with collector.stage("read"):
+        source_code = read_source(file_path, max_bytes=max_bytes, mmap_bytes=mmap_bytes)
+    root_node = processor.to_ast(source_code)
+    functions = select_changed(
+        processor.extract_function_declarations(root_node, source_code),
+        line_ranges,
+    )
+    undocumented = [f for f in functions if not f.has_docstring]
+    n_skipped = len(functions) - len(undocumented)
+    if not isinstance(source_code, bytes):
+        # Maps cannot be sent to the parent; copy the file once parsing is done.
+        source_code = source_code[:]
+        for function in undocumented:
+            function.source = source_code
+    collector.maximum("peak_rss_mb", peak_rss_mb())
+    return source_code, undocumented, n_skipped, collector.drain()
+
+
+def _insert(
+    file_path: str,
+    source_code: bytes,
+    functions: list[FunctionDeclaration],
+    docstrings: list[str],
+) -> tuple[str, int, Metrics]:
+    """
+    Inserts docstrings and formats the result inside a worker process.
+
+    Args:
+        file_path (str): The path to the source code file.
+        source_code (bytes): The encoded source code of the file.
+        functions (list[FunctionDeclaration]): The function declarations of the file.
+        docstrings (list[str]): The docstrings matching `functions`.
+
+    Returns:
+        tuple[str, int, Metrics]: The updated source code, the number of insertions
+            and the worker's measurements.
+    """
+    updated_code, n = _processor(file_path).insert_docstrings(
+        source_code, functions, docstrings
+    )
+    collector.maximum("peak_rss_mb", peak_rss_mb())
+    return updated_code, n, collector.drain()
+
+
+class DocStringPipeline:
+    """
+    Runs `DocStringWriter` over a directory as a staged pipeline.
+
+    A walker feeds a bounded queue of file paths. Parsing and insertion (including
+    black formatting) run in a process pool of `jobs` workers while the LLM requests
+    of all in-flight files share one async request pool of `writer.max_concurrency`.
+    The queue bound and the fixed number of file workers provide backpressure, so
+    memory stays flat regardless of the size of the tree.
+    """
+
+    def __init__(
+        self,
+        writer: DocStringWriter,
+        *,
+        jobs: int = os.cpu_count() or 1,
+        files_in_flight: int | None = None,
+    ) -> None:
+        """
+        Args:
+            writer (DocStringWriter): Supplies the client, processor and write step.
+            jobs (int, optional): Number of worker processes for the CPU stages.
+                Defaults to the number of CPUs.
+            files_in_flight (int, optional): Maximum number of files between the
+                parse and write stages. Defaults to enough files to keep both the
+                process pool and the request pool busy.
+        """
+        if jobs < 1:
+            raise ValueError("`jobs` must be at least 1")
+
+        self.writer = writer
+        self.jobs = jobs
+        self.files_in_flight = files_in_flight or max(2 * jobs, writer.max_concurrency)
+
+    def run(
+        self,
+        file_or_path: str,
+        *,
+        verbosity: int = 0,
+        changes: ChangeSet | None = None,
+    ) -> tuple[int, int]:
+        """
+        Docstringifies every matching file below `file_or_path`.
+
+        Args:
+            file_or_path (str): A path to a directory or file.
+            verbosity (int, optional): The verbosity level of the output. Defaults to 0.
+            changes (ChangeSet, optional): Restricts the run to changed files and
+                lines, see `DocStringWriter.docstringify`.
+
+        Returns:
+            tuple[int, int]: The number of directories traversed and the number of
+                docstring insertions performed.
+        """
+        return asyncio.run(
+            self.run_async(file_or_path, verbosity=verbosity, changes=changes)
+        )
+
+    async def run_async(
+        self,
+        file_or_path: str,
+        *,
+        verbosity: int = 0,
+        changes: ChangeSet | None = None,
+    ) -> tuple[int, int]:
+        """
+        Async counterpart of `run`.
+
+        Args:
+            file_or_path (str): A path to a directory or file.
+            verbosity (int, optional): The verbosity level of the output. Defaults to 0.
+            changes (ChangeSet, optional): Restricts the run to changed files and
+                lines, see `DocStringWriter.docstringify`.
+
+        Returns:
+            tuple[int, int]: The number of directories traversed and the number of
+                docstring insertions performed.
+
+        Raises:
+            Exception: The first error of the walker or a file worker; the other
+                workers are cancelled.
+        """
+        from devtools.llm import registry
+
+        queue: asyncio.Queue[str | None] = asyncio.Queue(maxsize=self.files_in_flight)
+        semaphore = asyncio.Semaphore(self.writer.max_concurrency)
+        n_dirs = [0]
+
+        with self.writer.write_behind(), ProcessPoolExecutor(
+            self.jobs,
+            initializer=_init_worker,
+            initargs=(self.writer.processors,),
+        ) as pool:
+            workers = [
+                asyncio.create_task(
+                    self._work(queue, pool, semaphore, verbosity, changes)
+                )
+                for _ in range(self.files_in_flight)
+            ]
+
+            async def feed() -> None:
+                await self._walk(file_or_path, queue, n_dirs, changes, verbosity)
+                for _ in workers:
+                    await queue.put(None)
+
+            tasks = [asyncio.create_task(feed()), *workers]
+            try:
+                # A failed worker stops taking files off the queue, which would
+                # block the walker for good: fail the whole run instead.
+                await asyncio.wait(tasks, return_when=asyncio.FIRST_EXCEPTION)
+                for task in tasks:
+                    if task.done() and (error := task.exception()) is not None:
+                        raise error
+                n_insertions = sum(worker.result() for worker in workers)
+            finally:
+                for task in tasks:
+                    task.cancel()
+                await asyncio.gather(*tasks, return_exceptions=True)
+                await registry.aclose_loop()
+
+        return n_dirs[0], n_insertions
+
+    async def _walk(
+        self,
+        file_or_path: str,
+        queue: "asyncio.Queue[str | None]",
+        n_dirs: list[int],
+        changes: ChangeSet | None,
+        verbosity: int,
+    ) -> None:
+        """
+        Feeds matching files into the queue, blocking while the queue is full.
+
+        Args:
+            file_or_path (str): A path to a directory or file.
+            queue (asyncio.Queue): The queue of files waiting to be processed.
+            n_dirs (list[int]): Single-element counter of traversed directories.
+            changes (ChangeSet | None): If given, only changed files are queued.
+            verbosity (int): The verbosity level of the output.
+        """
+        files = self.writer.iter_files(
+            file_or_path, n_dirs, changes=changes, verbosity=verbosity
+        )
+        while (file_path := await asyncio.to_thread(next, files, None)) is not None:
+            await queue.put(file_path)
+
+    async def _work(
+        self,
+        queue: "asyncio.Queue[str | None]",
+        pool: ProcessPoolExecutor,
+        semaphore: asyncio.Semaphore,
+        verbosity: int,
+        changes: ChangeSet | None,
+    ) -> int:
+        """
+        Takes files off the queue and runs them through every stage until the
+        walker signals the end of the queue.
+
+        Args:
+            queue (asyncio.Queue): The queue of files waiting to be processed.
+            pool (ProcessPoolExecutor): Runs the CPU-bound stages.
+            semaphore (asyncio.Semaphore): Limits the LLM requests in flight.
+            verbosity (int): The verbosity level of the output.
+            changes (ChangeSet | None): Supplies the changed lines of each file.
+
+        Returns:
+            int: The number of docstrings inserted by this worker.
+        """
+        loop = asyncio.get_running_loop()
+        n_insertions = 0
+        while (file_path := await queue.get()) is not None:
+            try:
+                source_code, functions, n_skipped, extracted = (
+                    await loop.run_in_executor(
+                        pool,
+                        _extract,
+                        file_path,
+                        changes.line_ranges(file_path) if changes else None,
+                        self.writer.max_file_bytes,
+                        self.writer.mmap_file_bytes,
+                    )
+                )
+            except FileTooLargeError as e:
+                self.writer.record_oversize(file_path, e, verbosity=verbosity)
+                continue
+            collector.merge(extracted)
+            self.writer.record_skipped(file_path, n_skipped, verbosity=verbosity)
+            texts, max_tokens = self.writer.prompt_inputs(functions)
+            docstrings = await self.writer.generate_docstrings_async(
+                texts,
+                max_tokens=max_tokens,
+                fingerprints=[f.fingerprint for f in functions],
+                processor=self.writer.processor_for(file_path),
+                semaphore=semaphore,
+            )
+            updated_code, n, inserted = await loop.run_in_executor(
+                pool, _insert, file_path, source_code, functions, docstrings
+            )
+            collector.merge(inserted)
+            self.writer.record_peak_rss(
+                file_path,
+                max(m.gauges.get("peak_rss_mb", 0.0) for m in (extracted, inserted)),
+                verbosity=verbosity,
+            )
+            n_insertions += await asyncio.to_thread(
+                self.writer.write_result,
+                file_path,
+                updated_code,
+                n,
+                verbosity=verbosity,
+                original=source_code,
+            )
+
+        return n_insertions
@@ -0,0 +1,606 @@
+"""
+Budgeted docstring runs.
+
+A `Budget` caps the estimated tokens, the number of requests and the wall time of
+a run. `BudgetScheduler` parses every file of the run first, ranks the
+undocumented functions by `priority` and requests their docstrings from the most
+to the least valuable, so the docstrings that matter most land before the budget
+runs out. Whatever completed is written when the run stops, budget spent or not.
+"""
+
+import asyncio
+import math
+import time
+from collections import Counter
+from typing import TYPE_CHECKING, NamedTuple
+
+from rich import print
+
+from devtools import batching, config
+from devtools.file_input import FileTooLargeError, Source, read_source
+from devtools.incremental import ChangeSet, select_changed
+from devtools.lang_processor.function_declaration import FunctionDeclaration
+from devtools.lang_processor.lang_processor_interface import ILanguageProcessor
+from devtools.metrics import collector
+
+if TYPE_CHECKING:
+    from devtools.docstringer import DocStringWriter
+
+
+class Budget:
+    """
+    Limits of a run. Tokens are estimated before a request is sent: the prompt,
+    the system prompt and the full output budget of the request are charged.
+    """
+
+    def __init__(
+        self,
+        *,
+        max_tokens: int | None = None,
+        max_requests: int | None = None,
+        max_seconds: float | None = None,
+    ) -> None:
+        """
+        Args:
+            max_tokens (int, optional): Estimated input and output tokens of all
+                requests. Unlimited by default.
+            max_requests (int, optional): Number of requests. Unlimited by default.
+            max_seconds (float, optional): Wall time of the run, counted from
+                `start`. Requests still in flight at the deadline are cancelled.
+                Unlimited by default.
+
+        Raises:
+            ValueError: If a limit is not positive.
+        """
+        for name, limit in (
+            ("max_tokens", max_tokens),
+            ("max_requests", max_requests),
+            ("max_seconds", max_seconds),
+        ):
+            if limit is not None and limit <= 0:
+                raise ValueError(f"`{name}` must be positive")
+
+        self.max_tokens = max_tokens
+        self.max_requests = max_requests
+        self.max_seconds = max_seconds
+        self.tokens = 0
+        self.requests = 0
+        self._deadline: float | None = None
+
+    def start(self) -> None:
+        """
+        Starts the clock of the deadline.
+        """
+        if self.max_seconds is not None:
+            self._deadline = time.monotonic() + self.max_seconds
+
+    def remaining_seconds(self) -> float | None:
+        """
+        Returns the time left until the deadline.
+
+        Returns:
+            float | None: The seconds left, or None without a deadline.
+        """
+        if self._deadline is None:
+            return None
+        return max(self._deadline - time.monotonic(), 0.0)
+
+    @property
+    def exhausted(self) -> str | None:
+        """
+        str | None: The limit that rules out any further request, `requests` or
+        `deadline`, or None. A spent token budget may still fit smaller requests.
+        """
+        if self.max_requests is not None and self.requests >= self.max_requests:
+            return "requests"
+        if self.remaining_seconds() == 0:
+            return "deadline"
+        return None
+
+    def fits(self, tokens: int) -> bool:
+        """
+        Checks whether a request of an estimated cost can still be sent.
+
+        Args:
+            tokens (int): The estimated tokens of the request.
+
+        Returns:
+            bool: Whether the request is within every limit.
+        """
+        if self.exhausted is not None:
+            return False
+        return self.max_tokens is None or self.tokens + tokens <= self.max_tokens
+
+    def spend(self, tokens: int) -> None:
+        """
+        Charges a request to the budget.
+
+        Args:
+            tokens (int): The estimated tokens of the request.
+        """
+        self.tokens += tokens
+        self.requests += 1
+
+
+def priority(
+    function: "FunctionDeclaration | _Function",
+    references: Counter[str],
+    definitions: Counter[str],
+) -> float:
+    """
+    Scores how valuable the docstring of a function is. Public names, top-level
+    definitions, long functions and names referenced often score higher, weighted
+    by `config.PRIORITY_*`.
+
+    Args:
+        function (FunctionDeclaration | _Function): The function.
+        references (Counter[str]): Occurrences of every name across the run,
+            definitions included, see `ILanguageProcessor.count_references`.
+        definitions (Counter[str]): Number of functions defined with every name.
+
+    Returns:
+        float: The score; higher is documented first.
+    """
+    name = function.name
+    public = not name.startswith("_") or (name.startswith("__") and name.endswith("__"))
+    n_lines = function.end_line - function.start_line + 1
+    n_references = max(references[name] - definitions[name], 0)
+    return (
+        config.PRIORITY_PUBLIC * public
+        + config.PRIORITY_TOP_LEVEL / (1 + function.depth)
+        + config.PRIORITY_SIZE * math.log1p(n_lines)
+        + config.PRIORITY_REFERENCES * math.log1p(n_references)
+    )
+
+
+class _File(NamedTuple):
+    path: str
+    processor: ILanguageProcessor
+
+
+class _Function(NamedTuple):
+    # What ranking, costing and finding an undocumented function again take,
+    # without a reference to the source of its file.
+    file: int
+    name: str
+    start_line: int
+    end_line: int
+    start_byte: int
+    end_byte: int
+    depth: int
+    fingerprint: str | None
+    cost: int
+
+
+# A file read again: its source and functions by (start_byte, end_byte, name).
+_Parsed = tuple[Source, dict[tuple[int, int, str], FunctionDeclaration]]
+
+
+class BudgetScheduler:
+    """
+    Docstringifies a path within a `Budget`, most valuable functions first.
+
+    Functions are requested one per request, up to `writer.max_concurrency` at
+    once, so the budget is checked before every request. Unless the writer does not
+    deduplicate, copies of a function already requested cost nothing, see
+    `DocStringWriter.generate_docstrings_async`.
+
+    Only the spans of the functions are kept between parsing and requesting them:
+    files are read again to build a prompt and to insert the docstrings, and files
+    that get no budget are not read again at all, so no source is held on to
+    across the run.
+    """
+
+    def __init__(self, writer: "DocStringWriter", budget: Budget) -> None:
+        """
+        Args:
+            writer (DocStringWriter): Generates and writes the docstrings.
+            budget (Budget): The limits of the run.
+
+        Raises:
+            ValueError: If the writer packs functions into batches.
+        """
+        if writer.batch_token_budget > 0:
+            raise ValueError("Budgeted runs send one function per request")
+
+        self.writer = writer
+        self.budget = budget
+        # The limit that stopped the run early, see `Budget.exhausted`.
+        self.reason: str | None = None
+        self.n_dispatched = 0
+        self.n_deferred = 0
+        self._references: Counter[str] = Counter()
+        self._definitions: Counter[str] = Counter()
+        # The file read last by `_reread`, by index.
+        self._parsed: tuple[int, _Parsed | None] | None = None
+
+    async def run(
+        self,
+        file_or_path: str,
+        *,
+        verbosity: int = 0,
+        changes: ChangeSet | None = None,
+    ) -> tuple[int, int]:
+        """
+        Docstringifies the files below a path until they are done or the budget is
+        spent, writing every docstring that completed.
+
+        Args:
+            file_or_path (str): A path to a directory or file.
+            verbosity (int, optional): The verbosity level of the output.
+            changes (ChangeSet, optional): Restricts the run to changed files and
+                lines. Names are then only ranked by their references in the
+                changed files.
+
+        Returns:
+            tuple[int, int]: The number of directories traversed and the number of
+                docstring insertions performed.
+
+        Raises:
+            Exception: The first error of a request, after the completed docstrings
+                were written.
+        """
+        self.budget.start()
+        n_dirs = [0]
+        tasks: dict[int, asyncio.Task] = {}
+        with self.writer.write_behind():
+            files, functions = self._extract(file_or_path, n_dirs, changes, verbosity)
+            try:
+                await self._dispatch(files, functions, tasks)
+                if tasks:
+                    await asyncio.wait(
+                        tasks.values(), timeout=self.budget.remaining_seconds()
+                    )
+            finally:
+                pending = [task for task in tasks.values() if not task.done()]
+                for task in pending:
+                    task.cancel()
+                await asyncio.gather(*pending, return_exceptions=True)
+                if pending and self.reason is None:
+                    self.reason = "deadline"
+                completed: dict[int, list[tuple[_Function, str]]] = {}
+                for k, task in tasks.items():
+                    if not task.cancelled() and task.exception() is None:
+                        function = functions[k]
+                        completed.setdefault(function.file, []).append(
+                            (function, task.result())
+                        )
+                n_insertions = sum(
+                    self._write(i, entry, completed.get(i, []), verbosity)
+                    for i, entry in enumerate(files)
+                )
+                self._parsed = None
+                self._report(
+                    len(functions), sum(not task.cancelled() for task in tasks.values())
+                )
+
+        for task in tasks.values():
+            if not task.cancelled() and (error := task.exception()) is not None:
+                raise error
+        return n_dirs[0], n_insertions
+
+    def _extract(
+        self,
+        file_or_path: str,
+        n_dirs: list[int],
+        changes: ChangeSet | None,
+        verbosity: int,
+    ) -> tuple[list[_File], list[_Function]]:
+        """
+        Parses every file of the run, counting the references of every name and
+        estimating the cost of every undocumented function. No source is kept.
+
+        Args:
+            file_or_path (str): A path to a directory or file.
+            n_dirs (list[int]): Single-element counter of traversed directories.
+            changes (ChangeSet | None): Restricts the run to changed files and lines.
+            verbosity (int): The verbosity level of the output.
+
+        Returns:
+            tuple[list[_File], list[_Function]]: The files of the run and their
+                undocumented functions.
+        """
+        files, functions = [], []
+        for file_path in self.writer.iter_files(
+            file_or_path, n_dirs, changes=changes, verbosity=verbosity
+        ):
+            processor = self.writer.processor_for(file_path)
+            try:
+                with collector.stage("read"):
+                    source = read_source(
+                        file_path,
+                        max_bytes=self.writer.max_file_bytes,
+                        mmap_bytes=self.writer.mmap_file_bytes,
+                    )
+            except FileTooLargeError as e:
+                self.writer.record_oversize(file_path, e, verbosity=verbosity)
+                continue
+            root_node = processor.to_ast(source)
+            declarations = processor.extract_function_declarations(root_node, source)
+            self._references.update(processor.count_references(root_node, source))
+            self._definitions.update(f.name for f in declarations)
+
+            selected = select_changed(
+                declarations, changes.line_ranges(file_path) if changes else None
+            )
+            undocumented = [f for f in selected if not f.has_docstring]
+            self.writer.record_skipped(
+                file_path, len(selected) - len(undocumented), verbosity=verbosity
+            )
+            texts, max_tokens = self.writer.prompt_inputs(undocumented)
+            for j, function in enumerate(undocumented):
+                cost = self._cost(
+                    processor, texts[j], max_tokens[j] if max_tokens else None
+                )
+                functions.append(
+                    _Function(
+                        len(files),
+                        function.name,
+                        function.start_line,
+                        function.end_line,
+                        function.start_byte,
+                        function.end_byte,
+                        function.depth,
+                        function.fingerprint,
+                        cost,
+                    )
+                )
+            files.append(_File(file_path, processor))
+        return files, functions
+
+    async def _dispatch(
+        self,
+        files: list[_File],
+        functions: list[_Function],
+        tasks: dict[int, asyncio.Task],
+    ) -> None:
+        """
+        Requests docstrings in priority order until all are requested, the budget is
+        spent or a request failed.
+
+        Args:
+            files (list[_File]): The files of the run.
+            functions (list[_Function]): The undocumented functions of the run.
+            tasks (dict[int, asyncio.Task]): Receives the request of every
+                dispatched function, keyed by its index in `functions`.
+        """
+        queue = sorted(
+            range(len(functions)),
+            key=lambda k: priority(functions[k], self._references, self._definitions),
+            reverse=True,
+        )
+        semaphore = asyncio.Semaphore(self.writer.max_concurrency)
+        requested: set[str] = set()
+        failed: list[asyncio.Task] = []
+
+        def on_done(task: asyncio.Task) -> None:
+            if not task.cancelled() and task.exception() is not None:
+                failed.append(task)
+
+        for k in queue:
+            function = functions[k]
+            entry = files[function.file]
+            if self.writer.deduplicate and function.fingerprint in requested:
+                # A copy: waits for the docstring of the function already requested.
+                if (prompt := self._prompt(entry, function)) is not None:
+                    text, _ = prompt
+                    tasks[k] = asyncio.create_task(
+                        self._request(entry, function, text, None)
+                    )
+                continue
+
+            try:
+                await asyncio.wait_for(
+                    semaphore.acquire(), self.budget.remaining_seconds()
+                )
+            except asyncio.TimeoutError:
+                self.reason = "deadline"
+                return
+            if failed:
+                semaphore.release()
+                return
+            if not self.budget.fits(function.cost):
+                semaphore.release()
+                self.reason = self.budget.exhausted or "tokens"
+                if self.budget.exhausted is not None:
+                    return
+                # A smaller function may still fit the tokens left.
+                continue
+            if (prompt := self._prompt(entry, function)) is None:
+                # The file changed since it was parsed.
+                semaphore.release()
+                continue
+
+            text, max_tokens = prompt
+            self.budget.spend(function.cost)
+            self.n_dispatched += 1
+            if function.fingerprint is not None:
+                requested.add(function.fingerprint)
+            task = asyncio.create_task(self._request(entry, function, text, max_tokens))
+            task.add_done_callback(lambda _: semaphore.release())
+            task.add_done_callback(on_done)
+            tasks[k] = task
+
+    def _reread(self, i: int, entry: _File) -> _Parsed | None:
+        """
+        Reads and parses a file of the run again. The file read last is reused, so
+        the functions of a file are usually found with one read.
+
+        Args:
+            i (int): The index of the file.
+            entry (_File): The file.
+
+        Returns:
+            _Parsed | None: The source and functions of the file, or None if it can
+                no longer be read.
+        """
+        if self._parsed is not None and self._parsed[0] == i:
+            return self._parsed[1]
+        # Release the previous file before reading the next one.
+        self._parsed = None
+        try:
+            source = read_source(
+                entry.path,
+                max_bytes=self.writer.max_file_bytes,
+                mmap_bytes=self.writer.mmap_file_bytes,
+            )
+        except (OSError, FileTooLargeError):
+            parsed = None
+        else:
+            root_node = entry.processor.to_ast(source)
+            parsed = source, {
+                (f.start_byte, f.end_byte, f.name): f
+                for f in entry.processor.extract_function_declarations(
+                    root_node, source
+                )
+            }
+        self._parsed = i, parsed
+        return parsed
+
+    def _find(self, entry: _File, function: _Function) -> FunctionDeclaration | None:
+        """
+        Finds a function in its file read again.
+
+        Args:
+            entry (_File): The file of the function.
+            function (_Function): The function.
+
+        Returns:
+            FunctionDeclaration | None: The function, or None if the file changed
+                since it was parsed.
+        """
+        if (parsed := self._reread(function.file, entry)) is None:
+            return None
+        key = function.start_byte, function.end_byte, function.name
+        return parsed[1].get(key)
+
+    def _prompt(
+        self, entry: _File, function: _Function
+    ) -> tuple[str, int | None] | None:
+        """
+        Builds the prompt text and output budget of a function.
+
+        Args:
+            entry (_File): The file of the function.
+            function (_Function): The function.
+
+        Returns:
+            tuple[str, int | None] | None: The prompt text and the output budget,
+                None for the client's, or None if the file changed since it was
+                parsed.
+        """
+        if (declaration := self._find(entry, function)) is None:
+            return None
+        texts, max_tokens = self.writer.prompt_inputs([declaration])
+        return texts[0], max_tokens[0] if max_tokens is not None else None
+
+    def _cost(
+        self, processor: ILanguageProcessor, text: str, max_tokens: int | None
+    ) -> int:
+        """
+        Estimates the tokens of a request.
+
+        Args:
+            processor (ILanguageProcessor): Supplies the system prompt.
+            text (str): The prompt text of the function.
+            max_tokens (int | None): The output budget of the request.
+
+        Returns:
+            int: The estimated input and output tokens.
+        """
+        return (
+            batching.estimate_tokens(
+                self.writer.system_prompt_for(processor)
+                or getattr(self.writer.client, "system_prompt", "")
+            )
+            + batching.estimate_tokens(text)
+            + (config.DOCSTRING_MAX_TOKENS if max_tokens is None else max_tokens)
+        )
+
+    async def _request(
+        self,
+        entry: _File,
+        function: _Function,
+        text: str,
+        max_tokens: int | None,
+    ) -> str:
+        """
+        Requests the docstring of one function.
+
+        Args:
+            entry (_File): The file of the function.
+            function (_Function): The function.
+            text (str): Its prompt text.
+            max_tokens (int | None): Its output budget.
+
+        Returns:
+            str: The docstring.
+        """
+        [docstring] = await self.writer.generate_docstrings_async(
+            [text],
+            max_tokens=None if max_tokens is None else [max_tokens],
+            fingerprints=[function.fingerprint],
+            processor=entry.processor,
+        )
+        return docstring
+
+    def _write(
+        self,
+        i: int,
+        entry: _File,
+        completed: list[tuple[_Function, str]],
+        verbosity: int,
+    ) -> int:
+        """
+        Reads a file again, inserts its completed docstrings and writes it.
+
+        Args:
+            i (int): The index of the file.
+            entry (_File): The file.
+            completed (list[tuple[_Function, str]]): The functions of the file whose
+                request completed and their docstrings.
+            verbosity (int): The verbosity level of the output.
+
+        Returns:
+            int: The number of docstrings inserted.
+        """
+        if not completed or (parsed := self._reread(i, entry)) is None:
+            return self.writer.write_result(entry.path, "", 0, verbosity=verbosity)
+
+        source, declarations = parsed
+        functions, docstrings = [], []
+        for function, docstring in sorted(completed, key=lambda c: c[0].start_byte):
+            key = function.start_byte, function.end_byte, function.name
+            if (declaration := declarations.get(key)) is not None:
+                functions.append(declaration)
+                docstrings.append(docstring)
+        updated_code, n_insertions = entry.processor.insert_docstrings(
+            source, functions, docstrings
+        )
+        return self.writer.write_result(
+            entry.path,
+            updated_code,
+            n_insertions,
+            verbosity=verbosity,
+            original=source,
+        )
+
+    def _report(self, n_functions: int, n_finished: int) -> None:
+        """
+        Records how much of the run the budget covered.
+
+        Args:
+            n_functions (int): The number of undocumented functions of the run.
+            n_finished (int): The number of functions whose request finished,
+                copies of requested functions included.
+        """
+        self.n_deferred = n_functions - n_finished
+        collector.count("budget_dispatched", self.n_dispatched)
+        collector.count("budget_deferred", self.n_deferred)
+        collector.count("budget_tokens", self.budget.tokens)
+        if self.n_deferred > 0 and self.reason is not None:
+            print(
+                f"[yellow]Budget spent ({self.reason}): deferred {self.n_deferred} "
+                f"of {n_functions} functions.[/yellow]",
+                file=self.writer.status,
+            )
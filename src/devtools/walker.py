@@ -0,0 +1,379 @@
+"""
+A directory walker that prunes ignored subtrees before descending into them.
+
+Ignore files use the `.gitignore` syntax and apply to the directory they are in
+and everything below it; include and exclude globs use the same syntax relative
+to the walked root. Patterns are compiled once per file or walk.
+"""
+
+import os
+import re
+from typing import Callable, Iterable, Iterator, NamedTuple
+
+from devtools import config
+
+
+class IgnoreRule(NamedTuple):
+    # Directory the pattern is relative to, as a `/`-terminated posix prefix of
+    # the paths it is matched against ("" for the top).
+    base: str
+    regex: re.Pattern
+    negated: bool
+    dir_only: bool
+
+
+def compile_pattern(pattern: str, base: str = "") -> IgnoreRule | None:
+    """
+    Compiles one line of a `.gitignore` file.
+
+    Args:
+        pattern (str): The line.
+        base (str, optional): The directory of the ignore file, see `IgnoreRule`.
+
+    Returns:
+        IgnoreRule | None: The rule, or None for blank lines and comments.
+    """
+    pattern = pattern.rstrip("\n\r")
+    if not pattern.endswith("\\ "):
+        pattern = pattern.rstrip()
+    if not pattern or pattern.startswith("#"):
+        return None
+
+    negated = pattern.startswith("!")
+    if negated or pattern.startswith("\\"):
+        pattern = pattern[1:]
+    dir_only = pattern.endswith("/")
+    pattern = pattern.rstrip("/")
+    # A slash anywhere but at the end anchors the pattern to the ignore file's
+    # directory; otherwise it matches at any depth.
+    anchored = "/" in pattern
+    pattern = pattern.lstrip("/")
+    if not pattern:
+        return None
+
+    regex = _translate(pattern)
+    if not anchored:
+        regex = f"(?:.*/)?{regex}"
+    return IgnoreRule(base, re.compile(f"{regex}\\Z"), negated, dir_only)
+
+
+def _translate(pattern: str) -> str:
+    """
+    Translates a glob with `**` support into a regular expression in which `*` and
+    `?` never match a `/`.
+
+    Args:
+        pattern (str): The glob, without leading or trailing slashes.
+
+    Returns:
+        str: The regular expression.
+    """
+    parts = []
+    i = 0
+    while i < len(pattern):
+        if pattern.startswith("**/", i):
+            parts.append("(?:.*/)?")
+            i += 3
+        elif pattern.startswith("**", i) and i + 2 == len(pattern):
+            parts.append(".*")
+            i += 2
+        elif pattern[i] == "*":
+            parts.append("[^/]*")
+            i += 1
+        elif pattern[i] == "?":
+            parts.append("[^/]")
+            i += 1
+        elif pattern[i] == "[" and (end := pattern.find("]", i + 2)) > 0:
+            body = pattern[i + 1 : end].replace("\\", "\\\\")
+            if body.startswith("!"):
+                body = "^" + body[1:]
+            parts.append(f"[{body}]")
+            i = end + 1
+        else:
+            if pattern[i] == "\\" and i + 1 < len(pattern):
+                i += 1
+            parts.append(re.escape(pattern[i]))
+            i += 1
+    return "".join(parts)
+
+
+def load_ignore_file(file_path: str, base: str = "") -> list[IgnoreRule]:
+    """
+    Compiles the rules of an ignore file.
+
+    Args:
+        file_path (str): The ignore file.
+        base (str, optional): Its directory, see `IgnoreRule`.
+
+    Returns:
+        list[IgnoreRule]: The rules, in file order.
+    """
+    try:
+        with open(file_path, "r", encoding="utf8", errors="replace") as f:
+            return [r for line in f if (r := compile_pattern(line, base)) is not None]
+    except OSError:
+        return []
+
+
+def is_ignored(rules: Iterable[IgnoreRule], path: str, is_dir: bool) -> bool:
+    """
+    Applies ignore rules to a path; the last matching rule wins.
+
+    Args:
+        rules (Iterable[IgnoreRule]): The rules, in precedence order.
+        path (str): The posix path relative to the top of the rules.
+        is_dir (bool): Whether the path is a directory.
+
+    Returns:
+        bool: True if the path is ignored.
+    """
+    ignored = False
+    for rule in rules:
+        if rule.dir_only and not is_dir:
+            continue
+        if path.startswith(rule.base) and rule.regex.match(path, len(rule.base)):
+            ignored = not rule.negated
+    return ignored
+
+
+class Walker:
+    """
+    Walks a directory tree with `os.scandir`, yielding the accepted files and
+    pruning ignored, excluded and tool directories without descending into them.
+    """
+
+    def __init__(
+        self,
+        root: str,
+        *,
+        accept: Callable[[str], bool] | None = None,
+        include: Iterable[str] = (),
+        exclude: Iterable[str] = (),
+        ignore_files: Iterable[str] = config.IGNORE_FILES,
+        excluded_dirs: Iterable[str] = config.EXCLUDED_DIRS,
+    ) -> None:
+        """
+        Args:
+            root (str): The directory to walk, or a single file.
+            accept (Callable[[str], bool], optional): Cheap file filter applied
+                before any pattern, e.g. an extension check.
+            include (Iterable[str], optional): If given, only files matching one of
+                these globs are yielded.
+            exclude (Iterable[str], optional): Globs of files and directories to
+                skip.
+            ignore_files (Iterable[str], optional): Names of the ignore files to
+                honor. Those in the ancestors of `root`, up to the repository top,
+                apply as well.
+            excluded_dirs (Iterable[str], optional): Directory names that are never
+                entered, e.g. `.git` or `node_modules`.
+        """
+        self.root = os.path.abspath(root)
+        # The directory globs are relative to: the root, or the directory of a file.
+        self.base = (
+            self.root if os.path.isdir(self.root) else os.path.dirname(self.root)
+        )
+        self.accept = accept
+        self.include = [r for p in include if (r := compile_pattern(p)) is not None]
+        self.exclude = [r for p in exclude if (r := compile_pattern(p)) is not None]
+        self.ignore_files = tuple(ignore_files)
+        self.excluded_dirs = frozenset(excluded_dirs)
+        # Number of directories entered and pruned so far.
+        self.n_dirs = 0
+        self.n_pruned = 0
+        # Ignore rules of the directories checked by `selects`, by directory.
+        self._rules: dict[str, tuple[str | None, list[IgnoreRule]]] = {}
+
+    def __iter__(self) -> Iterator[str]:
+        if not os.path.isdir(self.root):
+            if os.path.isfile(self.root) and self.selects(self.root):
+                yield self.root
+            return
+
+        top, rules = self._ancestor_rules()
+        stack = [(self.root, rules)]
+        while stack:
+            directory, rules = stack.pop()
+            try:
+                with os.scandir(directory) as it:
+                    entries = sorted(it, key=lambda entry: entry.name)
+            except OSError:
+                continue
+            names = {entry.name for entry in entries}
+            if "pyvenv.cfg" in names and directory != self.root:
+                # A virtual environment, whatever its name.
+                self.n_pruned += 1
+                continue
+
+            self.n_dirs += 1
+            relative = _relative(directory, top)
+            rules = rules + [
+                rule
+                for name in self.ignore_files
+                if name in names
+                for rule in load_ignore_file(os.path.join(directory, name), relative)
+            ]
+
+            subdirs = []
+            for entry in entries:
+                if entry.is_dir(follow_symlinks=False):
+                    path = relative + entry.name
+                    if (
+                        entry.name in self.excluded_dirs
+                        or is_ignored(rules, path, True)
+                        or self._excluded(entry.path, True)
+                    ):
+                        self.n_pruned += 1
+                        continue
+                    subdirs.append((entry.path, rules))
+                elif (
+                    entry.is_file()
+                    and (self.accept is None or self.accept(entry.path))
+                    and not is_ignored(rules, relative + entry.name, False)
+                    and self._selected(entry.path)
+                ):
+                    yield entry.path
+
+            stack.extend(reversed(subdirs))
+
+    def selects(self, file_path: str) -> bool:
+        """
+        Checks whether walking would yield a file, e.g. for files that were not
+        found by walking: the filter, globs and ignore files apply to it, and none
+        of its directories below the root may be pruned.
+
+        Args:
+            file_path (str): The path of the file.
+
+        Returns:
+            bool: True if the file would be yielded.
+        """
+        file_path = os.path.abspath(file_path)
+        if not (self.accept is None or self.accept(file_path)):
+            return False
+        if not self._selected(file_path):
+            return False
+        if file_path == self.root:
+            return True
+
+        directory = os.path.dirname(file_path)
+        if os.path.commonpath([directory, self.root]) != self.root:
+            return False
+        top, rules = self._directory_rules(directory)
+        if top is None:
+            return False
+        return not is_ignored(rules, _relative(file_path, top).rstrip("/"), False)
+
+    def _directory_rules(self, directory: str) -> tuple[str | None, list[IgnoreRule]]:
+        """
+        Collects the ignore rules in effect in a directory at or below the root,
+        as the walk would, memoizing them for the other files of `selects`.
+
+        Args:
+            directory (str): The absolute path of the directory.
+
+        Returns:
+            tuple[str | None, list[IgnoreRule]]: The top directory ignore paths are
+                relative to, or None if the walk prunes the directory, and the
+                rules.
+        """
+        if (cached := self._rules.get(directory)) is not None:
+            return cached
+
+        if directory == self.root:
+            top, rules = self._ancestor_rules()
+        else:
+            top, rules = self._directory_rules(os.path.dirname(directory))
+            if top is not None and (
+                os.path.basename(directory) in self.excluded_dirs
+                or is_ignored(rules, _relative(directory, top).rstrip("/"), True)
+                or self._excluded(directory, True)
+                or os.path.exists(os.path.join(directory, "pyvenv.cfg"))
+            ):
+                top = None
+
+        if top is not None:
+            relative = _relative(directory, top)
+            rules = rules + [
+                rule
+                for name in self.ignore_files
+                for rule in load_ignore_file(os.path.join(directory, name), relative)
+            ]
+        self._rules[directory] = top, rules
+        return top, rules
+
+    def _selected(self, file_path: str) -> bool:
+        """
+        Applies the include and exclude globs to a file.
+
+        Args:
+            file_path (str): The absolute path of the file.
+
+        Returns:
+            bool: True if the file is included and not excluded.
+        """
+        if self._excluded(file_path, False):
+            return False
+        if not self.include:
+            return True
+        path = _relative(file_path, self.base).rstrip("/")
+        return any(rule.regex.match(path) for rule in self.include)
+
+    def _excluded(self, path: str, is_dir: bool) -> bool:
+        """
+        Applies the exclude globs to a file or directory.
+
+        Args:
+            path (str): The absolute path.
+            is_dir (bool): Whether the path is a directory.
+
+        Returns:
+            bool: True if the path is excluded.
+        """
+        if not self.exclude:
+            return False
+        return is_ignored(self.exclude, _relative(path, self.base).rstrip("/"), is_dir)
+
+    def _ancestor_rules(self) -> tuple[str, list[IgnoreRule]]:
+        """
+        Finds the top of the repository containing the root and loads the ignore
+        files between the two.
+
+        Returns:
+            tuple[str, list[IgnoreRule]]: The top directory, which ignore paths are
+                relative to, and the rules of the root's ancestors.
+        """
+        ancestors = []
+        directory = self.root
+        while True:
+            if os.path.exists(os.path.join(directory, ".git")):
+                break
+            parent = os.path.dirname(directory)
+            if parent == directory:
+                # Not inside a repository: only the walked tree's files apply.
+                return self.root, []
+            directory = parent
+            ancestors.append(directory)
+
+        top = directory
+        rules = []
+        for directory in reversed(ancestors):
+            for name in self.ignore_files:
+                path = os.path.join(directory, name)
+                rules += load_ignore_file(path, _relative(directory, top))
+        return top, rules
+
+
+def _relative(path: str, top: str) -> str:
+    """
+    Returns a path relative to `top` as a posix path prefix.
+
+    Args:
+        path (str): An absolute path at or below `top`.
+        top (str): The directory paths are relative to.
+
+    Returns:
+        str: The relative path followed by `/`, or "" for `top` itself.
+    """
+    if path == top:
+        return ""
+    return os.path.relpath(path, top).replace(os.sep, "/") + "/"
@@ -12,3 +12,14 @@ def py_lang() -> PythonProcessor:
         PythonProcessor: an instance of the PythonProcessor class.
     """
     return PythonProcessor()
+
+
+@pytest.fixture(scope="session")
+def py_lang_full_format() -> PythonProcessor:
+    """
+    Creates a PythonProcessor that reformats whole files with black.
+
+    Returns:
+        PythonProcessor: an instance of the PythonProcessor class.
+    """
+    return PythonProcessor(full_format=True)
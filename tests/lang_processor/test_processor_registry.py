@@ -0,0 +1,78 @@
+import os
+import pickle
+import tempfile
+
+from devtools.docstringer import DocStringWriter
+from devtools.lang_processor.python import PythonProcessor
+from devtools.lang_processor.registry import ProcessorRegistry, default_registry
+from tests.utils import FakeClient
+
+
+class StubProcessor(PythonProcessor):
+    """
+    Python with another language name, standing in for a second language.
+    """
+
+    language_name = "stub"
+
+
+def test_processors_are_created_on_first_match():
+    """
+    Checks that processors and grammars are only loaded for languages that occur
+    and that every extension of a factory shares one processor.
+    """
+    created = []
+
+    def factory() -> PythonProcessor:
+        created.append(1)
+        return PythonProcessor()
+
+    registry = ProcessorRegistry()
+    registry.register([".py", ".PYI"], factory)
+
+    assert registry.handles("a/module.py") and registry.handles("stub.pyi")
+    assert not registry.handles("README.md")
+    assert created == []
+
+    processor = registry.processor_for("module.py")
+    assert registry.processor_for("stub.PYI") is processor
+    assert registry.processor_for("README.md") is None
+    assert created == [1]
+    assert isinstance(processor, PythonProcessor)
+    assert processor.to_ast("x = 1").type == "module"
+
+
+def test_registry_pickles_without_processors():
+    """
+    Checks that a pickled registry rebuilds its processors lazily.
+    """
+    registry = default_registry(full_format=True)
+    registry.processor_for("module.py")
+
+    restored = pickle.loads(pickle.dumps(registry))
+
+    assert restored.loaded == []
+    assert restored.processor_for("module.py").full_format
+
+
+def test_docstringify_dispatches_in_one_walk():
+    """
+    Checks that a mixed tree is documented in one walk with the system prompt of
+    each file's language.
+    """
+    client = FakeClient()
+    registry = default_registry()
+    registry.register([".stub"], StubProcessor)
+    ds = DocStringWriter(client, registry)
+
+    with tempfile.TemporaryDirectory() as root:
+        for name in ("a.py", "b.stub", "c.txt"):
+            with open(os.path.join(root, name), "w") as f:
+                f.write("def f():\n    return 1\n")
+        n_dirs, n_insertions = ds.docstringify(root)
+
+    prompts = sorted(options["system_prompt"] for options in client.options)
+    assert (n_dirs, n_insertions) == (1, 2)
+    assert "python function" in prompts[0]
+    assert "stub function" in prompts[1]
+    assert len(registry.loaded) == 2
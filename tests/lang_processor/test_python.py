@@ -1,6 +1,11 @@
+import mmap
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+
 import black
+import pytest
 
-from devtools.lang_processor.python import PythonProcessor
+from devtools.lang_processor.python import PARSE_CHUNK_BYTES, PythonProcessor
 
 SIMPLE_FUNC_CONTENTS = 'def hello_world():\n     print("Hello World!")'
 
@@ -59,7 +64,8 @@ def test_extract_single_function_declarations(py_lang: PythonProcessor):
     root = py_lang.to_ast(SIMPLE_FUNC_CONTENTS)
     funcs = py_lang.extract_function_declarations(root)
     assert len(funcs) == 1
-    assert funcs[0] == SIMPLE_FUNC_CONTENTS
+    assert funcs[0].text == SIMPLE_FUNC_CONTENTS
+    assert funcs[0].name == "hello_world"
 
 
 def test_extract_multiple_functions(py_lang: PythonProcessor):
@@ -86,11 +92,11 @@ def test_extract_multiple_functions(py_lang: PythonProcessor):
     funcs = py_lang.extract_function_declarations(root)
 
     assert len(funcs) == 2
-    assert funcs[0] == SIMPLE_FUNC_CONTENTS.strip()
-    assert "square" in funcs[1]
+    assert funcs[0].text == SIMPLE_FUNC_CONTENTS.strip()
+    assert "square" in funcs[1].text
 
 
-def test_insert_docstrings(py_lang: PythonProcessor):
+def test_insert_docstrings(py_lang_full_format: PythonProcessor):
     """This function, test_insert_docstrings, tests the PythonProcessor methods for inserting
     docstrings into existing Python code. The source code is first transformed to abstract
     syntax tree format, then function declarations are extracted, and finally docstrings are
@@ -104,15 +110,17 @@ def hello_world():
 def square(x: int) -> int:
     return x ** 2
 """
-    root = py_lang.to_ast(source_code)
-    funcs = py_lang.extract_function_declarations(root)
+    root = py_lang_full_format.to_ast(source_code)
+    funcs = py_lang_full_format.extract_function_declarations(root)
     assert len(funcs) == 2
 
     docstrings = [
         '"""Prints an old programmers greeting."""',
         '"""Squares input integer and returns an integer."""',
     ]
-    output_code, n_inserts = py_lang.insert_docstrings(source_code, funcs, docstrings)
+    output_code, n_inserts = py_lang_full_format.insert_docstrings(
+        source_code, funcs, docstrings
+    )
 
     expected_output = black.format_str(
         """
@@ -129,3 +137,372 @@ def square(x: int) -> int:
 
     assert output_code == expected_output
     assert n_inserts == 2
+
+
+def test_extract_detects_docstrings(py_lang: PythonProcessor):
+    """
+    Checks that functions whose first statement is a string literal are detected as
+    documented, ignoring leading comments, while other string expressions are not.
+
+    Args:
+        py_lang (PythonProcessor): PythonProcessor instance.
+    """
+    source_code = '''
+def documented():
+    """Already documented."""
+    return 1
+
+def commented():
+    # A comment does not hide the docstring.
+    "Still documented."
+
+def undocumented():
+    return "not a docstring"
+
+def formatted():
+    "{}".format(1)
+'''
+    root = py_lang.to_ast(source_code)
+    funcs = py_lang.extract_function_declarations(root)
+
+    assert {f.name: f.has_docstring for f in funcs} == {
+        "documented": True,
+        "commented": True,
+        "undocumented": False,
+        "formatted": False,
+    }
+
+
+def test_insert_docstrings_nested_and_duplicate(py_lang_full_format: PythonProcessor):
+    """
+    Checks that insertions land on the right function when functions are nested,
+    identical, or have their body on the signature line.
+
+    Args:
+        py_lang_full_format (PythonProcessor): PythonProcessor instance.
+    """
+    source_code = """def outer():
+    def inner():
+        return 1
+    return inner
+
+
+def twin():
+    return 2
+
+
+def twin():
+    return 2
+
+
+def inline(): return 3
+"""
+    root = py_lang_full_format.to_ast(source_code)
+    funcs = py_lang_full_format.extract_function_declarations(root)
+    assert [f.name for f in funcs] == ["outer", "inner", "twin", "twin", "inline"]
+
+    docstrings = [
+        '"""Outer."""',
+        '"""Inner."""',
+        '"""First twin."""',
+        "",
+        '"""Inline."""',
+    ]
+    output_code, n_inserts = py_lang_full_format.insert_docstrings(
+        source_code, funcs, docstrings
+    )
+
+    expected_output = black.format_str(
+        '''def outer():
+    """Outer."""
+    def inner():
+        """Inner."""
+        return 1
+    return inner
+
+
+def twin():
+    """First twin."""
+    return 2
+
+
+def twin():
+    return 2
+
+
+def inline():
+    """Inline."""
+    return 3
+''',
+        mode=black.FileMode(),
+    )
+
+    assert output_code == expected_output
+    assert n_inserts == 4
+
+
+def test_parser_per_thread(py_lang: PythonProcessor):
+    """
+    Checks that every thread gets its own tree-sitter parser and that parsing from
+    several threads at once still extracts every function.
+
+    Args:
+        py_lang (PythonProcessor): PythonProcessor instance.
+    """
+    source = "\n".join(f"def f{i}():\n    return {i}\n" for i in range(50)).encode()
+    main_parser = py_lang.parser
+
+    def extract(_) -> tuple[int, int]:
+        root = py_lang.to_ast(source)
+        return id(py_lang.parser), len(py_lang.extract_function_declarations(root))
+
+    with ThreadPoolExecutor(4) as pool:
+        results = list(pool.map(extract, range(16)))
+
+    assert all(n_functions == 50 for _, n_functions in results)
+    assert id(main_parser) not in {parser_id for parser_id, _ in results}
+
+
+def test_insert_docstrings_formats_only_docstrings(py_lang: PythonProcessor):
+    """
+    Checks that, without full-file formatting, inserted docstrings are indented to
+    their function and wrapped while unrelated code is left untouched.
+
+    Args:
+        py_lang (PythonProcessor): PythonProcessor instance.
+    """
+    source_code = """x = {  'untouched' : 1 }
+class Greeter:
+    def greet(self, name):
+        return 'Hello ' + name
+"""
+    root = py_lang.to_ast(source_code)
+    funcs = py_lang.extract_function_declarations(root)
+    docstring = '''"""
+Greets somebody.
+
+Args:
+    name (str): The name of the person to greet, which is a rather long description that goes on.
+"""'''
+    output_code, n_inserts = py_lang.insert_docstrings(source_code, funcs, [docstring])
+
+    assert (
+        output_code
+        == """x = {  'untouched' : 1 }
+class Greeter:
+    def greet(self, name):
+        \"\"\"
+        Greets somebody.
+
+        Args:
+            name (str): The name of the person to greet, which is a rather long
+                description that goes on.
+        \"\"\"
+        return 'Hello ' + name
+"""
+    )
+    assert n_inserts == 1
+
+
+def test_extract_compacts_long_bodies():
+    """
+    Checks that compacted prompts keep decorators, the first lines of the body and
+    the return/raise statements with the control flow leading to them.
+    """
+    py_lang = PythonProcessor(prompt_body_lines=2)
+    source_code = """@cached
+def lookup(key, default=None):
+    value = None
+    count = 0
+    for store in STORES:
+        count += 1
+        if key in store:
+            return store[key]
+    log(count)
+    log(key)
+    if default is None:
+        raise KeyError(key)
+    return default
+
+def short(x):
+    return x
+"""
+    root = py_lang.to_ast(source_code)
+    lookup, short = py_lang.extract_function_declarations(root)
+
+    assert (
+        lookup.prompt_text
+        == """@cached
+def lookup(key, default=None):
+    value = None
+    count = 0
+    for store in STORES:
+        ...  # 1 line elided
+        if key in store:
+            return store[key]
+    ...  # 2 lines elided
+    if default is None:
+        raise KeyError(key)
+    return default"""
+    )
+    assert (lookup.n_params, lookup.complexity, lookup.n_raises) == (2, 4, 1)
+    assert short.prompt_text == short.text
+    assert short.elisions == ()
+
+
+def test_extract_fingerprints(py_lang: PythonProcessor):
+    """
+    Checks that fingerprints ignore comments and layout but not tokens, and that
+    documented functions are not fingerprinted.
+
+    Args:
+        py_lang (PythonProcessor): PythonProcessor instance.
+    """
+    source = b'''
+def f(a, b):
+    return a + b
+
+
+def f(a,b):  # copy
+    return a \\
+        + b
+
+
+def f(a, b):
+    return a - b
+
+
+@cache
+def f(a, b):
+    return a + b
+
+
+def f(a, b):
+    """Documented."""
+    return a + b
+'''
+    functions = py_lang.extract_function_declarations(py_lang.to_ast(source), source)
+    fingerprints = [f.fingerprint for f in functions]
+
+    assert fingerprints[0] == fingerprints[1]
+    assert len(set(fingerprints[1:4])) == 3
+    assert fingerprints[4] is None
+
+
+def test_to_ast_parses_mapped_files_in_chunks(py_lang: PythonProcessor):
+    """
+    Checks that a memory-mapped file parsed through the read callback yields the
+    same functions, names and fingerprints as parsing its bytes.
+
+    Args:
+        py_lang (PythonProcessor): PythonProcessor instance.
+    """
+    source = b"".join(
+        f"def f{i}(a, b):\n    return a + b * {i}\n\n\n".encode() for i in range(5000)
+    )
+    with tempfile.TemporaryFile() as f:
+        f.write(source)
+        f.flush()
+        mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        from_bytes = py_lang.extract_function_declarations(
+            py_lang.to_ast(source), source
+        )
+        from_map = py_lang.extract_function_declarations(py_lang.to_ast(mapped), mapped)
+        texts = [(f.name, f.text, f.fingerprint) for f in from_map]
+
+    assert len(source) > 2 * PARSE_CHUNK_BYTES
+    assert texts == [(f.name, f.text, f.fingerprint) for f in from_bytes]
+
+
+def test_count_references_and_depth(py_lang: PythonProcessor):
+    """
+    Checks that names are counted across the tree and that nested functions know
+    their depth.
+
+    Args:
+        py_lang (PythonProcessor): PythonProcessor instance.
+    """
+    source = (
+        b"class A:\n    def f(self):\n        return g(g)\n\ndef g(x):\n    return x\n"
+    )
+    root_node = py_lang.to_ast(source)
+
+    references = py_lang.count_references(root_node, source)
+    depths = {
+        f.name: f.depth
+        for f in py_lang.extract_function_declarations(root_node, source)
+    }
+
+    assert references["g"] == 3
+    assert depths == {"f": 1, "g": 0}
+
+
+def test_insert_docstrings_rejects_invalid_edits(
+    py_lang_full_format: PythonProcessor, capsys
+):
+    """
+    Checks that a docstring breaking the syntax of its function or holding code
+    is rejected and reported, while the other docstrings of the file are kept and
+    formatted.
+
+    Args:
+        py_lang_full_format (PythonProcessor): PythonProcessor instance that
+            formats the whole file.
+        capsys: Captures the reported rejections.
+    """
+    source_code = (
+        "def good(): return 1\n"
+        "\n"
+        "def broken():\n"
+        "    return 2\n"
+        "\n"
+        "def code():\n"
+        "    return 3\n"
+        "\n"
+        "def also_good():\n"
+        "    # Comment before the body.\n"
+        "    return 4\n"
+    )
+    tree = py_lang_full_format.parse(source_code)
+    funcs = py_lang_full_format.extract_function_declarations(
+        tree.root_node, source_code.encode()
+    )
+    docstrings = ['"""Good."""', '"""Unterminated', "x = 1", '"""Also good."""']
+
+    output_code, n_inserts = py_lang_full_format.insert_docstrings(
+        source_code, funcs, docstrings, tree=tree
+    )
+    reported = capsys.readouterr().err
+
+    assert n_inserts == 2
+    assert '"""Good."""' in output_code
+    assert '"""Also good."""' in output_code
+    assert "Unterminated" not in output_code
+    assert "x = 1" not in output_code
+    assert not py_lang_full_format.parse(output_code).root_node.has_error
+    assert "broken (line 3)" in reported
+    assert "code (line 6): the response is not a string literal" in reported
+
+
+@pytest.mark.parametrize("full_format", [False, True])
+def test_insert_docstrings_keeps_crlf_line_endings(full_format: bool):
+    """
+    Checks that docstrings inserted into a file with Windows line endings use
+    them too, with and without black formatting.
+
+    Args:
+        full_format (bool): Whether the whole file is formatted with black.
+    """
+    processor = PythonProcessor(full_format=full_format)
+    source_code = b"def f(x):\r\n    return x\r\n\r\n\r\ndef g(): return 1\r\n"
+    tree = processor.parse(source_code)
+    funcs = processor.extract_function_declarations(tree.root_node, source_code)
+
+    output_code, n_inserts = processor.insert_docstrings(
+        source_code, funcs, ['"""F.\n\n    Long.\n    """', '"""G."""'], tree=tree
+    )
+
+    assert n_inserts == 2
+    assert '    """F.\r\n\r\n    Long.\r\n    """\r\n' in output_code
+    assert output_code.count("\n") == output_code.count("\r\n")
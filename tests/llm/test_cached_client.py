@@ -0,0 +1,66 @@
+import tempfile
+
+from devtools.llm.cached_client import CachedClient
+from tests.utils import FakeClient
+
+
+def test_cache_hits_and_misses():
+    """
+    Checks that repeated prompts are answered from the cache and that different
+    request options are cached separately.
+    """
+    inner = FakeClient()
+    with tempfile.TemporaryDirectory() as cache_dir:
+        client = CachedClient(inner, cache_dir=cache_dir)
+        assert client.send_prompt("def f(): pass") == inner.response
+        assert client.send_prompt("def f(): pass") == inner.response
+        client.send_prompt("def f(): pass", max_tokens=10)
+        client.close()
+
+        # The cache survives across runs.
+        reopened = CachedClient(inner, cache_dir=cache_dir)
+        reopened.send_prompt("def f(): pass")
+        reopened.close()
+
+    assert len(inner.prompts) == 2
+    assert client.stats() == {"hits": 1, "misses": 2}
+    assert reopened.stats() == {"hits": 1, "misses": 0}
+
+
+def test_cache_evicts_least_recently_used():
+    """
+    Checks that the least recently used entries are evicted once the cache grows
+    beyond `max_bytes`.
+    """
+    inner = FakeClient(response="x" * 10)
+    with tempfile.TemporaryDirectory() as cache_dir:
+        client = CachedClient(inner, cache_dir=cache_dir, max_bytes=25)
+        client.send_prompt("a")
+        client.send_prompt("b")
+        client.send_prompt("a")
+        client.send_prompt("c")
+        stored = {
+            p: client.get(client.cache_key(p)) is not None for p in ("a", "b", "c")
+        }
+        client.close()
+
+    assert stored == {"a": True, "b": False, "c": True}
+
+
+def test_cache_size_counts_replaced_entries_once():
+    """
+    Checks that storing a response again under the same key does not grow the
+    tracked size, so nothing is evicted early.
+    """
+    with tempfile.TemporaryDirectory() as cache_dir:
+        client = CachedClient(FakeClient(), cache_dir=cache_dir, max_bytes=25)
+        key = client.cache_key("a")
+        for _ in range(5):
+            client.put(key, "x" * 10)
+        client.put(client.cache_key("b"), "y" * 10)
+        stored = [client.get(client.cache_key(p)) for p in ("a", "b")]
+        size = client._size
+        client.close()
+
+    assert size == 20
+    assert stored == ["x" * 10, "y" * 10]
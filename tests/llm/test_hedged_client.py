@@ -0,0 +1,145 @@
+import asyncio
+import time
+
+import pytest
+
+from devtools.llm.client_interface import IClient
+from devtools.llm.errors import RetryableError
+from devtools.llm.hedged_client import HedgedClient
+
+
+class FakeBackend(IClient):
+    def __init__(
+        self,
+        name: str,
+        latencies: list[float],
+        *,
+        fail: bool = False,
+        model: str = "fake",
+    ):
+        """
+        A backend answering with its name after scripted latencies.
+
+        Args:
+            name (str): The response of the backend.
+            latencies (list[float]): Seconds each request takes, cycled through.
+            fail (bool, optional): Raise a `RetryableError` instead of answering.
+            model (str, optional): The model the backend claims to be.
+        """
+        self.name = name
+        self.model = model
+        self.latencies = latencies
+        self.fail = fail
+        self.calls = 0
+        self.cancelled = 0
+
+    def send_prompt(self, prompt: str, **kwargs) -> str:
+        """
+        Not used: the hedged client only sends async requests to its backends.
+        """
+        raise NotImplementedError
+
+    async def send_prompt_async(self, prompt: str, **kwargs) -> str:
+        """
+        Waits for the next scripted latency, then answers or fails.
+
+        Args:
+            prompt (str): The prompt message to be sent.
+
+        Returns:
+            str: The name of the backend.
+        """
+        latency = self.latencies[self.calls % len(self.latencies)]
+        self.calls += 1
+        try:
+            await asyncio.sleep(latency)
+        except asyncio.CancelledError:
+            self.cancelled += 1
+            raise
+        if self.fail:
+            raise RetryableError(f"{self.name} failed")
+        return self.name
+
+
+async def timed_requests(client: HedgedClient, n: int) -> list[float]:
+    """
+    Sends requests one after the other.
+
+    Args:
+        client (HedgedClient): The client under test.
+        n (int): The number of requests.
+
+    Returns:
+        list[float]: The latency of every request.
+    """
+    latencies = []
+    for _ in range(n):
+        start = time.perf_counter()
+        await client.send_prompt_async("def f(): pass")
+        latencies.append(time.perf_counter() - start)
+    return latencies
+
+
+def test_hedging_cuts_the_tail():
+    """
+    Checks that stragglers of a fast backend are hedged to a second backend, the
+    loser is cancelled, and the slowest request stays far below the straggler
+    latency.
+    """
+    fast = FakeBackend("fast", [0.005] * 9 + [1.0])
+    steady = FakeBackend("steady", [0.03])
+    client = HedgedClient([fast, steady], hedge_quantile=0.8, initial_delay=0.05)
+
+    latencies = asyncio.run(timed_requests(client, 60))
+
+    assert max(latencies) < 0.5
+    assert client.hedges >= 5
+    assert fast.cancelled >= 5
+    assert client.stats[0].wins > client.stats[1].wins
+
+
+def test_failures_fall_over_and_steer_traffic():
+    """
+    Checks that a failing backend hands requests to the next one and stops being
+    preferred.
+    """
+    broken = FakeBackend("broken", [0.001], fail=True)
+    healthy = FakeBackend("healthy", [0.001])
+    client = HedgedClient([broken, healthy])
+
+    async def concurrent_requests() -> list[str]:
+        return await asyncio.gather(*(client.send_prompt_async("p") for _ in range(5)))
+
+    responses = asyncio.run(concurrent_requests())
+    client.send_prompt("p")
+
+    assert responses == ["healthy"] * 5
+    assert client.ranked() == [1, 0]
+    assert client.stats[0].errors >= 1
+    assert healthy.calls == 6
+
+
+def test_raises_when_every_backend_fails():
+    """
+    Checks that the last error is raised once every backend failed.
+    """
+    client = HedgedClient([FakeBackend(str(i), [0.001], fail=True) for i in range(2)])
+
+    with pytest.raises(RetryableError):
+        client.send_prompt("p")
+    with pytest.raises(ValueError):
+        HedgedClient([])
+
+
+def test_model_names_the_whole_pool():
+    """
+    Checks that the model of a hedged client covers every backend that may answer,
+    so cache keys do not attribute a response to the wrong model.
+    """
+    first = FakeBackend("first", [0.0], fail=True, model="model-a")
+    second = FakeBackend("second", [0.0], model="model-b")
+    third = FakeBackend("third", [0.0], model="model-a")
+    client = HedgedClient([first, second, third])
+
+    assert client.send_prompt("def f(): pass") in ("second", "third")
+    assert client.model == "model-a|model-b"
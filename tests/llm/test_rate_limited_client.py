@@ -0,0 +1,94 @@
+import asyncio
+
+import pytest
+
+from benchmarks.fake_openai import FakeOpenAIServer
+from devtools.llm.errors import RateLimitedError, RetryableError
+from devtools.llm.openai_client import OpenAIClient
+from devtools.llm.rate_limited_client import RateLimitedClient, parse_duration
+
+
+def make_client(server: FakeOpenAIServer, **kwargs) -> RateLimitedClient:
+    """
+    Builds a rate limited OpenAIClient pointed at a fake server.
+
+    Args:
+        server (FakeOpenAIServer): The server to send requests to.
+        **kwargs: Passed to `RateLimitedClient`.
+
+    Returns:
+        RateLimitedClient: The client under test.
+    """
+    inner = OpenAIClient(
+        auth={"api_key": "test"}, config={"base_url": server.url, "max_retries": 0}
+    )
+    return RateLimitedClient(inner, base_delay=0.01, **kwargs)
+
+
+def test_retries_throttled_and_transient_failures():
+    """
+    Checks that 429 and 5xx responses are retried until a request succeeds and
+    that throttling shrinks the concurrency limit.
+    """
+    with FakeOpenAIServer() as server:
+        client = make_client(server, max_concurrency=8)
+        server.fail(429, retry_after="0")
+        server.fail(503)
+
+        response = asyncio.run(client.send_prompt_async("def f(): pass"))
+
+    assert response == server.response
+    assert len(server.requests) == 3
+    assert client.retries == 2
+    assert client.throttled == 1
+    assert client.concurrency.limit < 8
+
+
+def test_gives_up_after_max_retries():
+    """
+    Checks that the last error is raised once the retries are exhausted and that
+    non-retryable errors are not retried.
+    """
+    with FakeOpenAIServer() as server:
+        client = make_client(server, max_retries=2)
+        server.fail(429, n=3)
+        with pytest.raises(RateLimitedError):
+            client.send_prompt("def f(): pass")
+
+        server.fail(400)
+        with pytest.raises(Exception) as error:
+            client.send_prompt("def f(): pass")
+
+    assert not isinstance(error.value, RetryableError)
+    assert len(server.requests) == 4
+
+
+def test_adopts_quota_from_headers():
+    """
+    Checks that the quota reported in the rate-limit headers is adopted and that an
+    exhausted quota pauses requests until it resets.
+    """
+    with FakeOpenAIServer() as server:
+        server.headers = {
+            "x-ratelimit-limit-requests": "600",
+            "x-ratelimit-remaining-requests": "0",
+            "x-ratelimit-reset-requests": "250ms",
+        }
+        client = make_client(server)
+        client.send_prompt("def f(): pass")
+        wait = client.requests.reserve(1) if client.requests else 0
+
+    assert client.requests is not None
+    assert client.requests.per_minute == 600
+    assert wait > 0.1
+
+
+def test_parse_duration():
+    """
+    Checks the reset durations used by rate-limit headers.
+    """
+    assert parse_duration("1s") == 1
+    assert parse_duration("6m0s") == 360
+    assert parse_duration("20ms") == pytest.approx(0.02)
+    assert parse_duration("2.5") == 2.5
+    assert parse_duration(None) is None
@@ -0,0 +1,97 @@
+import asyncio
+import importlib.util
+
+import pytest
+
+from benchmarks.fake_openai import FakeOpenAIServer
+from devtools.llm import registry
+from devtools.llm.openai_client import OpenAIClient
+
+
+def make_client(server: FakeOpenAIServer) -> OpenAIClient:
+    """
+    Builds an OpenAIClient pointed at a fake server.
+
+    Args:
+        server (FakeOpenAIServer): The server to send requests to.
+
+    Returns:
+        OpenAIClient: The client under test.
+    """
+    return OpenAIClient(
+        auth={"api_key": "test"}, config={"base_url": server.url, "max_retries": 0}
+    )
+
+
+def test_clients_share_one_connection():
+    """
+    Checks that separately constructed clients reuse the same pooled connection.
+    """
+    with FakeOpenAIServer() as server:
+        first, second = make_client(server), make_client(server)
+        for _ in range(3):
+            first.send_prompt("def f(): pass")
+            second.send_prompt("def g(): pass")
+
+    assert first.client is second.client
+    assert len(server.requests) == 6
+    assert server.connections == 1
+
+
+def test_async_clients_are_per_event_loop():
+    """
+    Checks that async clients are shared within an event loop and that separate
+    `asyncio.run` calls each get a working client.
+    """
+
+    async def run(client: OpenAIClient) -> tuple:
+        await asyncio.gather(
+            *(client.send_prompt_async("def f(): pass") for _ in range(4))
+        )
+        return client.async_client, make_client(server).async_client
+
+    with FakeOpenAIServer() as server:
+        client = make_client(server)
+        first, same_loop = asyncio.run(run(client))
+        second, _ = asyncio.run(run(client))
+
+    assert first is same_loop
+    assert first is not second
+    assert len(server.requests) == 8
+
+
+def test_configure_pool_replaces_clients():
+    """
+    Checks that reconfiguring the pool hands out clients on a new pool and that
+    HTTP/2 without `h2` is reported clearly.
+    """
+    with FakeOpenAIServer() as server:
+        before = make_client(server).client
+        registry.configure_pool(max_connections=4)
+        after = make_client(server)
+        after.send_prompt("def f(): pass")
+
+    assert before is not after.client
+    assert len(server.requests) == 1
+
+    registry.configure_pool()
+    if importlib.util.find_spec("h2") is None:
+        with pytest.raises(RuntimeError, match="h2"):
+            registry.configure_pool(http2=True)
+
+
+def test_aclose_loop_closes_the_pool_of_the_loop():
+    """
+    Checks that `aclose_loop` closes the async pool of the running event loop and
+    that clients handed out afterwards open a new one.
+    """
+
+    async def run() -> tuple:
+        first = registry.async_http_client()
+        await registry.aclose_loop()
+        return first, registry.async_http_client()
+
+    closed, reopened = asyncio.run(run())
+
+    assert closed.is_closed
+    assert reopened is not closed
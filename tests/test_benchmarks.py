@@ -0,0 +1,83 @@
+import os
+import tempfile
+
+import pytest
+
+from benchmarks.corpus import generate_corpus
+from benchmarks.docstringify import compare, run_benchmark
+from benchmarks.fake_openai import FakeOpenAIServer
+from devtools.lang_processor.python import PythonProcessor
+from devtools.llm.errors import RateLimitedError
+from devtools.llm.openai_client import OpenAIClient
+
+
+def test_generate_corpus(py_lang: PythonProcessor):
+    """
+    Checks that the corpus parses and reports its undocumented functions.
+
+    Args:
+        py_lang (PythonProcessor): PythonProcessor instance.
+    """
+    with tempfile.TemporaryDirectory() as root:
+        n_undocumented = generate_corpus(root, n_files=6, n_functions=8, seed=3)
+        functions = []
+        for directory, _, files in os.walk(root):
+            for name in files:
+                with open(os.path.join(directory, name), "rb") as f:
+                    source = f.read()
+                compile(source, name, "exec")
+                root_node = py_lang.to_ast(source)
+                functions += py_lang.extract_function_declarations(root_node, source)
+
+    assert len(functions) == 6 * 8
+    assert n_undocumented == sum(not f.has_docstring for f in functions)
+    assert 0 < n_undocumented < len(functions)
+
+
+def test_run_benchmark_with_failures():
+    """
+    Checks that a benchmark run against a failing fake API still documents every
+    function and reports its metrics.
+    """
+    results = run_benchmark(files=3, functions=4, latency=0.001, error_rate=0.2)
+
+    assert results["insertions"] == results["expected_insertions"]
+    assert results["requests"] >= results["insertions"]
+    assert results["p50_ms"] <= results["p99_ms"]
+    assert results["peak_rss_mb"] > 0
+
+
+def test_compare_flags_regressions():
+    """
+    Checks that only changes for the worse beyond the threshold are regressions.
+    """
+    baseline = {"files_per_s": 10.0, "p99_ms": 100.0, "peak_rss_mb": 50.0}
+    results = {"files_per_s": 8.0, "p99_ms": 80.0, "peak_rss_mb": 52.0}
+
+    rows = {row[0]: row for row in compare(results, baseline, threshold=0.1)}
+
+    assert rows["files_per_s"][4]
+    assert not rows["p99_ms"][4]
+    assert not rows["peak_rss_mb"][4]
+    assert "p50_ms" not in rows
+
+
+def test_fake_server_enforces_rate_limit():
+    """
+    Checks that the fake API throttles requests beyond its quota and advertises
+    the quota in its headers.
+    """
+    with FakeOpenAIServer(requests_per_minute=2) as server:
+        client = OpenAIClient(
+            auth={"api_key": "test"}, config={"base_url": server.url, "max_retries": 0}
+        )
+        headers = []
+        client.header_listeners.append(headers.append)
+        client.send_prompt("def f(): pass")
+        client.send_prompt("def f(): pass")
+        with pytest.raises(RateLimitedError) as error:
+            client.send_prompt("def f(): pass")
+
+    assert headers[-1]["x-ratelimit-remaining-requests"] == "0"
+    assert error.value.retry_after is not None
+    assert 0 < error.value.retry_after <= 60
@@ -0,0 +1,148 @@
+import json
+import os
+import tempfile
+
+import pytest
+
+from benchmarks.fake_openai import FakeOpenAIServer
+from devtools.bulk import BulkJob
+from devtools.docstringer import DocStringWriter
+from devtools.lang_processor.python import PythonProcessor
+from devtools.llm.openai_client import OpenAIClient
+from tests.utils import FakeClient
+
+SOURCE_CODE = """
+def one():
+    return 1
+
+
+def two():
+    return 2
+"""
+
+
+def make_job(server: FakeOpenAIServer, py_lang: PythonProcessor, path: str) -> BulkJob:
+    """
+    Creates a bulk job that talks to a fake server.
+
+    Args:
+        server (FakeOpenAIServer): The server standing in for the OpenAI API.
+        py_lang (PythonProcessor): PythonProcessor instance.
+        path (str): The job file.
+
+    Returns:
+        BulkJob: The job.
+    """
+    client = OpenAIClient(auth={"api_key": "test"}, config={"base_url": server.url})
+    return BulkJob(DocStringWriter(FakeClient(), py_lang), client, path)
+
+
+def test_submit_and_apply(py_lang: PythonProcessor):
+    """
+    Checks that a job submits one request per distinct function, inserts the
+    results into unchanged files and skips files edited after submission.
+
+    Args:
+        py_lang (PythonProcessor): PythonProcessor instance.
+    """
+    with tempfile.TemporaryDirectory() as root, FakeOpenAIServer() as server:
+        src = os.path.join(root, "src")
+        os.mkdir(src)
+        for name in ("a.py", "b.py", "edited.py"):
+            with open(os.path.join(src, name), "w") as f:
+                f.write(SOURCE_CODE)
+        job_path = os.path.join(root, "job.json")
+
+        batch_ids = make_job(server, py_lang, job_path).submit(src)
+        with open(os.path.join(src, "edited.py"), "a") as f:
+            f.write("\n\ndef three():\n    return 3\n")
+        n_insertions = make_job(server, py_lang, job_path).apply()
+
+        with open(os.path.join(src, "a.py")) as f:
+            a = f.read()
+        with open(os.path.join(src, "edited.py")) as f:
+            edited = f.read()
+        with open(job_path) as f:
+            state = json.load(f)
+        with open(state["batches"][0]["input"]) as f:
+            requests = [json.loads(line) for line in f]
+
+    assert batch_ids == ["batch-0"]
+    assert len(requests) == 2
+    assert requests[0]["custom_id"].startswith("a.py:1-")
+    assert requests[0]["url"] == "/v1/chat/completions"
+    assert len(state["copies"]) == 4
+    assert n_insertions == 4
+    assert a.count(server.response) == 2
+    assert server.response not in edited
+
+
+def test_apply_requires_completed_batches(py_lang: PythonProcessor):
+    """
+    Checks that results are only applied once every batch completed and that a
+    job is not submitted twice.
+
+    Args:
+        py_lang (PythonProcessor): PythonProcessor instance.
+    """
+    with tempfile.TemporaryDirectory() as root, FakeOpenAIServer() as server:
+        server.batch_status = "in_progress"
+        file_path = os.path.join(root, "module.py")
+        with open(file_path, "w") as f:
+            f.write(SOURCE_CODE)
+        job = make_job(server, py_lang, os.path.join(root, "job.json"))
+        job.submit(file_path)
+
+        with pytest.raises(RuntimeError):
+            job.apply()
+        with pytest.raises(RuntimeError):
+            job.submit(file_path)
+        status = job.status()
+        with open(file_path) as f:
+            content = f.read()
+
+    assert status == [
+        {
+            "id": "batch-0",
+            "status": "in_progress",
+            "completed": 2,
+            "failed": 0,
+            "total": 2,
+        }
+    ]
+    assert content == SOURCE_CODE
+
+
+def test_apply_counts_failed_requests_only(py_lang: PythonProcessor, capsys):
+    """
+    Checks that only requests without an answer are reported as failed, not the
+    ones answered with an empty docstring, and that failed functions can be
+    retried by a new job.
+
+    Args:
+        py_lang (PythonProcessor): PythonProcessor instance.
+        capsys: Captures the report of failed requests.
+    """
+    with tempfile.TemporaryDirectory() as root, FakeOpenAIServer() as server:
+        file_path = os.path.join(root, "mod.py")
+        with open(file_path, "w") as f:
+            f.write(SOURCE_CODE)
+
+        server.failures.append((500, {}))
+        server.response = ""
+        first = os.path.join(root, "first.json")
+        make_job(server, py_lang, first).submit(file_path)
+        n_empty = make_job(server, py_lang, first).apply()
+        reported = capsys.readouterr().out
+
+        server.response = '"""Generated docstring."""'
+        second = os.path.join(root, "second.json")
+        make_job(server, py_lang, second).submit(file_path)
+        n_retried = make_job(server, py_lang, second).apply()
+        with open(file_path) as f:
+            content = f.read()
+
+    assert n_empty == 0
+    assert "1 requests failed" in reported
+    assert n_retried == 2
+    assert content.count(server.response) == 2
@@ -0,0 +1,135 @@
+import json
+import subprocess
+import sys
+import tempfile
+
+from click.testing import CliRunner
+
+from benchmarks.fake_openai import FakeOpenAIServer
+from devtools.cli import main
+
+HEAVY_MODULES = ["black", "openai", "rich", "tree_sitter", "tree_sitter_python"]
+
+
+def test_help_does_not_import_heavy_modules():
+    """
+    Guards CLI start-up time: importing the CLI and rendering `--help` must not pull
+    in any of the heavy dependencies.
+    """
+    code = (
+        "import sys\n"
+        "from devtools.cli import main\n"
+        "try:\n"
+        "    main(['docstringify', '--help'])\n"
+        "except SystemExit:\n"
+        "    pass\n"
+        f"print(sorted(set({HEAVY_MODULES!r}) & set(sys.modules)))\n"
+    )
+    result = subprocess.run(
+        [sys.executable, "-c", code], capture_output=True, text=True, check=True
+    )
+
+    assert result.stdout.strip().splitlines()[-1] == "[]"
+
+
+def test_version():
+    """
+    Checks that the CLI reports the package version.
+    """
+    result = CliRunner().invoke(main, ["--version"])
+
+    assert result.exit_code == 0
+    assert "devtools" in result.output
+
+
+def test_diff_leaves_files_untouched(monkeypatch):
+    """
+    Checks that `--diff` streams a patch of the inserted docstrings to stdout and
+    does not modify the file.
+    """
+    with tempfile.TemporaryDirectory() as root, FakeOpenAIServer() as server:
+        monkeypatch.setenv("OPENAI_BASE_URL", server.url)
+        monkeypatch.chdir(root)
+        with open("module.py", "w") as f:
+            f.write("def f():\n    return 1\n")
+
+        result = CliRunner().invoke(
+            main,
+            [
+                "docstringify",
+                "module.py",
+                "--openai-api-key=test",
+                "--no-cache",
+                "--diff",
+            ],
+        )
+        with open("module.py") as f:
+            content = f.read()
+
+    assert result.exit_code == 0, result.output
+    assert content == "def f():\n    return 1\n"
+    assert '+    """Generated docstring."""\n' in result.stdout
+    assert result.stdout.startswith("--- a/module.py\n")
+
+
+def test_bulk_submit_and_apply(monkeypatch):
+    """
+    Checks that `bulk submit` and `bulk apply` backfill docstrings through the
+    Batch API endpoints of the chosen model and endpoint.
+    """
+    with tempfile.TemporaryDirectory() as root, FakeOpenAIServer() as server:
+        monkeypatch.delenv("OPENAI_BASE_URL", raising=False)
+        monkeypatch.chdir(root)
+        with open("module.py", "w") as f:
+            f.write("def f():\n    return 1\n")
+
+        options = [
+            "--openai-api-key=test",
+            f"--base-url={server.url}",
+            "--model=gpt-4o-mini",
+            "--job=job.json",
+        ]
+        submitted = CliRunner().invoke(main, ["bulk", "submit", ".", *options])
+        status = CliRunner().invoke(main, ["bulk", "status", *options])
+        applied = CliRunner().invoke(main, ["bulk", "apply", *options])
+        with open("module.py") as f:
+            content = f.read()
+
+    batch = server.batches["batch-0"]
+    [request] = server.files[batch["input_file_id"]].splitlines()
+    assert submitted.exit_code == 0, submitted.output
+    assert json.loads(request)["body"]["model"] == "gpt-4o-mini"
+    assert "batch-0: completed, 1 completed, 0 failed of 1" in status.output
+    assert applied.exit_code == 0, applied.output
+    assert '"""Generated docstring."""' in content
+
+
+def test_hedge_backend_takes_over_failed_requests(monkeypatch):
+    """
+    Checks that a request failing on the primary endpoint is answered by a
+    `--hedge-backend`.
+    """
+    with tempfile.TemporaryDirectory() as root, FakeOpenAIServer() as primary:
+        with FakeOpenAIServer(response='"""Backup docstring."""') as backup:
+            monkeypatch.setenv("OPENAI_BASE_URL", primary.url)
+            monkeypatch.chdir(root)
+            with open("module.py", "w") as f:
+                f.write("def f():\n    return 1\n")
+            primary.fail(400)
+
+            result = CliRunner().invoke(
+                main,
+                [
+                    "docstringify",
+                    "module.py",
+                    "--openai-api-key=test",
+                    "--no-cache",
+                    f"--hedge-backend=gpt-4@{backup.url}",
+                ],
+            )
+            with open("module.py") as f:
+                content = f.read()
+
+    assert result.exit_code == 0, result.output
+    assert '"""Backup docstring."""' in content
+    assert len(primary.requests) == 1
@@ -0,0 +1,134 @@
+import asyncio
+import os
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+from typing import Iterator
+
+import pytest
+
+from devtools.daemon import DocStringDaemon, request
+from devtools.docstringer import DocStringWriter
+from devtools.lang_processor.python import PythonProcessor
+from tests.utils import FakeClient
+
+SOURCE_CODE = "def f():\n    return 1\n"
+
+
+@contextmanager
+def running_daemon(daemon: DocStringDaemon) -> Iterator[DocStringDaemon]:
+    """
+    Runs a daemon on a background thread for the duration of the block.
+
+    Args:
+        daemon (DocStringDaemon): The daemon to run.
+
+    Yields:
+        DocStringDaemon: The daemon, accepting requests.
+    """
+    thread = threading.Thread(target=daemon.run, daemon=True)
+    thread.start()
+    assert daemon.ready.wait(5), "the daemon did not start"
+    try:
+        yield daemon
+    finally:
+        daemon.stop()
+        thread.join(5)
+
+
+def test_daemon_serves_requests(py_lang: PythonProcessor):
+    """
+    Checks that the daemon docstringifies requested paths with its resident writer,
+    reports errors per request and removes its socket on shutdown.
+
+    Args:
+        py_lang (PythonProcessor): PythonProcessor instance.
+    """
+    client = FakeClient()
+    with tempfile.TemporaryDirectory() as root:
+        file_path = os.path.join(root, "module.py")
+        with open(file_path, "w") as f:
+            f.write(SOURCE_CODE)
+        socket_path = os.path.join(root, "daemon.sock")
+        daemon = DocStringDaemon(
+            DocStringWriter(client, py_lang), socket_path=socket_path
+        )
+
+        with running_daemon(daemon):
+            pong = request({"command": "ping"}, socket_path)
+            result = request({"command": "docstringify", "paths": [root]}, socket_path)
+            again = request({"command": "docstringify", "paths": [root]}, socket_path)
+            unknown = request({"command": "restart"}, socket_path)
+            with pytest.raises(RuntimeError):
+                DocStringDaemon(daemon.writer, socket_path=socket_path).run()
+
+        with open(file_path) as f:
+            content = f.read()
+        socket_left = os.path.exists(socket_path)
+
+    assert pong == {"ok": True, "pid": os.getpid()}
+    assert result == {"ok": True, "files": 1, "insertions": 1, "errors": {}}
+    assert again["insertions"] == 0
+    assert not unknown["ok"]
+    assert client.response in content
+    assert len(client.prompts) == 1
+    assert not socket_left
+    assert daemon._locks == {}
+
+
+def test_daemon_watches_saved_files(py_lang: PythonProcessor):
+    """
+    Checks that a file saved below a watched directory is docstringified without
+    a request, and that the daemon's own write does not trigger another run.
+
+    Args:
+        py_lang (PythonProcessor): PythonProcessor instance.
+    """
+    client = FakeClient()
+    with tempfile.TemporaryDirectory() as root:
+        file_path = os.path.join(root, "module.py")
+        daemon = DocStringDaemon(
+            DocStringWriter(client, py_lang),
+            watch=[root],
+            socket_path=os.path.join(root, "daemon.sock"),
+            interval=0.01,
+        )
+
+        with running_daemon(daemon):
+            time.sleep(0.05)
+            with open(file_path, "w") as f:
+                f.write(SOURCE_CODE)
+            deadline = time.monotonic() + 5
+            while client.response not in open(file_path).read():
+                assert time.monotonic() < deadline, "the saved file was not processed"
+                time.sleep(0.01)
+            time.sleep(0.1)
+
+    assert len(client.prompts) == 1
+
+
+def test_daemon_keeps_its_own_writes_across_a_scan(
+    py_lang: PythonProcessor, monkeypatch: pytest.MonkeyPatch
+):
+    """
+    Checks that a file the daemon writes while the watcher scans is not taken for
+    a save when the scan saw it before the write.
+
+    Args:
+        py_lang (PythonProcessor): PythonProcessor instance.
+        monkeypatch (pytest.MonkeyPatch): Replaces the scan.
+    """
+    daemon = DocStringDaemon(DocStringWriter(FakeClient(), py_lang), watch=["."])
+    before, written = (1, 10), (2, 20)
+
+    def scan() -> dict:
+        daemon._files["module.py"] = written
+        return {"module.py": before}
+
+    monkeypatch.setattr(daemon, "_scan", scan)
+    daemon._files = {"module.py": before}
+    changed = asyncio.run(daemon._rescan())
+
+    assert changed == []
+    assert daemon._files == {"module.py": written}
@@ -0,0 +1,340 @@
+import asyncio
+import json
+import os
+import tempfile
+
+import pytest
+
+from benchmarks.fake_openai import FakeOpenAIServer
+from devtools.docstringer import DocStringWriter
+from devtools.file_input import FileTooLargeError
+from devtools.lang_processor.python import PythonProcessor
+from devtools.llm.openai_client import OpenAIClient
+from tests.utils import FakeClient, mktemp
+
+SOURCE_CODE = """
+def one():
+    return 1
+
+
+def two():
+    return 2
+
+
+def three():
+    return 3
+"""
+
+
+class EchoNameClient(FakeClient):
+    async def send_prompt_async(self, prompt: str, **kwargs) -> str:
+        """
+        Answers with a docstring naming the function, finishing later functions first.
+
+        Args:
+            prompt (str): The prompt containing the function text.
+
+        Returns:
+            str: A docstring containing the function name.
+        """
+        name = prompt.split("def ")[1].split("(")[0]
+        await asyncio.sleep({"one": 0.03, "two": 0.02, "three": 0.01}[name])
+        return f'"""Docstring for {name}."""'
+
+
+def test_generate_docstrings_async_limits_concurrency(py_lang: PythonProcessor):
+    """
+    Checks that no more than `max_concurrency` requests are in flight at once.
+
+    Args:
+        py_lang (PythonProcessor): PythonProcessor instance.
+    """
+    client = FakeClient(delay=0.01)
+    ds = DocStringWriter(client, py_lang, max_concurrency=2)
+
+    docstrings = asyncio.run(ds.generate_docstrings_async(["def f(): pass"] * 6))
+
+    assert docstrings == [client.response] * 6
+    assert client.max_in_flight == 2
+
+
+def test_docstringify_file_keeps_function_order(py_lang: PythonProcessor):
+    """
+    Checks that concurrently generated docstrings land on the right functions even
+    when the responses complete out of order.
+
+    Args:
+        py_lang (PythonProcessor): PythonProcessor instance.
+    """
+    ds = DocStringWriter(EchoNameClient(), py_lang)
+    with mktemp(".py") as file_path:
+        with open(file_path, "w") as f:
+            f.write(SOURCE_CODE)
+
+        n_insertions = ds.docstringify_file(file_path)
+
+        with open(file_path) as f:
+            updated_code = f.read()
+
+    assert n_insertions == 3
+    for name in ("one", "two", "three"):
+        assert f'def {name}():\n    """Docstring for {name}."""' in updated_code
+
+
+def test_docstringify_file_in_consecutive_event_loops(py_lang: PythonProcessor):
+    """
+    Checks that one OpenAI client documents files in consecutive `asyncio.run`
+    calls, which each need connections of their own event loop.
+
+    Args:
+        py_lang (PythonProcessor): PythonProcessor instance.
+    """
+    with FakeOpenAIServer() as server, mktemp(".py") as first, mktemp(".py") as second:
+        client = OpenAIClient(
+            auth={"api_key": "test"}, config={"base_url": server.url, "max_retries": 0}
+        )
+        ds = DocStringWriter(client, py_lang)
+        n_insertions = []
+        for file_path in (first, second):
+            with open(file_path, "w") as f:
+                f.write(SOURCE_CODE)
+            n_insertions.append(ds.docstringify_file(file_path))
+
+    assert n_insertions == [3, 3]
+    assert len(server.requests) == 6
+
+
+@pytest.mark.parametrize("configured", [False, True])
+def test_system_prompt_of_the_client_takes_precedence(
+    py_lang: PythonProcessor, configured: bool
+):
+    """
+    Checks that requests use the system prompt of the file's language unless the
+    client has one configured.
+
+    Args:
+        py_lang (PythonProcessor): PythonProcessor instance.
+        configured (bool): Whether the client has a system prompt configured.
+    """
+    with FakeOpenAIServer() as server, mktemp(".py") as file_path:
+        options = {"base_url": server.url, "max_retries": 0}
+        if configured:
+            options["system_prompt"] = "Custom prompt."
+        client = OpenAIClient(auth={"api_key": "test"}, config=options)
+        with open(file_path, "w") as f:
+            f.write(SOURCE_CODE)
+        DocStringWriter(client, py_lang).docstringify_file(file_path)
+
+    prompts = {request["messages"][0]["content"] for request in server.requests}
+    assert prompts == ({"Custom prompt."} if configured else {py_lang.system_prompt()})
+
+
+def test_docstringify_file_skips_documented_functions(py_lang: PythonProcessor):
+    """
+    Checks that already documented functions are never sent to the model and are
+    counted as skipped calls.
+
+    Args:
+        py_lang (PythonProcessor): PythonProcessor instance.
+    """
+    client = FakeClient()
+    ds = DocStringWriter(client, py_lang)
+    with mktemp(".py") as file_path:
+        with open(file_path, "w") as f:
+            f.write(SOURCE_CODE.replace("return 2", '"""Two."""\n    return 2'))
+
+        n_insertions = ds.docstringify_file(file_path)
+
+    assert n_insertions == 2
+    assert len(client.prompts) == 2
+    assert not any("def two" in prompt for prompt in client.prompts)
+    assert ds.skipped_calls == 1
+
+
+class BatchClient(FakeClient):
+    def __init__(self, *, valid_json: bool = True):
+        """
+        A client that answers batched prompts with a JSON object of docstrings.
+
+        Args:
+            valid_json (bool, optional): If False, batched responses are malformed.
+        """
+        super().__init__()
+        self.valid_json = valid_json
+        self.batch_sizes: list[int] = []
+
+    def send_prompt(self, prompt: str, **kwargs) -> str:
+        """
+        Answers a batched prompt for every function id, or a single prompt with the
+        fixed response.
+
+        Args:
+            prompt (str): The prompt message to be sent.
+
+        Returns:
+            str: The response to the prompt.
+        """
+        if "response_format" not in kwargs:
+            return super().send_prompt(prompt, **kwargs)
+
+        functions = json.loads(prompt)["functions"]
+        self.batch_sizes.append(len(functions))
+        if not self.valid_json:
+            return "Sure! Here are your docstrings:"
+        return json.dumps({f["id"]: f'"""Batched {f["id"]}."""' for f in functions})
+
+
+def test_generate_docstrings_batched(py_lang: PythonProcessor):
+    """
+    Checks that functions are packed into token-budgeted batches and unpacked in order.
+
+    Args:
+        py_lang (PythonProcessor): PythonProcessor instance.
+    """
+    client = BatchClient()
+    ds = DocStringWriter(client, py_lang, batch_token_budget=15)
+    functions = [f"def f{i}(): pass" for i in range(5)]
+
+    docstrings = asyncio.run(ds.generate_docstrings_async(functions))
+
+    assert client.batch_sizes == [3, 2]
+    assert docstrings == [f'"""Batched f{i}."""' for i in (0, 1, 2, 0, 1)]
+
+
+def test_generate_docstrings_batch_fallback(py_lang: PythonProcessor):
+    """
+    Checks that a batch whose response cannot be parsed is retried one function at
+    a time.
+
+    Args:
+        py_lang (PythonProcessor): PythonProcessor instance.
+    """
+    client = BatchClient(valid_json=False)
+    ds = DocStringWriter(client, py_lang, batch_token_budget=1000)
+    functions = [f"def f{i}(): pass" for i in range(3)]
+
+    docstrings = asyncio.run(ds.generate_docstrings_async(functions))
+
+    assert client.batch_sizes == [3]
+    assert docstrings == [client.response] * 3
+    assert len(client.prompts) == 3
+
+
+def test_docstringify_file_compacts_prompts():
+    """
+    Checks that long bodies are elided from prompts and that the output budget
+    grows with the parameters and branches of a function.
+    """
+    client = FakeClient()
+    ds = DocStringWriter(client, PythonProcessor(prompt_body_lines=3))
+    filler = "".join(f"    x{i} = {i}\n" for i in range(20))
+    source_code = (
+        "def small():\n    return 1\n\n\n"
+        f"def large(a, b, c):\n{filler}    if a:\n        raise ValueError(b)\n"
+        f"{filler}    return c\n"
+    )
+
+    with mktemp(".py") as file_path:
+        with open(file_path, "w") as f:
+            f.write(source_code)
+        n_insertions = ds.docstringify_file(file_path)
+
+    small, large = sorted(zip(client.prompts, client.options), key=lambda p: len(p[0]))
+    assert n_insertions == 2
+    assert "x19" not in large[0]
+    assert "20 lines elided" in large[0]
+    assert "raise ValueError(b)" in large[0] and "return c" in large[0]
+    assert small[1]["max_tokens"] < large[1]["max_tokens"]
+
+
+def test_docstringify_skips_ignored_directories(py_lang: PythonProcessor):
+    """
+    Checks that ignored and virtualenv directories are neither counted nor
+    docstringified.
+
+    Args:
+        py_lang (PythonProcessor): PythonProcessor instance.
+    """
+    with tempfile.TemporaryDirectory() as root:
+        for directory in ("pkg", "vendor", ".venv"):
+            os.mkdir(os.path.join(root, directory))
+            with open(os.path.join(root, directory, "module.py"), "w") as f:
+                f.write(SOURCE_CODE)
+        with open(os.path.join(root, ".gitignore"), "w") as f:
+            f.write("vendor/\n")
+
+        ds = DocStringWriter(FakeClient(), py_lang)
+        n_dirs, n_insertions = ds.docstringify(root)
+        with open(os.path.join(root, "vendor", "module.py")) as f:
+            vendored = f.read()
+
+    assert (n_dirs, n_insertions) == (2, 3)
+    assert vendored == SOURCE_CODE
+
+
+def test_docstringify_deduplicates_copies(py_lang: PythonProcessor):
+    """
+    Checks that copies of a function differing only in comments and formatting
+    are requested once, concurrently across files, and all get the docstring.
+
+    Args:
+        py_lang (PythonProcessor): PythonProcessor instance.
+    """
+    copies = [
+        "def add(a, b):\n    return a + b\n",
+        "def add(a,b):\n    # Sum.\n    return a + \\\n        b\n",
+        "class Math:\n    def add(a, b):\n        return a + b\n",
+    ]
+    client = FakeClient(delay=0.01)
+    with tempfile.TemporaryDirectory() as root:
+        for i, source in enumerate(copies):
+            with open(os.path.join(root, f"copy{i}.py"), "w") as f:
+                f.write(source)
+
+        ds = DocStringWriter(client, py_lang)
+        _, n_insertions = ds.docstringify(root)
+
+    assert n_insertions == 3
+    assert len(client.prompts) == 1
+    assert ds.deduplicated_calls == 2
+
+    ds = DocStringWriter(client, py_lang, deduplicate=False)
+    texts = [copies[0]] * 2
+    asyncio.run(ds.generate_docstrings_async(texts, fingerprints=["x", "x"]))
+    assert len(client.prompts) == 3
+
+
+def test_docstringify_maps_large_files_and_skips_oversize(py_lang: PythonProcessor):
+    """
+    Checks that files above the mmap threshold are processed from their map and
+    that files above the size cap are skipped or fail depending on the policy.
+
+    Args:
+        py_lang (PythonProcessor): PythonProcessor instance.
+    """
+    with tempfile.TemporaryDirectory() as root:
+        small, large = os.path.join(root, "small.py"), os.path.join(root, "large.py")
+        with open(small, "w") as f:
+            f.write("def f():\n    return 1\n")
+        with open(large, "w") as f:
+            f.write(SOURCE_CODE * 20)
+
+        ds = DocStringWriter(
+            FakeClient(), py_lang, mmap_file_bytes=100, max_file_bytes=1000
+        )
+        _, n_insertions = ds.docstringify(root)
+        with open(large) as f:
+            untouched = f.read()
+
+        ds.max_file_bytes = 0
+        _, n_mapped = ds.docstringify(large)
+
+        strict = DocStringWriter(
+            FakeClient(), py_lang, max_file_bytes=100, oversize_policy="error"
+        )
+        with pytest.raises(FileTooLargeError):
+            strict.docstringify(large)
+
+    assert n_insertions == 1
+    assert untouched == SOURCE_CODE * 20
+    assert n_mapped == 60
@@ -0,0 +1,45 @@
+import mmap
+import os
+import tempfile
+
+import pytest
+
+from devtools.file_input import (
+    FileTooLargeError,
+    peak_rss_mb,
+    read_source,
+    reset_peak_rss,
+)
+
+
+def test_read_source_maps_large_files():
+    """
+    Checks that small files are read onto the heap, large files are mapped and
+    files above the cap are refused.
+    """
+    with tempfile.TemporaryDirectory() as root:
+        file_path = os.path.join(root, "module.py")
+        with open(file_path, "wb") as f:
+            f.write(b"x = 1\n" * 100)
+
+        small = read_source(file_path, max_bytes=0, mmap_bytes=1000)
+        large = read_source(file_path, max_bytes=0, mmap_bytes=600)
+        with pytest.raises(FileTooLargeError):
+            read_source(file_path, max_bytes=599, mmap_bytes=0)
+
+        assert isinstance(small, bytes)
+        assert isinstance(large, mmap.mmap)
+        assert large[:] == small
+        large.close()
+
+
+def test_peak_rss_mb():
+    """
+    Checks that the peak RSS is reported, and still covers live memory after a
+    reset.
+    """
+    reset_peak_rss()
+    block = bytearray(32 * 2**20)
+    block[::4096] = b"x" * len(block[::4096])
+
+    assert peak_rss_mb() >= 32
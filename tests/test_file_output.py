@@ -0,0 +1,124 @@
+import io
+import os
+import stat
+import tempfile
+
+import pytest
+
+from devtools.file_output import (
+    WriteBehind,
+    apply_update,
+    unified_diff,
+    write_atomic,
+)
+
+
+def test_write_atomic_preserves_mode():
+    """
+    Checks that atomic writes replace the content, keep the file mode and leave no
+    temporary files behind.
+    """
+    with tempfile.TemporaryDirectory() as root:
+        file_path = os.path.join(root, "script.py")
+        with open(file_path, "w") as f:
+            f.write("old\n")
+        os.chmod(file_path, 0o751)
+
+        write_atomic(file_path, "new\n")
+
+        with open(file_path) as f:
+            content = f.read()
+        mode = stat.S_IMODE(os.stat(file_path).st_mode)
+        files = os.listdir(root)
+
+    assert content == "new\n"
+    assert mode == 0o751
+    assert files == ["script.py"]
+
+
+def test_write_atomic_writes_through_symlinks():
+    """
+    Checks that writing to a symbolic link updates its target and keeps the link.
+    """
+    with tempfile.TemporaryDirectory() as root:
+        os.mkdir(os.path.join(root, "src"))
+        target = os.path.join(root, "src", "real.py")
+        link = os.path.join(root, "link.py")
+        with open(target, "w") as f:
+            f.write("old\n")
+        os.chmod(target, 0o640)
+        os.symlink(target, link)
+
+        write_atomic(link, "new\n")
+
+        is_link = os.path.islink(link)
+        with open(target) as f:
+            content = f.read()
+        mode = stat.S_IMODE(os.stat(target).st_mode)
+        files = sorted(os.listdir(root)), os.listdir(os.path.join(root, "src"))
+
+    assert is_link
+    assert content == "new\n"
+    assert mode == 0o640
+    assert files == (["link.py", "src"], ["real.py"])
+
+
+def test_unified_diff_marks_missing_newline():
+    """
+    Checks that diffs name the file relative to the working directory and mark a
+    missing final newline the way `patch` expects.
+    """
+    diff = unified_diff(
+        os.path.abspath("module.py"),
+        "def f():\n    pass",
+        "def f():\n    '''Doc.'''\n    pass",
+    )
+
+    assert diff.startswith("--- a/module.py\n+++ b/module.py\n")
+    assert "+    '''Doc.'''\n" in diff
+    assert diff.endswith("\n     pass\n\\ No newline at end of file\n")
+
+
+def test_write_behind_streams_diffs_and_reports_errors():
+    """
+    Checks that diff mode leaves files untouched and that a failed update is
+    raised when the writer is closed.
+    """
+    stream = io.StringIO()
+    with tempfile.TemporaryDirectory() as root:
+        file_path = os.path.join(root, "module.py")
+        with open(file_path, "w") as f:
+            f.write("x = 1\n")
+
+        with WriteBehind(diff=stream) as output:
+            output.submit(file_path, None, "x = 2\n")
+        with open(file_path) as f:
+            content = f.read()
+
+        with pytest.raises(FileNotFoundError):
+            with WriteBehind() as output:
+                output.submit(os.path.join(root, "missing", "module.py"), None, "")
+
+    assert content == "x = 1\n"
+    assert "-x = 1\n+x = 2\n" in stream.getvalue()
+    with pytest.raises(RuntimeError):
+        output.submit(file_path, None, "")
+
+
+def test_apply_update_skips_concurrently_edited_files():
+    """
+    Checks that an update is not written over a file that changed after the
+    content it is based on was read.
+    """
+    with tempfile.TemporaryDirectory() as root:
+        file_path = os.path.join(root, "module.py")
+        with open(file_path, "w") as f:
+            f.write("edited\n")
+
+        written = apply_update(file_path, b"original\n", "updated\n")
+
+        with open(file_path) as f:
+            content = f.read()
+
+    assert not written
+    assert content == "edited\n"
@@ -0,0 +1,92 @@
+import os
+import subprocess
+import tempfile
+
+from devtools.incremental import ChangeSet, Manifest, select_changed
+from devtools.lang_processor.python import PythonProcessor
+
+ORIGINAL = """def first():
+    return 1
+
+
+def second():
+    return 2
+
+
+def third():
+    return 3
+"""
+
+
+def git(cwd: str, *args: str) -> None:
+    """
+    Runs a git command in a test repository.
+
+    Args:
+        cwd (str): The repository directory.
+        *args (str): The git arguments.
+    """
+    subprocess.run(
+        ["git", "-c", "user.name=t", "-c", "user.email=t@t", *args],
+        cwd=cwd,
+        check=True,
+        capture_output=True,
+    )
+
+
+def test_git_changes_select_touched_functions(py_lang: PythonProcessor):
+    """
+    Checks that only functions overlapping lines changed since a revision are
+    selected, and that untracked files are considered in full.
+
+    Args:
+        py_lang (PythonProcessor): PythonProcessor instance.
+    """
+    with tempfile.TemporaryDirectory() as repo:
+        module = os.path.join(repo, "module.py")
+        with open(module, "w") as f:
+            f.write(ORIGINAL)
+        git(repo, "init", "-q")
+        git(repo, "add", ".")
+        git(repo, "commit", "-qm", "initial")
+
+        source_code = ORIGINAL.replace("return 2", "return 2 + 0")
+        with open(module, "w") as f:
+            f.write(source_code)
+        with open(os.path.join(repo, "new.py"), "w") as f:
+            f.write("def new():\n    pass\n")
+
+        changes = ChangeSet.from_git("HEAD", cwd=repo)
+        paths = [os.path.relpath(p, repo) for p in changes.paths()]
+
+    root = py_lang.to_ast(source_code)
+    functions = py_lang.extract_function_declarations(root)
+    selected = select_changed(functions, changes.line_ranges(module))
+
+    assert paths == ["module.py", "new.py"]
+    assert [f.name for f in selected] == ["second"]
+    assert changes.line_ranges(os.path.join(repo, "new.py")) is None
+
+
+def test_manifest_detects_changed_files():
+    """
+    Checks that a manifest only reports files whose content changed since it was
+    last updated.
+    """
+    with tempfile.TemporaryDirectory() as root:
+        paths = [os.path.join(root, name) for name in ("a.py", "b.py")]
+        for path in paths:
+            with open(path, "w") as f:
+                f.write(ORIGINAL)
+
+        manifest = Manifest(os.path.join(root, "manifest.json"))
+        first_run = manifest.changes(paths).paths()
+        manifest.update(paths)
+        manifest.save()
+
+        with open(paths[1], "w") as f:
+            f.write(ORIGINAL + "\n")
+        second_run = Manifest(manifest.path).changes(paths).paths()
+
+    assert first_run == paths
+    assert second_run == [paths[1]]
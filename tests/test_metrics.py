@@ -0,0 +1,109 @@
+import asyncio
+import json
+import os
+import pickle
+import tempfile
+
+from click.testing import CliRunner
+
+from benchmarks.fake_openai import FakeOpenAIServer
+from devtools.cli import main
+from devtools.metrics import Histogram, Metrics, collector, timed
+
+SOURCE_CODE = """
+def one():
+    return 1
+
+
+def two():
+    \"\"\"Already documented.\"\"\"
+    return 2
+"""
+
+
+def test_histogram_quantiles():
+    """
+    Checks that quantiles are interpolated within the buckets and bounded by the
+    largest observation.
+    """
+    histogram = Histogram()
+    for value in [0.002] * 98 + [0.02, 0.03]:
+        histogram.observe(value)
+
+    assert 0.001 < histogram.quantile(0.5) <= 0.005
+    assert 0.01 < histogram.quantile(0.99) <= 0.03
+    assert histogram.quantile(1.0) == 0.03
+    assert Histogram().quantile(0.5) == 0.0
+
+
+def test_drain_and_merge_across_processes():
+    """
+    Checks that drained measurements survive pickling and add up when merged.
+    """
+    metrics = Metrics()
+    seen = []
+    metrics.stage_listeners.append(lambda name, seconds: seen.append(name))
+
+    @timed("sleep")
+    async def sleep() -> None:
+        await asyncio.sleep(0.01)
+
+    with metrics.stage("parse"):
+        pass
+    metrics.count("files", 2)
+    drained = pickle.loads(pickle.dumps(metrics.drain()))
+    metrics.merge(drained)
+    metrics.merge(drained)
+
+    collector.reset()
+    asyncio.run(sleep())
+
+    assert seen == ["parse"]
+    assert metrics.stages["parse"].count == 2
+    assert metrics.counters == {"files": 4}
+    assert collector.stages["sleep"].sum >= 0.01
+
+
+def test_cli_exports_metrics(monkeypatch):
+    """
+    Checks that a CLI run records every stage, the token usage and skip counts,
+    and exports them as JSON and as a Prometheus textfile.
+    """
+    collector.reset()
+    with tempfile.TemporaryDirectory() as root, FakeOpenAIServer() as server:
+        monkeypatch.setenv("OPENAI_BASE_URL", server.url)
+        file_path = os.path.join(root, "module.py")
+        with open(file_path, "w") as f:
+            f.write(SOURCE_CODE)
+        json_path = os.path.join(root, "metrics.json")
+        prom_path = os.path.join(root, "metrics.prom")
+        profile_path = os.path.join(root, "run.prof")
+
+        result = CliRunner().invoke(
+            main,
+            [
+                "docstringify",
+                file_path,
+                "--openai-api-key=test",
+                "--no-cache",
+                f"--metrics-json={json_path}",
+                f"--metrics-prom={prom_path}",
+                f"--profile={profile_path}",
+            ],
+        )
+        with open(json_path) as f:
+            summary = json.load(f)
+        with open(prom_path) as f:
+            prom = f.read()
+        profiled = os.path.getsize(profile_path) > 0
+
+    assert result.exit_code == 0, result.output
+    assert {"read", "parse", "query", "llm", "request", "insert", "write"} <= set(
+        summary["stages"]
+    )
+    assert summary["counters"]["docstrings_inserted"] == 1
+    assert summary["counters"]["functions_skipped"] == 1
+    assert summary["counters"]["prompt_tokens"] > 0
+    assert 'devtools_stage_seconds_count{stage="llm"} 1' in prom
+    assert "devtools_docstrings_inserted_total 1" in prom
+    assert profiled
@@ -0,0 +1,104 @@
+import os
+import tempfile
+
+import pytest
+
+from devtools.docstringer import DocStringWriter
+from devtools.lang_processor.python import PythonProcessor
+from devtools.pipeline import DocStringPipeline
+from tests.utils import FakeClient
+
+
+def test_pipeline_processes_every_file(py_lang: PythonProcessor):
+    """
+    Runs the pipeline over a small tree and checks that every python file is
+    docstringified and non-python files are left alone.
+
+    Args:
+        py_lang (PythonProcessor): PythonProcessor instance.
+    """
+    client = FakeClient()
+    with tempfile.TemporaryDirectory() as root:
+        os.mkdir(os.path.join(root, "pkg"))
+        paths = [os.path.join(root, f"mod{i}.py") for i in range(3)]
+        paths.append(os.path.join(root, "pkg", "nested.py"))
+        for path in paths:
+            with open(path, "w") as f:
+                f.write("def f():\n    return 1\n\n\ndef g():\n    return 2\n")
+        with open(os.path.join(root, "notes.txt"), "w") as f:
+            f.write("def f():\n    return 1\n")
+
+        pipeline = DocStringPipeline(DocStringWriter(client, py_lang), jobs=2)
+        n_dirs, n_insertions = pipeline.run(root)
+
+        contents = []
+        for path in paths:
+            with open(path) as f:
+                contents.append(f.read())
+        with open(os.path.join(root, "notes.txt")) as f:
+            notes = f.read()
+
+    assert n_dirs == 2
+    assert n_insertions == 8
+    # Every file holds the same two functions, which are requested only once.
+    assert len(client.prompts) == 2
+    assert all(content.count(client.response) == 2 for content in contents)
+    assert client.response not in notes
+
+
+def test_pipeline_maps_large_files(py_lang: PythonProcessor):
+    """
+    Checks that workers hand memory-mapped files back to the parent process and
+    skip files above the size cap.
+
+    Args:
+        py_lang (PythonProcessor): PythonProcessor instance.
+    """
+    client = FakeClient()
+    with tempfile.TemporaryDirectory() as root:
+        mapped, oversize = os.path.join(root, "a.py"), os.path.join(root, "b.py")
+        with open(mapped, "w") as f:
+            f.write("def f():\n    return 1\n")
+        with open(oversize, "w") as f:
+            f.write("def g():\n    return 2\n" * 10)
+
+        writer = DocStringWriter(client, py_lang, mmap_file_bytes=1, max_file_bytes=100)
+        _, n_insertions = DocStringPipeline(writer, jobs=2).run(root)
+        with open(mapped) as f:
+            content = f.read()
+
+    assert n_insertions == 1
+    assert client.response in content
+
+
+class FailingClient(FakeClient):
+    async def send_prompt_async(self, prompt: str, **kwargs) -> str:
+        """
+        Fails every request.
+
+        Args:
+            prompt (str): The prompt message to be sent.
+
+        Raises:
+            RuntimeError: Always.
+        """
+        raise RuntimeError("backend down")
+
+
+def test_pipeline_fails_instead_of_hanging(py_lang: PythonProcessor):
+    """
+    Checks that an error of a file worker ends the run, even when the tree holds
+    more files than the queue does and the walker is waiting for room.
+
+    Args:
+        py_lang (PythonProcessor): PythonProcessor instance.
+    """
+    with tempfile.TemporaryDirectory() as root:
+        for i in range(40):
+            with open(os.path.join(root, f"mod{i}.py"), "w") as f:
+                f.write(f"def f{i}():\n    return {i}\n")
+
+        writer = DocStringWriter(FailingClient(), py_lang, max_concurrency=1)
+        pipeline = DocStringPipeline(writer, jobs=2)
+        with pytest.raises(RuntimeError, match="backend down"):
+            pipeline.run(root)
@@ -0,0 +1,170 @@
+import asyncio
+import os
+import tempfile
+import time
+
+import pytest
+
+from devtools import scheduler as scheduler_module
+from devtools.docstringer import DocStringWriter
+from devtools.file_input import Source, read_source
+from devtools.lang_processor.python import PythonProcessor
+from devtools.scheduler import Budget, BudgetScheduler
+from tests.utils import FakeClient
+
+LIBRARY = """
+def helper(x):
+    return x + 1
+
+
+def _private():
+    def inner():
+        return 0
+
+    return inner
+"""
+
+USAGE = """
+from library import helper
+
+
+def main():
+    return helper(helper(1))
+
+
+if __name__ == "__main__":
+    main()
+"""
+
+
+def write_tree(root: str) -> None:
+    """
+    Writes a small package whose functions differ in priority.
+
+    Args:
+        root (str): The directory to write to.
+    """
+    for name, source in (("library.py", LIBRARY), ("usage.py", USAGE)):
+        with open(os.path.join(root, name), "w") as f:
+            f.write(source)
+
+
+def test_budget_limits():
+    """
+    Checks that a budget refuses requests beyond its limits.
+    """
+    budget = Budget(max_tokens=100, max_requests=2)
+    budget.start()
+
+    assert budget.fits(100)
+    assert not budget.fits(101)
+    budget.spend(60)
+    assert not budget.fits(50)
+    budget.spend(10)
+    assert budget.exhausted == "requests"
+    assert not budget.fits(1)
+    with pytest.raises(ValueError):
+        Budget(max_seconds=0)
+
+
+def test_scheduler_documents_most_valuable_first(py_lang: PythonProcessor):
+    """
+    Checks that a request budget goes to the public, referenced, top-level
+    functions and that the rest of the run is deferred.
+
+    Args:
+        py_lang (PythonProcessor): PythonProcessor instance.
+    """
+    client = FakeClient()
+    ds = DocStringWriter(client, py_lang, max_concurrency=1)
+    with tempfile.TemporaryDirectory() as root:
+        write_tree(root)
+        scheduler = BudgetScheduler(ds, Budget(max_requests=2))
+        _, n_insertions = asyncio.run(scheduler.run(root))
+        with open(os.path.join(root, "library.py")) as f:
+            library = f.read()
+
+    assert n_insertions == 2
+    assert "def helper" in client.prompts[0]
+    assert "def main" in client.prompts[1]
+    assert client.response not in library.split("def _private")[1]
+    assert scheduler.reason == "requests"
+    assert scheduler.n_deferred == 2
+
+
+def test_scheduler_stops_at_deadline(py_lang: PythonProcessor):
+    """
+    Checks that requests still in flight at the deadline are cancelled and the
+    files are left untouched.
+
+    Args:
+        py_lang (PythonProcessor): PythonProcessor instance.
+    """
+    ds = DocStringWriter(FakeClient(delay=5), py_lang)
+    with tempfile.TemporaryDirectory() as root:
+        write_tree(root)
+        start = time.monotonic()
+        _, n_insertions = ds.docstringify(root, budget=Budget(max_seconds=0.1))
+        elapsed = time.monotonic() - start
+        with open(os.path.join(root, "usage.py")) as f:
+            usage = f.read()
+
+    assert n_insertions == 0
+    assert elapsed < 2
+    assert usage == USAGE
+
+
+@pytest.mark.parametrize("deduplicate", [True, False])
+def test_scheduler_charges_copies_without_dedupe(
+    py_lang: PythonProcessor, deduplicate: bool
+):
+    """
+    Checks that copies of a function are free only when the writer deduplicates
+    them; otherwise each copy is a request charged to the budget.
+
+    Args:
+        py_lang (PythonProcessor): PythonProcessor instance.
+        deduplicate (bool): Whether the writer deduplicates copies.
+    """
+    client = FakeClient()
+    ds = DocStringWriter(client, py_lang, deduplicate=deduplicate)
+    with tempfile.TemporaryDirectory() as root:
+        for i in range(5):
+            with open(os.path.join(root, f"copy{i}.py"), "w") as f:
+                f.write("def f():\n    return 1\n")
+        _, n_insertions = ds.docstringify(root, budget=Budget(max_requests=1))
+
+    assert len(client.prompts) == 1
+    assert n_insertions == (5 if deduplicate else 1)
+
+
+def test_scheduler_reads_again_only_files_with_budget(
+    py_lang: PythonProcessor, monkeypatch: pytest.MonkeyPatch
+):
+    """
+    Checks that no source is kept after ranking: a file is read again to request
+    and insert its docstrings, and not at all if none of its functions got budget.
+
+    Args:
+        py_lang (PythonProcessor): PythonProcessor instance.
+        monkeypatch (pytest.MonkeyPatch): Counts the reads of the scheduler.
+    """
+    reads = []
+
+    def counting_read(file_path: str, **kwargs) -> Source:
+        reads.append(os.path.basename(file_path))
+        return read_source(file_path, **kwargs)
+
+    monkeypatch.setattr(scheduler_module, "read_source", counting_read)
+    client = FakeClient()
+    ds = DocStringWriter(client, py_lang, max_concurrency=1)
+    with tempfile.TemporaryDirectory() as root:
+        write_tree(root)
+        scheduler = BudgetScheduler(ds, Budget(max_requests=1))
+        _, n_insertions = asyncio.run(scheduler.run(root))
+        with open(os.path.join(root, "library.py")) as f:
+            library = f.read()
+
+    assert n_insertions == 1
+    assert client.response in library.split("def _private")[0]
+    assert sorted(reads) == ["library.py", "library.py", "usage.py"]
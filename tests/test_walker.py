@@ -0,0 +1,175 @@
+import os
+import tempfile
+
+import pytest
+
+from devtools.docstringer import DocStringWriter
+from devtools.incremental import ChangeSet
+from devtools.lang_processor.python import PythonProcessor
+from devtools.walker import Walker, compile_pattern, is_ignored
+from tests.utils import FakeClient
+
+
+def _touch(root: str, *paths: str) -> None:
+    """
+    Creates empty files, and their directories, below a root directory.
+
+    Args:
+        root (str): The root directory.
+        *paths (str): Posix paths of the files relative to `root`.
+    """
+    for path in paths:
+        file_path = os.path.join(root, *path.split("/"))
+        os.makedirs(os.path.dirname(file_path), exist_ok=True)
+        with open(file_path, "w") as f:
+            f.write("")
+
+
+def _walk(root: str, **kwargs) -> tuple[list[str], Walker]:
+    """
+    Walks a tree and returns the found files relative to its root.
+
+    Args:
+        root (str): The root directory.
+        **kwargs: Passed to `Walker`.
+
+    Returns:
+        tuple[list[str], Walker]: The sorted posix paths and the finished walker.
+    """
+    walker = Walker(root, **kwargs)
+    files = sorted(os.path.relpath(p, root).replace(os.sep, "/") for p in walker)
+    return files, walker
+
+
+@pytest.mark.parametrize(
+    "pattern,path,is_dir,expected",
+    [
+        ("*.pyc", "pkg/module.pyc", False, True),
+        ("/build", "build", True, True),
+        ("/build", "pkg/build", True, False),
+        ("build/", "pkg/build", True, True),
+        ("build/", "pkg/build", False, False),
+        ("docs/*.py", "docs/conf.py", False, True),
+        ("docs/*.py", "docs/api/conf.py", False, False),
+        ("**/gen/*.py", "a/b/gen/x.py", False, True),
+        ("vendor/**", "vendor/lib/x.py", False, True),
+        ("a/**/z.py", "a/z.py", False, True),
+        ("test_[!a]*.py", "test_b.py", False, True),
+        ("test_[!a]*.py", "test_a.py", False, False),
+        ("# comment", "# comment", False, False),
+    ],
+)
+def test_compile_pattern(pattern: str, path: str, is_dir: bool, expected: bool):
+    """
+    Checks the `.gitignore` semantics of anchoring, directory-only patterns,
+    wildcards, `**` and character classes.
+    """
+    rule = compile_pattern(pattern)
+    rules = [rule] if rule is not None else []
+    assert is_ignored(rules, path, is_dir) == expected
+
+
+def test_walker_prunes_ignored_directories():
+    """
+    Checks that ignore files, negations, nested ignore files, tool directories and
+    virtualenvs are honored and that only entered directories are counted.
+    """
+    with tempfile.TemporaryDirectory() as root:
+        _touch(
+            root,
+            ".gitignore",
+            "main.py",
+            "generated.py",
+            "keep_generated.py",
+            ".git/hooks/hook.py",
+            "node_modules/pkg/index.py",
+            "env/pyvenv.cfg",
+            "env/lib/site.py",
+            "build/lib/main.py",
+            "pkg/.devtoolsignore",
+            "pkg/module.py",
+            "pkg/fixtures/data.py",
+            "pkg/notes.txt",
+        )
+        with open(os.path.join(root, ".gitignore"), "w") as f:
+            f.write("# outputs\n/build/\n*generated.py\n!keep_generated.py\n")
+        with open(os.path.join(root, "pkg", ".devtoolsignore"), "w") as f:
+            f.write("fixtures/\n")
+
+        files, walker = _walk(root, accept=lambda p: p.endswith(".py"))
+
+    assert files == ["keep_generated.py", "main.py", "pkg/module.py"]
+    # The root and pkg; the virtualenv is recognized only once entered.
+    assert walker.n_dirs == 2
+    assert walker.n_pruned == 5
+
+
+def test_walker_include_exclude_globs():
+    """
+    Checks that include globs select files and exclude globs prune directories,
+    both relative to the walked root.
+    """
+    with tempfile.TemporaryDirectory() as root:
+        _touch(root, "src/a.py", "src/b.pyi", "tests/test_a.py", "setup.py")
+
+        included, _ = _walk(root, include=["src/**"])
+        excluded, walker = _walk(root, exclude=["tests/", "*.pyi"])
+        unignored, _ = _walk(root, include=["*.py"], ignore_files=())
+
+    assert included == ["src/a.py", "src/b.pyi"]
+    assert excluded == ["setup.py", "src/a.py"]
+    assert walker.n_pruned == 1
+    assert unignored == ["setup.py", "src/a.py", "tests/test_a.py"]
+
+
+def test_walker_honors_ancestor_ignore_files():
+    """
+    Checks that walking a subdirectory of a repository applies the ignore files of
+    its ancestors, relative to the repository top.
+    """
+    with tempfile.TemporaryDirectory() as root:
+        os.mkdir(os.path.join(root, ".git"))
+        _touch(root, "src/pkg/a.py", "src/pkg/_version.py", "src/other/b.py")
+        with open(os.path.join(root, ".gitignore"), "w") as f:
+            f.write("src/pkg/_version.py\nother/\n")
+
+        files, _ = _walk(os.path.join(root, "src"))
+
+    assert files == ["pkg/a.py"]
+
+
+def test_change_sets_select_the_walked_files():
+    """
+    Checks that an incremental run over every file of a tree picks the same files
+    as a full walk: ignored, excluded and virtualenv directories included.
+    """
+    with tempfile.TemporaryDirectory() as root:
+        os.mkdir(os.path.join(root, ".git"))
+        paths = [
+            ".gitignore",
+            "main.py",
+            "generated.py",
+            ".venv/lib/site.py",
+            "env/pyvenv.cfg",
+            "env/lib/site.py",
+            "build/lib/main.py",
+            "vendor/lib.py",
+            "pkg/.devtoolsignore",
+            "pkg/module.py",
+            "pkg/fixtures/data.py",
+            "pkg/fixtures/keep.py",
+        ]
+        _touch(root, *paths)
+        with open(os.path.join(root, ".gitignore"), "w") as f:
+            f.write("build/\n*generated.py\n")
+        with open(os.path.join(root, "pkg", ".devtoolsignore"), "w") as f:
+            f.write("fixtures/*\n!fixtures/keep.py\n")
+
+        ds = DocStringWriter(FakeClient(), PythonProcessor(), exclude=["vendor/"])
+        walked = sorted(ds.iter_files(root, [0]))
+        changes = ChangeSet({os.path.join(root, p): None for p in paths})
+        changed = sorted(ds.iter_files(root, [0], changes=changes))
+        files = [os.path.relpath(p, root).replace(os.sep, "/") for p in walked]
+
+    assert files == ["main.py", "pkg/fixtures/keep.py", "pkg/module.py"]
+    assert changed == walked
@@ -1,9 +1,12 @@
+import asyncio
 import os
 import tempfile
 from contextlib import contextmanager
 
 from rich import print
 
+from devtools.llm.client_interface import IClient
+
 
 @contextmanager
 def mktemp(suffix: str):
@@ -29,3 +32,54 @@ def mktemp(suffix: str):
         print(f"file: {file_path}")
     finally:
         os.remove(file_path)
+
+
+class FakeClient(IClient):
+    def __init__(
+        self, *, response: str = '"""Generated docstring."""', delay: float = 0
+    ):
+        """
+        An in-memory client that echoes a fixed docstring, optionally after a delay.
+
+        Args:
+            response (str, optional): The docstring returned for every prompt.
+            delay (float, optional): Seconds each async request takes.
+        """
+        self.response = response
+        self.delay = delay
+        self.prompts: list[str] = []
+        self.options: list[dict] = []
+        self.in_flight = 0
+        self.max_in_flight = 0
+
+    def send_prompt(self, prompt: str, **kwargs) -> str:
+        """
+        Records the prompt and returns the fixed response.
+
+        Args:
+            prompt (str): The prompt message to be sent.
+
+        Returns:
+            str: The fixed response.
+        """
+        self.prompts.append(prompt)
+        self.options.append(kwargs)
+        return self.response
+
+    async def send_prompt_async(self, prompt: str, **kwargs) -> str:
+        """
+        Records the prompt and peak concurrency, then returns the fixed response.
+
+        Args:
+            prompt (str): The prompt message to be sent.
+
+        Returns:
+            str: The fixed response.
+        """
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        try:
+            await asyncio.sleep(self.delay)
+            return self.send_prompt(prompt, **kwargs)
+        finally:
+            self.in_flight -= 1